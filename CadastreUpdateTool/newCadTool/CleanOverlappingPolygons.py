@@ -51,9 +51,10 @@ arcpy.MakeFeatureLayer_management(
 arcpy.AddSpatialIndex_management("lyr_input_data")
 
 log("\t Cleaning overlapping polygons")
+progress = ramm.ProgressLogger(logger, "Cleaning overlapping polygons")
 with arcpy.da.SearchCursor("lyr_input_data", ["OBJECTID", "FEAT_SEQ", "SL_LAND_PR", "Total_BillCount", "LU_LGL_STS"]) as search_cursor:
     for row in search_cursor:
-        log("\t {}".format(row[0]))
+        progress.update(row[0])
         # Get the OBJECTID of row and use it to select row
         arcpy.SelectLayerByAttribute_management("lyr_input_data", "NEW_SELECTION",
                                                 "\"OBJECTID\" = " + str(row[0]))
@@ -93,6 +94,7 @@ with arcpy.da.SearchCursor("lyr_input_data", ["OBJECTID", "FEAT_SEQ", "SL_LAND_P
         arcpy.TruncateTable_management("lyr_parent")
         arcpy.TruncateTable_management("lyr_children")
 del search_cursor
+progress.finish()
 
 # Count the number of features in the overlapping polygons feature class and report
 overlapping_polygons_num = int(arcpy.GetCount_management(
@@ -0,0 +1,84 @@
+""" -----------------------------------------------------------------------------
+Tool Name:          Compare Deliveries
+Version:            1.0
+Description:        This tool will compare any two deliveries of the cadastral
+                    dataset kept in a snapshot store by Get Cadastre Changes,
+                    without reading either delivery in full, and will:
+                    1. List the LIS keys that were added, removed or modified
+                        between the two deliveries
+                    2. Extract the added and modified parcels as they were
+                        in the second delivery
+Author:             Bhekani Khumalo
+Date:               2026-10-18
+Last Revision:      2026-10-18
+------------------------------------------------------------------------------ """
+
+import arcpy
+import os
+import ramm
+
+# cleaned up on failure, whichever of them was created
+profiler = None
+try:
+    # get inputs
+    snapshot_store = arcpy.GetParameterAsText(0)
+    first_delivery = arcpy.GetParameterAsText(1)
+    second_delivery = arcpy.GetParameterAsText(2)
+    output_location = arcpy.GetParameterAsText(3)
+
+    arcpy.env.overwriteOutput = True
+
+    # initialize logger
+    logger = ramm.defineLogger(output_location)
+
+    # time every step and the geoprocessing calls made in it
+    profiler = ramm.RunProfiler("Compare Deliveries", output_location, logger)
+    profiler.wrapGeoprocessing()
+
+    # simplify messege generator
+    def log(message):
+        ramm.showPyMessage(message, logger)
+
+    log("\t Step 1 - Comparing the deliveries")
+    profiler.begin("Step 1 - Comparing the deliveries")
+
+    # only the parcels stored between the two deliveries are read
+    store = ramm.SnapshotStore(snapshot_store)
+    added, removed, modified = store.diff(first_delivery, second_delivery)
+    store.close()
+    log("\t ...{} added, {} removed and {} modified LIS keys".format(
+        len(added), len(removed), len(modified)))
+
+    # create the geodatabase for the outputs and reports
+    log("\t ...Creating the results geodatabase")
+    arcpy.CreateFileGDB_management(output_location, "results.gdb")
+    results = os.path.join(output_location, "results.gdb")
+
+    # write the LIS keys and how they changed to a table
+    arcpy.CreateTable_management(results, "Delivery_Changes")
+    changes_table = os.path.join(results, "Delivery_Changes")
+    arcpy.AddField_management(changes_table, "SL_LAND_PR", "TEXT", field_length=50)
+    arcpy.AddField_management(changes_table, "CHANGE", "TEXT", field_length=10)
+    with arcpy.da.InsertCursor(changes_table, ["SL_LAND_PR", "CHANGE"]) as cursor:
+        for change, keys in (("ADDED", added), ("REMOVED", removed), ("MODIFIED", modified)):
+            for key in keys:
+                cursor.insertRow(["{}".format(key), change])
+    del cursor
+
+    log("\t Step 2 - Extracting the added and modified parcels")
+    profiler.begin("Step 2 - Extracting the added and modified parcels")
+
+    # read the changed parcels back as they were in the second delivery
+    changed_num = ramm.materializeSnapshot(snapshot_store, second_delivery,
+                                           os.path.join(results, "Changed_Parcels"), added + modified)
+    if changed_num == 0:
+        arcpy.Delete_management(os.path.join(results, "Changed_Parcels"))
+
+    log("\t Process completed successfully! \n \n{} parcels were added and {} modified, see Changed_Parcels. "
+        "{} parcels were removed, see Delivery_Changes.".format(len(added), len(modified), len(removed)))
+
+    profiler.finish()
+except:
+    ramm.handleExcept(logger)
+    if profiler is not None:
+        profiler.finish("failed")
@@ -39,9 +39,10 @@ arcpy.MakeFeatureLayer_management(
     "Extract_Overlapping_Polygons_Results.gdb/row", "lyr_row")
 
 log("\t Extracting overlapping polygons")
+progress = ramm.ProgressLogger(logger, "Extracting overlapping polygons")
 with arcpy.da.SearchCursor("lyr_input_data", ["OBJECTID"]) as search_cursor:
     for row in search_cursor:
-        log("\t {}".format(row[0]))
+        progress.update(row[0])
         # Get the OBJECTID of row and use it to select row
         arcpy.SelectLayerByAttribute_management("lyr_input_data", "NEW_SELECTION",
                                                 "\"OBJECTID\" = " + str(row[0]))
@@ -74,6 +75,7 @@ with arcpy.da.SearchCursor("lyr_input_data", ["OBJECTID"]) as search_cursor:
             "lyr_input_data", "CLEAR_SELECTION")
         arcpy.TruncateTable_management("lyr_row")
 del search_cursor
+progress.finish()
 
 # Count the number of features in the overlapping polygons feature class and report
 overlapping_polygons_num = int(arcpy.GetCount_management(
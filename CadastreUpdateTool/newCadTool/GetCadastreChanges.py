@@ -21,6 +21,8 @@ import arcpy
 import time
 import ramm
 
+# cleaned up on failure, whichever of them was created
+profiler = scratch = pool = None
 try:
     # get inputs
     existing_dataset = arcpy.GetParameterAsText(0)
@@ -36,6 +38,12 @@ try:
     city_name = arcpy.GetParameterAsText(10)
     provcode = arcpy.GetParameterAsText(11)
     country = arcpy.GetParameterAsText(12)
+    # optional number of worker processes, RAMM_PROCESSES when not given
+    processes = arcpy.GetParameterAsText(13) if arcpy.GetArgumentCount() > 13 else ""
+    # optional steps to run again when resuming, eg "Step 2"
+    rerun_steps = arcpy.GetParameterAsText(14) if arcpy.GetArgumentCount() > 14 else ""
+    # optional snapshot store every update dataset is added to, see Compare Deliveries
+    snapshot_store = arcpy.GetParameterAsText(15) if arcpy.GetArgumentCount() > 15 else ""
 
     arcpy.env.overwriteOutput = True
 
@@ -44,278 +52,191 @@ try:
     # initialize logger
     logger = ramm.defineLogger(output_location)
 
+    # time every step and the geoprocessing calls made in it
+    profiler = ramm.RunProfiler("Get Cadastre Changes", output_location, logger)
+    profiler.wrapGeoprocessing()
+
+    # intermediate datasets are kept in memory while they fit and deleted at the end
+    scratch = ramm.ScratchWorkspace(output_location, logger=logger)
+
+    # the fingerprinting and classification are split into spatial tiles that
+    # are processed in parallel when more than one process is used
+    pool = ramm.WorkerPool(int(processes) if processes else None)
+
+    # every step is recorded as it completes, so a failed run started again
+    # with the same inputs carries on after the last completed step
+    checkpoints = ramm.Checkpoints(
+        "Get Cadastre Changes", output_location,
+        [existing_dataset, update_dataset, current_master_cad, roads_dataset, cad_schema_template, fieldMap,
+         spatial_lmun, spatial_dmun, spatial_prov, city_name, provcode, country], scratch, rerun_steps, logger)
+
     # simplify messege generator
     def log(message):
         ramm.showPyMessage(message, logger)
 
     # set the workspace
     log("\t Step 1 - Finding changes")
+    profiler.begin("Step 1 - Finding changes")
     log("\t ...Setting the workspace and generating intemediary datasets")
 
     arcpy.env.workspace = output_location
 
-    # create temporary geodatabase for temporary geoprocessing tasks
-    log("\t ...Creating the results geodatabase")
-    arcpy.CreateFileGDB_management(output_location, "results.gdb")
-
-    # make feature layer from the existing dataset
-    arcpy.MakeFeatureLayer_management(existing_dataset, "existing_dataset")
-    arcpy.MakeFeatureLayer_management(update_dataset, "update_dataset")
-
-    # add the datasets to the geodatabase
-    log("\t ...Adding the existing and update datasets into the geodatabase")
-    arcpy.FeatureClassToGeodatabase_conversion(["existing_dataset", "update_dataset"],
-                                               "results.gdb")
-
-    # make feature layer from the existing dataset
-    arcpy.MakeFeatureLayer_management(
-        "results.gdb/existing_dataset", "lyr_existing_gp")
-    arcpy.MakeFeatureLayer_management(
-        "results.gdb/update_dataset", "lyr_update_gp")
-    arcpy.AddSpatialIndex_management("lyr_update_gp")
-    arcpy.AddIndex_management(
-        "lyr_update_gp", "SL_LAND_PR", "UlkIndex", "UNIQUE")
-    arcpy.AddSpatialIndex_management("lyr_existing_gp")
-    arcpy.AddIndex_management(
-        "lyr_existing_gp", "SL_LAND_PR", "ElkIndex", "UNIQUE")
-
-    # create an empty feature class in the temporary geodatabase
-    arcpy.CreateFeatureclass_management("results.gdb", "changes_formated", "POLYGON", cad_schema_template,
-                                        "DISABLED", "DISABLED", arcpy.Describe(cad_schema_template).spatialReference)
-
-    # join existing_data's data into update_data's data using the CITYSG26CODE field
-    log("\t ...Joining the existing and update datasets based on the LIS Key")
-    arcpy.JoinField_management("lyr_update_gp", "SL_LAND_PR", "lyr_existing_gp",
-                               "SL_LAND_PR", ["SL_LAND_PR"])
-
-    # select from the feature layer the features where the SG26Code is null
-    log("\t ...Selecting the records from the joined layer where the existing LIS Key is null")
-    arcpy.SelectLayerByAttribute_management(
-        "lyr_update_gp", "NEW_SELECTION", "\"SL_LAND_PR_1\" IS NULL")
-
-    # save selection to new feature class
-    log("\t ...Saving the selection to a new feature class called changes")
-    arcpy.CopyFeatures_management(
-        "lyr_update_gp", "results.gdb/changes_unformated")
-
-    # make layer from the changes_unformated feature class
-    arcpy.MakeFeatureLayer_management(
-        "results.gdb/changes_unformated", "lyr_changes_unformated")
-    arcpy.MakeFeatureLayer_management(
-        "results.gdb/changes_formated", "lyr_changes_formated")
-    arcpy.AddSpatialIndex_management("lyr_changes_unformated")
-    arcpy.AddSpatialIndex_management("lyr_changes_formated")
-
-    # count the number of records in changes_unformated
-    no_of_records = int(arcpy.GetCount_management(
-        "lyr_changes_unformated").getOutput(0))
+    if checkpoints.done("Step 1 - Finding changes"):
+        no_of_records = checkpoints.values()["no_of_records"]
+    else:
+        # create the geodatabase for the outputs and reports
+        log("\t ...Creating the results geodatabase")
+        arcpy.CreateFileGDB_management(output_location, "results.gdb")
+
+        # stream the update dataset once and compare it to the fingerprints of the
+        # existing dataset, copying the features with new LIS keys to changes_unformated
+        log("\t ...Comparing the update dataset to the fingerprints of the existing dataset")
+        added, removed, modified = ramm.extractCadastreChanges(
+            existing_dataset, update_dataset, scratch.path("changes_unformated"), pool=pool)
+        if modified is None:
+            # only the LIS keys were read as there are no new ones
+            log("\t ...No new LIS keys, {} removed".format(len(removed)))
+        else:
+            log("\t ...{} new, {} removed and {} modified LIS keys".format(
+                len(added), len(removed), len(modified)))
+        logger.debug("Removed and modified LIS keys", extra={"data": {"removed": removed, "modified": modified}})
+
+        # keep the parcels of the update that changed since the last delivery
+        # in the snapshot store, so any two deliveries can be compared later
+        if snapshot_store:
+            log("\t ...Adding the update dataset to the snapshot store")
+            if ramm.ingestDelivery(snapshot_store, update_dataset) is None:
+                log("\t ...The snapshot store already has this delivery")
+
+        # create an empty intermediate feature class with the cadastre schema
+        scratch.createFeatureclass("changes_formated", cad_schema_template)
+
+        # make layer from the changes_unformated feature class
+        scratch.layer("changes_unformated", "lyr_changes_unformated")
+        scratch.layer("changes_formated", "lyr_changes_formated")
+        scratch.addSpatialIndex("changes_unformated")
+        scratch.addSpatialIndex("changes_formated")
+
+        # count the number of records in changes_unformated
+        no_of_records = int(arcpy.GetCount_management(
+            "lyr_changes_unformated").getOutput(0))
+        checkpoints.complete({"no_of_records": no_of_records})
 
     # only continue is the number of records in changes is greater than 0
     if no_of_records == 0:
+        scratch.cleanup()
+        checkpoints.finish()
         arcpy.ClearWorkspaceCache_management()
         arcpy.Delete_management("results.gdb")
         log("\t Process completed. No changes were found")
     else:
         log("\t Step 1 completed successfully. {} changes found.".format(no_of_records))
         log("\t Step 2 - Processing Changes.")
-
-        identicalLIS = False
-        identicalGeom = False
-
-        # check the geometry of the changes_unformated feature class
-        log("\t ...Checking and repairing the geometry")
-        arcpy.CheckGeometry_management(
-            "lyr_changes_unformated", "results.gdb/geomErrorReport")
-
-        # get the number of records in the geometry errors report and if there are no features then delete the report
-        no_of_geom_errors = int(arcpy.GetCount_management(
-            "results.gdb/geomErrorReport").getOutput(0))
-        if no_of_geom_errors == 0:
-            # delete the empty report
-            arcpy.Delete_management("results.gdb/geomErrorReport")
-        else:
-            # repair geometry errors on the changes_unformated feature class
-            arcpy.RepairGeometry_management("lyr_changes_unformated")
-
-        # find any records that have the same LISKEY, SG26CODE and geometry
-        log("\t ...Identifying and removing duplicates")
-        arcpy.FindIdentical_management("lyr_changes_unformated", "results.gdb/identicalGeomLISSG26Report",
-                                       ["SHAPE", "SL_LAND_PR", "SG26_CODE"], "", "0", "ONLY_DUPLICATES")
-
-        # get the number of records in the identical features report and if there are no features then delete the report
-        no_of_identical_records_geomLISSG26 = int(arcpy.GetCount_management(
-            "results.gdb/identicalGeomLISSG26Report").getOutput(0))
-        if no_of_identical_records_geomLISSG26 == 0:
-            # delete empty report
-            arcpy.Delete_management("results.gdb/identicalGeomLISSG26Report")
-        else:
-            # delete the duplicates
-            arcpy.DeleteIdentical_management("lyr_changes_unformated", [
-                "SHAPE", "SL_LAND_PR", "SG26_CODE"], "", "0")
-
-        # find any records that have the same LISKEY and geometry
-        arcpy.FindIdentical_management("lyr_changes_unformated", "results.gdb/identicalGeomLISReport",
-                                       ["SHAPE", "SL_LAND_PR"], "", "0", "ONLY_DUPLICATES")
-
-        # get the number of records in the identical features report and if there are no features then delete the report
-        no_of_identical_records_geomLIS = int(arcpy.GetCount_management(
-            "results.gdb/identicalGeomLISReport").getOutput(0))
-        if no_of_identical_records_geomLIS == 0:
-            # delete empty report
-            arcpy.Delete_management("results.gdb/identicalGeomLISReport")
+        profiler.begin("Step 2 - Processing Changes")
+        scratch.fit()
+
+        if not checkpoints.done("Step 2 - Checking and repairing the geometry", ["results.gdb/geomErrorReport"]):
+            # check the geometry of the changes_unformated feature class
+            log("\t ...Checking and repairing the geometry")
+            # the report is only kept when there are errors
+            geom_errors = ramm.checkGeometry(
+                "lyr_changes_unformated", "results.gdb/geomErrorReport")
+            if geom_errors:
+                # repair only the features of changes_unformated with geometry errors
+                ramm.repairGeometry("lyr_changes_unformated", geom_errors)
+            checkpoints.complete(changed=["changes_unformated"])
+
+        if checkpoints.done("Step 2 - Removing duplicates", [
+                "results.gdb/identicalGeomLISSG26Report", "results.gdb/identicalGeomLISReport",
+                "results.gdb/identicalLISReport", "results.gdb/identicalGeomReport"]):
+            no_of_identical_records_LIS = checkpoints.values()["no_of_identical_records_LIS"]
+            no_of_identical_records_geom = checkpoints.values()["no_of_identical_records_geom"]
         else:
-            # delete the duplicates
-            arcpy.DeleteIdentical_management("lyr_changes_unformated", [
-                "SHAPE", "SL_LAND_PR"], "", "0")
-
-        # find any records that have the same LISKEY
-        arcpy.FindIdentical_management("lyr_changes_unformated", "results.gdb/identicalLISReport",
-                                       ["SL_LAND_PR"], "", "0", "ONLY_DUPLICATES")
-
-        # get the number of records in the identical features report and if there are no features then delete the report
-        no_of_identical_records_LIS = int(arcpy.GetCount_management(
-            "results.gdb/identicalLISReport").getOutput(0))
-        if no_of_identical_records_LIS == 0:
-            # delete empty report
-            arcpy.Delete_management("results.gdb/identicalLISReport")
-        else:
-            identicalLIS = True
-
-        arcpy.FindIdentical_management("lyr_changes_unformated", "results.gdb/identicalGeomReport",
-                                       ["SHAPE"], "", "0", "ONLY_DUPLICATES")
+            # find the records that have the same LISKEY, SG26CODE and geometry, then the same LISKEY and geometry,
+            # then the same LISKEY and then the same geometry from a single read of the changes
+            log("\t ...Identifying and removing duplicates")
+            duplicates = ramm.analyzeDuplicates("lyr_changes_unformated", [
+                ("identicalGeomLISSG26Report", ["SHAPE", "SL_LAND_PR", "SG26_CODE"], "DELETE"),
+                ("identicalGeomLISReport", ["SHAPE", "SL_LAND_PR"], "DELETE"),
+                ("identicalLISReport", ["SL_LAND_PR"], "REPORT"),
+                ("identicalGeomReport", ["SHAPE"], "REPORT")], pool=pool)
+
+            # only write the reports that have features
+            for duplicate in duplicates:
+                if duplicate["count"] > 0:
+                    ramm.writeDuplicateReport(duplicate["groups"], "results.gdb/{}".format(duplicate["name"]))
 
-        # get the number of records in the identical features report and if there are no features then delete the report
-        no_of_identical_records_geom = int(arcpy.GetCount_management(
-            "results.gdb/identicalGeomReport").getOutput(0))
-        if no_of_identical_records_geom == 0:
-            # delete empty report
-            arcpy.Delete_management("results.gdb/identicalGeomReport")
+            # delete the duplicates
+            ramm.deleteRows("lyr_changes_unformated", set.union(*[d["removed"] for d in duplicates]))
+
+            no_of_identical_records_LIS = duplicates[2]["count"]
+            no_of_identical_records_geom = duplicates[3]["count"]
+            checkpoints.complete({"no_of_identical_records_LIS": no_of_identical_records_LIS,
+                                  "no_of_identical_records_geom": no_of_identical_records_geom},
+                                 ["changes_unformated"])
+        identicalLIS = no_of_identical_records_LIS > 0
+        identicalGeom = no_of_identical_records_geom > 0
+
+        if not checkpoints.done("Step 2 - Formatting the changes"):
+            # build field mappings and append the data into lyr_changes_formated
+            log(
+                "\t ...Creating field mappings and formating table")
+            ramm.mapFields("lyr_changes_unformated",
+                           "lyr_changes_formated", fieldMap)
+            arcpy.AddSpatialIndex_management("lyr_changes_formated")
+
+            # count the number of records in changes_formated
+            no_of_records_formated = int(arcpy.GetCount_management(
+                "lyr_changes_formated").getOutput(0))
+
+            # polulate fields using spatial joins
+            log("\t ...Populating the Local Municipality, District "
+                "Municipality, Admin District Code and Province fields based on a spatial join.")
+
+            ramm.populateUsingSpatialJoin(
+                "lyr_changes_formated", spatial_lmun, "LOCALMUN", "FULLNAME", "INTERSECT")
+            ramm.populateFieldsUsingSpatialJoin(
+                "lyr_changes_formated", spatial_dmun, ["DISTRICTMU", "ADMINDISCO"], ["FULLNAME", "DISTRICTCO"], "INTERSECT")
+            ramm.populateUsingSpatialJoin(
+                "lyr_changes_formated", spatial_prov, "PROVINCE", "PROVNAME", "INTERSECT")
+
+            # capitalise the Street Suffix data and populate the Area, Perimeter, Centroid X, Centroid Y,
+            # DESC_, decoded SG26 code and constant fields in a single pass a chunk at a time
+            log("\t ...Calculating the Street Suffix, Area, Perimeter, Centroid X, Centroid Y, DESC_, TOWNSHIPCO, "
+                "COUNTRY, PROVINCECO, EXTENTCO, ERFNO, PORTIONNO, REMAINDER and CITYNAME fields")
+            malformed_sg26_num = ramm.deriveCadastreFields(
+                "lyr_changes_formated", country, provcode, city_name)
+            if malformed_sg26_num > 0:
+                log("\t ...{} features have a malformed CITYSG26CO code".format(
+                    malformed_sg26_num))
+            checkpoints.complete(changed=["changes_formated"])
+
+        classified = {"ROADRESERVE": "results.gdb/changes_rr", "SLIVER": "results.gdb/changes_xrr_area3",
+                      "OVERLAP": "results.gdb/changes_overlap", "LEGITIMATE": "results.gdb/changes_legitimate"}
+        if checkpoints.done("Step 2 - Classifying the changes", list(classified.values())):
+            counts = checkpoints.values()
         else:
-            identicalGeom = True
-
-        # build field mappings and append the data into lyr_changes_formated
-        log(
-            "\t ...Creating field mappings and formating table")
-        ramm.mapFields("lyr_changes_unformated",
-                       "lyr_changes_formated", fieldMap)
-        arcpy.AddSpatialIndex_management("lyr_changes_formated")
-
-        # count the number of records in changes_formated
-        no_of_records_formated = int(arcpy.GetCount_management(
-            "lyr_changes_formated").getOutput(0))
-
-        # capitalise the Street Suffix data
-        arcpy.CalculateField_management(
-            "lyr_changes_formated", "STREETSUFF", "!STREETSUFF!.upper()", "PYTHON_9.3")
-
-        # polulate fields using spatial joins
-        log("\t ...Populating the Local Municipality, District "
-            "Municipality, Admin District Code and Province fields based on a spatial join.")
-
-        ramm.populateUsingSpatialJoin(
-            "lyr_changes_formated", spatial_lmun, "LOCALMUN", "FULLNAME", "INTERSECT")
-        ramm.populateUsingSpatialJoin(
-            "lyr_changes_formated", spatial_dmun, "DISTRICTMU", "FULLNAME", "INTERSECT")
-        ramm.populateUsingSpatialJoin(
-            "lyr_changes_formated", spatial_dmun, "ADMINDISCO", "DISTRICTCO", "INTERSECT")
-        ramm.populateUsingSpatialJoin(
-            "lyr_changes_formated", spatial_prov, "PROVINCE", "PROVNAME", "INTERSECT")
-
-        # generate calculated fields, ie Area, Perimeter, Cent_x and Cent_y
-        log(
-            "\t ...Calculating the Area, Perimeter, Centroid X and Centroid Y fields")
-        arcpy.CalculateField_management(
-            "lyr_changes_formated", 'AREA', "!SHAPE.AREA@SQUAREMETERS!", "PYTHON_9.3")
-        arcpy.CalculateField_management(
-            "lyr_changes_formated", 'PERIMETER', "!SHAPE.LENGTH@METERS!", "PYTHON_9.3")
-        arcpy.CalculateField_management(
-            "lyr_changes_formated", 'CENT_X', "!SHAPE.CENTROID.X!", "PYTHON_9.3")
-        arcpy.CalculateField_management(
-            "lyr_changes_formated", 'CENT_Y', "!SHAPE.CENTROID.Y!", "PYTHON_9.3")
-
-        # fields for the update cursor
-        log("\t ...Populating the DESC_, TOWNSHIPCO, COUNTRY, PROVINCECO, EXTENTCO, ERFNO, "
-            "PORTIONNO, REMAINDER and CITYNAME fields")
-        fields = ['DESC_', 'TOWNSHIPCO', 'EXTENTCO', 'ERFNO',
-                  'PORTIONNO', 'REMAINDER', 'CITYSG26CO',
-                  'STREETNO', 'STREETNAME', 'STREETSUFF',
-                  'SUBURBNAME', 'CENT_X', 'CENT_Y',
-                  'COUNTRY', 'PROVINCECO', 'CITYNAME']
-
-        # main code
-        with arcpy.da.UpdateCursor("lyr_changes_formated", fields) as update_cursor:
-            for x in update_cursor:
-                # description
-                x[0] = x[7] + ', ' + x[8] + ', ' + x[9] + ', ' + x[10]
-
-                # decoding the SG26 Code
-                [x[1], x[2], x[3], x[4], x[5]] = ramm.decodeCitySG26Code(x[6])
-
-                x[13] = country
-                x[14] = provcode
-                x[15] = city_name
-
-                update_cursor.updateRow(x)
-        del update_cursor
-
-        # select all the polygons that intersect with roads and save them into a new feature class called changes_rr
-        log(
-            "\t ...Selecting all the polygons that intersection with roads and saving them into a new feature class called changes_rr")
-        arcpy.MakeFeatureLayer_management(roads_dataset, "lyr_roads_dataset")
-        arcpy.AddSpatialIndex_management("lyr_roads_dataset")
-        arcpy.SelectLayerByLocation_management(
-            "lyr_changes_formated", "INTERSECT", "lyr_roads_dataset", selection_type="NEW_SELECTION")
-        arcpy.CopyFeatures_management(
-            "lyr_changes_formated", "results.gdb/changes_rr")
-        arcpy.AddSpatialIndex_management("results.gdb/changes_rr")
-        no_of_records_changes_rr = int(arcpy.GetCount_management(
-            "results.gdb/changes_rr").getOutput(0))
-        arcpy.Delete_management("lyr_changes_formated")
-
-        # select from the feature layer the features where the Area < 3 and save this to a new feature class called changes_xrr_area3
-        log(
-            "\t ...Selecting the records from the joined layer where the Area < 3")
-        arcpy.AddIndex_management("lyr_changes_formated", "AREA", "aIndex")
-        arcpy.SelectLayerByAttribute_management(
-            "lyr_changes_formated", "NEW_SELECTION", "\"AREA\" < 3")
-        log(
-            "\t ...Saving the selection to a new feature class called changes_xrr_area3")
-        arcpy.CopyFeatures_management(
-            "lyr_changes_formated", "results.gdb/changes_xrr_area3")
-        arcpy.AddSpatialIndex_management("results.gdb/changes_xrr_area3")
-        no_of_records_changes_xrr_area3 = int(arcpy.GetCount_management(
-            "results.gdb/changes_xrr_area3").getOutput(0))
-        arcpy.Delete_management("lyr_changes_formated")
-
-        # get polygons that intersect the current master and save them into a new feature class called changes_overlap
-        arcpy.MakeFeatureLayer_management(
-            current_master_cad, "lyr_current_master_cad")
-        arcpy.AddSpatialIndex_management("lyr_current_master_cad")
-        arcpy.SelectLayerByLocation_management(
-            "lyr_changes_formated", "INTERSECT", "lyr_current_master_cad", selection_type="NEW_SELECTION")
-        arcpy.CopyFeatures_management(
-            "lyr_changes_formated", "results.gdb/changes_overlap")
-        arcpy.MakeFeatureLayer_management(
-            "results.gdb/changes_overlap", "lyr_changes_overlap")
-        arcpy.AddSpatialIndex_management("lyr_changes_overlap")
-        no_of_records_changes_overlap = int(arcpy.GetCount_management(
-            "lyr_changes_overlap").getOutput(0))
-        arcpy.Delete_management("lyr_changes_formated")
-
-        no_of_records_changes_xrr_xarea3_xoverlap = int(arcpy.GetCount_management(
-            "lyr_changes_formated").getOutput(0))
+            # sort the changes into road reserves, slivers, overlaps with the current
+            # master and legitimate changes in one pass, every feature goes to the
+            # output of its first flag and keeps all of its flags in CHANGE_FLAGS
+            log(
+                "\t ...Classifying the changes that intersect with roads, have an Area < 3 or overlap the current master cadastre")
+            counts = ramm.classifyCadastreChanges(
+                scratch.path("changes_formated"), roads_dataset, current_master_cad, classified, pool=pool)
+            checkpoints.complete(counts, list(classified.values()))
+        no_of_records_changes_rr = counts["ROADRESERVE"]
+        no_of_records_changes_xrr_area3 = counts["SLIVER"]
+        no_of_records_changes_overlap = counts["OVERLAP"]
+        no_of_records_changes_xrr_xarea3_xoverlap = counts["LEGITIMATE"]
 
         log(
             "\t Step 2 completed successfully.")
         log("\t Step 3 - Preparing Outputs.")
+        profiler.begin("Step 3 - Preparing Outputs")
 
         # delete intermetiate files and prepare output files and give them meaningful names
         log("\t ...Deleting intermediary files")
-        arcpy.Delete_management("results.gdb/changes_unformated")
-        arcpy.Delete_management("results.gdb/changes_xrr")
-        arcpy.Delete_management("results.gdb/changes_xrr_xarea3")
-        arcpy.Delete_management("results.gdb/existing_dataset")
-        arcpy.Delete_management("results.gdb/update_dataset")
+        scratch.cleanup()
 
         log("\t Step 3 completed successfully.")
 
@@ -345,11 +266,11 @@ try:
                                     "Changes_overlap_{}".format(time.strftime("%Y%m%d", time.gmtime())))
 
         if no_of_records_changes_xrr_xarea3_xoverlap == 0:
-            arcpy.Delete_management("results.gdb/changes_formated")
+            arcpy.Delete_management("results.gdb/changes_legitimate")
         else:
             log("-- {} features are most likely legitimate changes, proceed with the rest of the checks on these before appending them to the master cadastre".format(
                 no_of_records_changes_xrr_xarea3_xoverlap))
-            arcpy.Rename_management("results.gdb/changes_formated",
+            arcpy.Rename_management("results.gdb/changes_legitimate",
                                     "Changes_{}".format(time.strftime("%Y%m%d", time.gmtime())))
 
         log("\n \n The following reports were generated: ")
@@ -360,5 +281,15 @@ try:
             log("-- {} features were found with identical Geometry. Run the Find Identicals tool to regenerate this report for each of the output datasets and use the OBJECTID to create a relationship between the report and the dataset to locate the identicals and rectify them.".format(no_of_identical_records_geom))
 
         arcpy.ClearWorkspaceCache_management()
+        checkpoints.finish()
+
+    pool.close()
+    profiler.finish()
 except:
     ramm.handleExcept(logger)
+    if pool is not None:
+        pool.close()
+    if scratch is not None:
+        scratch.cleanup()
+    if profiler is not None:
+        profiler.finish("failed")
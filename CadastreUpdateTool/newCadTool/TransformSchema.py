@@ -12,6 +12,8 @@ import arcpy
 import time
 import ramm
 
+# cleaned up on failure, whichever of them was created
+profiler = scratch = None
 try:
     # get inputs
     input_dataset = arcpy.GetParameterAsText(0)
@@ -32,32 +34,39 @@ try:
     # initialize logger
     logger = ramm.defineLogger(output_location)
 
+    # time every step and the geoprocessing calls made in it
+    profiler = ramm.RunProfiler("Transform Cadastral Dataset Schema", output_location, logger)
+    profiler.wrapGeoprocessing()
+
+    # intermediate datasets are kept in memory while they fit and deleted at the end
+    scratch = ramm.ScratchWorkspace(output_location, logger=logger)
+
     # simplify messege generator
     def log(message):
         ramm.showPyMessage(message, logger)
 
     # set the workspace
     log("\t Step 1 - Preparing Environment")
+    profiler.begin("Step 1 - Preparing Environment")
     log("\t ...Setting the workspace and generating intemediary datasets")
 
     arcpy.env.workspace = output_location
 
-    # create temporary geodatabase for temporary geoprocessing tasks
+    # create the geodatabase for the output and reports
     log("\t ...Creating the results geodatabase")
     arcpy.CreateFileGDB_management(output_location, "results.gdb")
 
     # make feature layer from the dataset
     arcpy.MakeFeatureLayer_management(input_dataset, "input_dataset")
 
-    # add the dataset to the geodatabase
-    log("\t ...Adding the existing dataset into the geodatabase")
-    arcpy.FeatureClassToGeodatabase_conversion(
-        ["input_dataset"], "results.gdb")
+    # copy the dataset into the scratch workspace
+    log("\t ...Adding the existing dataset into the scratch workspace")
+    arcpy.CopyFeatures_management(
+        "input_dataset", scratch.path("input_dataset"))
 
     # make feature layer from the existing dataset
-    arcpy.MakeFeatureLayer_management(
-        "results.gdb/input_dataset", "lyr_input_dataset_gp")
-    arcpy.AddSpatialIndex_management("lyr_input_dataset_gp")
+    scratch.layer("input_dataset", "lyr_input_dataset_gp")
+    scratch.addSpatialIndex("input_dataset")
 
     # create an empty feature class in the temporary geodatabase
     arcpy.CreateFeatureclass_management("results.gdb", "formatted_input", "POLYGON", cad_schema_template,
@@ -69,81 +78,47 @@ try:
     arcpy.AddSpatialIndex_management("lyr_formatted_input")
 
     log("\t Step 2 - Reformatting Dataset")
+    profiler.begin("Step 2 - Reformatting Dataset")
 
     # build field mappings and append the data into lyr_formatted_input
     log("\t ...Creating field mappings and formating table")
     ramm.mapFields("lyr_input_dataset_gp", "lyr_formatted_input", fieldMap)
     arcpy.AddSpatialIndex_management("lyr_formatted_input")
+    scratch.delete("input_dataset")
 
     # check the geometry of the formatted_input feature class
     log("\t ...Checking and repairing the geometry")
-    arcpy.CheckGeometry_management(
+    # the report is only kept when there are errors
+    geom_errors = ramm.checkGeometry(
         "lyr_formatted_input", "results.gdb/geomErrorReport")
-
-    # get the number of records in the geometry errors report and if there are no features then delete the report
-    no_of_geom_errors = int(arcpy.GetCount_management(
-        "results.gdb/geomErrorReport").getOutput(0))
-    if no_of_geom_errors == 0:
-        # delete the empty report
-        arcpy.Delete_management("results.gdb/geomErrorReport")
-    else:
-        # repair geometry errors on the changes_unformated feature class
-        arcpy.RepairGeometry_management("lyr_formatted_input")
+    if geom_errors:
+        # repair only the features of formatted_input with geometry errors
+        ramm.repairGeometry("lyr_formatted_input", geom_errors)
 
     # count the number of records in formatted_input
     no_of_records_formated = int(arcpy.GetCount_management(
         "lyr_formatted_input").getOutput(0))
 
-    # capitalise the Street Suffix data
-    arcpy.CalculateField_management(
-        "lyr_formatted_input", "STREETSUFF", "!STREETSUFF!.upper()", "PYTHON_9.3")
-
     # populate fields
     log("\t ...Populating the Local Municipality, District "
         "Municipality, Admin District Code and Province fields based on a spatial join.")
 
     ramm.populateUsingSpatialJoin(
         "lyr_formatted_input", spatial_lmun, "LOCALMUN", "FULLNAME", "INTERSECT")
-    ramm.populateUsingSpatialJoin(
-        "lyr_formatted_input", spatial_dmun, "DISTRICTMU", "FULLNAME", "INTERSECT")
-    ramm.populateUsingSpatialJoin(
-        "lyr_formatted_input", spatial_dmun, "ADMINDISCO", "DISTRICTCO", "INTERSECT")
+    ramm.populateFieldsUsingSpatialJoin(
+        "lyr_formatted_input", spatial_dmun, ["DISTRICTMU", "ADMINDISCO"], ["FULLNAME", "DISTRICTCO"], "INTERSECT")
     ramm.populateUsingSpatialJoin(
         "lyr_formatted_input", spatial_prov, "PROVINCE", "PROVNAME", "INTERSECT")
 
-    # generate calculated fields, ie Area, Perimeter, Cent_x and Cent_y
-    log(
-        "\t ...Calculating the Area, Perimeter, Centroid X and Centroid Y fields")
-    arcpy.CalculateField_management(
-        "lyr_formatted_input", 'AREA', "!SHAPE.AREA@SQUAREMETERS!", "PYTHON_9.3")
-    arcpy.CalculateField_management(
-        "lyr_formatted_input", 'PERIMETER', "!SHAPE.LENGTH@METERS!", "PYTHON_9.3")
-    arcpy.CalculateField_management(
-        "lyr_formatted_input", 'CENT_X', "!SHAPE.CENTROID.X!", "PYTHON_9.3")
-    arcpy.CalculateField_management(
-        "lyr_formatted_input", 'CENT_Y', "!SHAPE.CENTROID.Y!", "PYTHON_9.3")
-
-    # fields for the update cursor
-    log("\t ...Populating the DESC_, TOWNSHIPCO, COUNTRY, PROVINCECO, EXTENTCO, ERFNO, "
-        "PORTIONNO, REMAINDER and CITYNAME fields")
-    fields = ['DESC_', 'TOWNSHIPCO', 'EXTENTCO', 'ERFNO', 'PORTIONNO', 'REMAINDER', 'CITYSG26CO', 'STREETNO',
-              'STREETNAME', 'STREETSUFF', 'SUBURBNAME', 'CENT_X', 'CENT_Y', 'COUNTRY', 'PROVINCECO', 'CITYNAME']
-
-    # main code
-    with arcpy.da.UpdateCursor("lyr_formatted_input", fields) as update_cursor:
-        for x in update_cursor:
-            # description
-            x[0] = x[7] + ', ' + x[8] + ', ' + x[9] + ', ' + x[10]
-
-            # decoding the SG26 Code
-            [x[1], x[2], x[3], x[4], x[5]] = ramm.decodeCitySG26Code(x[6])
-
-            x[13] = country
-            x[14] = provcode
-            x[15] = city_name
-
-            update_cursor.updateRow(x)
-    del update_cursor
+    # capitalise the Street Suffix data and populate the Area, Perimeter, Centroid X, Centroid Y,
+    # DESC_, decoded SG26 code and constant fields in a single pass a chunk at a time
+    log("\t ...Calculating the Street Suffix, Area, Perimeter, Centroid X, Centroid Y, DESC_, TOWNSHIPCO, "
+        "COUNTRY, PROVINCECO, EXTENTCO, ERFNO, PORTIONNO, REMAINDER and CITYNAME fields")
+    malformed_sg26_num = ramm.deriveCadastreFields(
+        "lyr_formatted_input", country, provcode, city_name)
+    if malformed_sg26_num > 0:
+        log("\t ...{} features have a malformed CITYSG26CO code".format(
+            malformed_sg26_num))
 
     log(
         "\t Step 2 completed successfully.")
@@ -151,5 +126,12 @@ try:
     log("\t Process completed successfully!")
 
     arcpy.ClearWorkspaceCache_management()
+
+    scratch.cleanup()
+    profiler.finish()
 except:
     ramm.handleExcept(logger)
+    if scratch is not None:
+        scratch.cleanup()
+    if profiler is not None:
+        profiler.finish("failed")
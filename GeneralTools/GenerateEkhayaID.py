@@ -21,16 +21,9 @@ try:
 
     log("\t Starting Process")
 
-    fields = ['CENT_X', 'CENT_Y', 'RECNO', 'EKHAYAID']
-
     for data in input_data.split(';'):
         log("Generating EkhayaIDs for {}".format(data))
-        with arcpy.da.UpdateCursor(data, fields) as update_cursor:
-            for x in update_cursor:
-                x[3] = ramm.populateEkhayaID(x[0], x[1], x[2])
-
-                update_cursor.updateRow(x)
-        del update_cursor
+        ramm.populateEkhayaIDs(data)
 
     log("New EkhayaIDs Generated Successfully!")
 except:
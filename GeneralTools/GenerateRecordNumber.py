@@ -25,15 +25,18 @@ try:
 
     log("Starting Process")
 
-    arcpy.MakeFeatureLayer_management(input_data, "input_data")
-
-    with arcpy.da.UpdateCursor("input_data", 'RECNO') as update_cursor:
-        for x in update_cursor:
-            # generate record number
-            x[0] = ramm.populateRecNo(recno_prefix, startNumber)
-
-            update_cursor.updateRow(x)
-    del update_cursor
+    # record numbers come from the shared sequence store so datasets can be
+    # numbered by several runs at once without colliding
+    allocator = ramm.SequenceAllocator()
+
+    for data in input_data.split(';'):
+        first, last = ramm.numberDataset(data, 'RECNO', recno_prefix, startNumber,
+                                         lambda number: ramm.populateRecNo(recno_prefix, number), allocator)
+        if first != int(startNumber):
+            log("The record numbers from {} are already used, {} starts from {}".format(
+                ramm.populateRecNo(recno_prefix, int(startNumber)), data, ramm.populateRecNo(recno_prefix, first)))
+        log("Numbered {} from {} to {}".format(data, ramm.populateRecNo(recno_prefix, first),
+                                              ramm.populateRecNo(recno_prefix, last)))
 
     log("Record Numbers Generated Successfully!")
 except:
@@ -0,0 +1,329 @@
+"""-----------------------------------------------------------------------------
+     Script Name:      Run Benchmarks
+     Description:      Runs the ramm helper and toolbox script benchmarks on the
+                       synthetic cadastre at 10k, 100k and 1M parcels and
+                       reports throughput and peak memory against a stored
+                       baseline. Every benchmark runs in its own worker process
+                       so the peak memory is its own. The toolbox scripts are
+                       only benchmarked where arcpy is installed.
+
+     Usage:            python RunBenchmarks.py --scale 10k --scale 100k
+                       python RunBenchmarks.py --scale 10k --save-baseline
+-----------------------------------------------------------------------------"""
+
+import os
+import sys
+import json
+import time
+import runpy
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+BENCHMARK_FOLDER = os.path.dirname(os.path.abspath(__file__))
+REPO_FOLDER = os.path.dirname(BENCHMARK_FOLDER)
+sys.path.insert(0, REPO_FOLDER)
+
+import synthetic
+import rammcore
+import ramm
+
+
+def benchEkhayaIDs(path, workspace):
+    backend = synthetic.loadTables(path, ["cadastre"])
+    return len(backend.tables["cadastre"]["rows"]), lambda: rammcore.populateEkhayaIDs("cadastre", backend=backend)
+
+
+def benchCadastreFields(path, workspace):
+    backend = synthetic.loadTables(path, ["cadastre"])
+    return len(backend.tables["cadastre"]["rows"]), lambda: rammcore.populateCadastreFields(
+        "cadastre", "ZA", "WC", "Cape Town", backend=backend)
+
+
+def benchDerivedFields(path, workspace):
+    backend = synthetic.loadTables(path, ["cadastre"])
+    return len(backend.tables["cadastre"]["rows"]), lambda: rammcore.deriveCadastreFields(
+        "cadastre", "ZA", "WC", "Cape Town", backend=backend)
+
+
+def benchSpatialJoin(path, workspace):
+    backend = synthetic.loadTables(path, ["cadastre", "district_municipalities"])
+    return len(backend.tables["cadastre"]["rows"]), lambda: rammcore.populateFieldsUsingSpatialJoin(
+        "cadastre", "district_municipalities", ["DISTRICTMU", "ADMINDISCO"], ["FULLNAME", "DISTRICTCO"],
+        "INTERSECT", backend)
+
+
+def benchFieldMap(path, workspace):
+    backend = synthetic.loadTables(path, ["parcels"])
+    plan = rammcore.compileFieldMapPlan([list(row) for row in synthetic.FIELD_MAP],
+                                        [[f, t, 255] for f, t in synthetic.PARCEL_FIELDS],
+                                        [[f, t, 255] for f, t in synthetic.CADASTRE_FIELDS])
+    source_fields, destination_fields, transform = rammcore.fieldMapTransform(plan)
+
+    def run():
+        for row in backend.iterRows("parcels", source_fields):
+            transform(row[1:])
+
+    return len(backend.tables["parcels"]["rows"]), run
+
+
+def benchSTRtree(path, workspace):
+    backend = synthetic.loadTables(path, ["parcels"])
+    extents = [rammcore.ringsExtent(row["SHAPE"]) for row in backend.tables["parcels"]["rows"].values()]
+
+    def run():
+        index = rammcore.STRtree([(extent, i) for i, extent in enumerate(extents)])
+        for extent in extents:
+            index.query(extent)
+
+    return len(extents), run
+
+
+def benchPackedRTree(path, workspace):
+    backend = synthetic.loadTables(path, ["parcels"])
+    extents = [rammcore.ringsExtent(row["SHAPE"]) for row in backend.tables["parcels"]["rows"].values()]
+    index_path = os.path.join(workspace, "parcels.npy")
+
+    def run():
+        rammcore.saveSpatialIndex(index_path, rammcore.PackedRTree.build(extents, range(len(extents))))
+        rammcore.loadSpatialIndex(index_path).queryMany(extents)
+
+    return len(extents), run
+
+
+def benchGeoPackageUpdate(path, workspace):
+    copy = os.path.join(workspace, "update.gpkg")
+    shutil.copyfile(path, copy)
+    backend = rammcore.GeoPackageBackend(copy)
+    rows = backend.connection.execute('SELECT COUNT(*) FROM "cadastre"').fetchone()[0]
+    return rows, lambda: rammcore.populateEkhayaIDs("cadastre", backend=backend)
+
+
+def benchSequenceAllocator(path, workspace):
+    rows = synthetic.loadTables(path, ["cadastre"]).tables["cadastre"]["rows"]
+    allocator = rammcore.SequenceAllocator(os.path.join(workspace, "sequences.sqlite"))
+
+    def run():
+        # one block per 1000 rows, the way numberDataset asks for a dataset at a time
+        for block in range(0, len(rows), 1000):
+            allocator.allocate("PRC", min(1000, len(rows) - block), 1, "block {}".format(block))
+
+    return len(rows), run
+
+
+HELPER_BENCHMARKS = [("ekhaya_ids", benchEkhayaIDs),
+                     ("cadastre_fields", benchCadastreFields),
+                     ("derived_fields", benchDerivedFields),
+                     ("spatial_join", benchSpatialJoin),
+                     ("field_map", benchFieldMap),
+                     ("strtree", benchSTRtree),
+                     ("packed_rtree", benchPackedRTree),
+                     ("geopackage_update", benchGeoPackageUpdate),
+                     ("sequence_allocator", benchSequenceAllocator)]
+
+NEW_CAD_TOOL = os.path.join(REPO_FOLDER, "CadastreUpdateTool", "newCadTool")
+SERVICE_POINTS = os.path.join(REPO_FOLDER, "sw_service_points")
+GENERAL_TOOLS = os.path.join(REPO_FOLDER, "GeneralTools")
+
+# script, the table whose rows are counted and the script parameters, given
+# the imported datasets by name and an empty output folder
+TOOL_BENCHMARKS = [
+    ("GetCadastreChanges", os.path.join(NEW_CAD_TOOL, "GetCadastreChanges.py"), "parcels_update",
+     lambda d, out: [d["parcels"], d["parcels_update"], d["cadastre"], out, d["roads"], d["cad_schema"],
+                     d["field_map"], d["local_municipalities"], d["district_municipalities"], d["provinces"],
+                     "Cape Town", "WC", "ZA"]),
+    ("TransformSchema", os.path.join(NEW_CAD_TOOL, "TransformSchema.py"), "parcels_update",
+     lambda d, out: [d["parcels_update"], out, d["cad_schema"], d["field_map"], d["local_municipalities"],
+                     d["district_municipalities"], d["provinces"], "Cape Town", "WC", "ZA"]),
+    ("ServiceLayerCleanup", os.path.join(NEW_CAD_TOOL, "ServiceLayerCleanup.py"), "parcels",
+     lambda d, out: [d["parcels"], d["billing"], d["roads"], out]),
+    ("ExtractOverlappingPolygons", os.path.join(NEW_CAD_TOOL, "ExtractOverlappingPolygons.py"), "parcels",
+     lambda d, out: [d["parcels"], out]),
+    ("CleanOverlappingPolygons", os.path.join(NEW_CAD_TOOL, "CleanOverlappingPolygons.py"), "overlapping",
+     lambda d, out: [d["overlapping"], out]),
+    ("CleanOverlaps", os.path.join(NEW_CAD_TOOL, "CleanOverlaps.py"), "overlapping",
+     lambda d, out: [d["overlapping"], out]),
+    ("SW_CreateBuffersFromTable", os.path.join(SERVICE_POINTS, "SW_CreateBuffersFromTable.py"),
+     "collection_points",
+     lambda d, out: [d["collection_points"], "X", "Y", "10", d["provinces"], out, "buffers"]),
+    ("SW_createCPBuffersFromFC", os.path.join(SERVICE_POINTS, "SW_createCPBuffersFromFC.py"), "collection_points",
+     lambda d, out: [d["collection_points"], d["provinces"], "10", out, "buffers"]),
+    ("GenerateCPID", os.path.join(SERVICE_POINTS, "GenerateCPID.py"), "collection_points",
+     lambda d, out: [d["collection_points"], "1", "", out]),
+    ("GenerateRecordNumber", os.path.join(GENERAL_TOOLS, "GenerateRecordNumber.py"), "cadastre",
+     lambda d, out: [d["cadastre"], "PRC", "1", out]),
+    ("GenerateEkhayaID", os.path.join(GENERAL_TOOLS, "GenerateEkhayaID.py"), "cadastre",
+     lambda d, out: [d["cadastre"], out]),
+]
+
+
+def importGeoPackage(path, workspace):
+    # copy every synthetic table into a file geodatabase the scripts can edit
+    import arcpy
+    arcpy.env.overwriteOutput = True
+    arcpy.CreateFileGDB_management(workspace, "synthetic.gdb")
+    gdb = os.path.join(workspace, "synthetic.gdb")
+    datasets = {}
+    for name, fields, geometry_type, rows in synthetic.SyntheticCadastre(0).tables():
+        source = os.path.join(path, "main." + name)
+        if geometry_type is None:
+            arcpy.TableToTable_conversion(source, gdb, name)
+        else:
+            arcpy.FeatureClassToFeatureClass_conversion(source, gdb, name)
+        datasets[name] = os.path.join(gdb, name)
+    return datasets
+
+
+def toolBenchmark(script, count_table, parameters):
+    def setup(path, workspace):
+        datasets = importGeoPackage(path, workspace)
+        output = os.path.join(workspace, "output")
+        os.makedirs(output)
+        import arcpy
+        rows = int(arcpy.GetCount_management(datasets[count_table]).getOutput(0))
+
+        def run():
+            argv, path_copy = sys.argv, list(sys.path)
+            sys.argv = [script] + parameters(datasets, output)
+            # the scripts import the copy of ramm next to them
+            sys.path.insert(0, os.path.dirname(script))
+            sys.modules.pop("ramm", None)
+            sys.modules.pop("rammcore", None)
+            try:
+                runpy.run_path(script, run_name="__main__")
+            finally:
+                sys.argv, sys.path[:] = argv, path_copy
+
+        return rows, run
+
+    return setup
+
+
+def benchmarks():
+    # every benchmark by name, the toolbox scripts only when arcpy is installed
+    found = list(HELPER_BENCHMARKS)
+    if rammcore.arcpyAvailable():
+        found.extend((name, toolBenchmark(script, table, parameters))
+                     for name, script, table, parameters in TOOL_BENCHMARKS)
+    return found
+
+
+def runWorker(name, path, result_file):
+    # runs one benchmark in this process and writes its measurements
+    setup = dict(benchmarks())[name]
+    workspace = tempfile.mkdtemp(prefix="ramm_benchmark_")
+    try:
+        rows, run = setup(path, workspace)
+        setup_memory = ramm.peakMemory()
+        started = time.time()
+        cpu_started = ramm._cpuTime()
+        run()
+        seconds = time.time() - started
+        result = {"benchmark": name, "rows": rows, "seconds": round(seconds, 3),
+                  "cpu_seconds": round(ramm._cpuTime() - cpu_started, 3),
+                  "rows_per_second": round(rows / max(seconds, 1e-6), 1),
+                  "setup_memory": setup_memory, "peak_memory": ramm.peakMemory()}
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+    with open(result_file, "w") as f:
+        json.dump(result, f)
+
+
+def runBenchmark(name, path, scale):
+    handle, result_file = tempfile.mkstemp(suffix=".json")
+    os.close(handle)
+    try:
+        status = subprocess.call([sys.executable, os.path.abspath(__file__), "--worker", name,
+                                  "--gpkg", path, "--result", result_file])
+        if status != 0:
+            return {"benchmark": name, "scale": scale, "error": "worker exited with {}".format(status)}
+        with open(result_file) as f:
+            result = json.load(f)
+    finally:
+        os.remove(result_file)
+    result["scale"] = scale
+    return result
+
+
+def compare(result, baseline, tolerance):
+    # slowdown against the baseline, flagged when over the tolerance
+    previous = baseline.get("{}@{}".format(result["benchmark"], result["scale"]))
+    if not previous or "error" in result:
+        return None, False
+    ratio = result["seconds"] / max(previous["seconds"], 1e-6)
+    return ratio, ratio > tolerance and result["seconds"] - previous["seconds"] > 0.5
+
+
+def megabytes(value):
+    return "-" if value is None else "{:.0f}".format(value / 1048576.0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks the ramm helpers and toolbox scripts")
+    parser.add_argument("--scale", action="append", help="10k, 100k, 1m or a parcel count, repeatable")
+    parser.add_argument("--only", action="append", help="run only these benchmarks, repeatable")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data", default=os.path.join(rammcore.CACHE_FOLDER, "benchmarks"),
+                        help="folder for the synthetic GeoPackages, the results and the baseline")
+    parser.add_argument("--baseline", help="baseline file, <data>/baseline.json by default")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=1.25,
+                        help="how many times slower than the baseline counts as a regression")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--gpkg", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        runWorker(args.worker, args.gpkg, args.result)
+        return 0
+
+    baseline_file = args.baseline or os.path.join(args.data, "baseline.json")
+    baseline = {}
+    if os.path.isfile(baseline_file):
+        with open(baseline_file) as f:
+            baseline = json.load(f)
+    if not rammcore.arcpyAvailable():
+        print("arcpy is not available, only the ramm helpers are benchmarked")
+
+    results = []
+    regressions = 0
+    print("{:<28} {:>7} {:>9} {:>9} {:>12} {:>8} {:>9}".format(
+        "benchmark", "scale", "rows", "seconds", "rows/s", "peak MB", "baseline"))
+    for scale in args.scale or ["10k"]:
+        started = time.time()
+        path = synthetic.syntheticGeoPackage(args.data, scale, args.seed)
+        print("synthetic {} cadastre ready in {:.1f}s".format(scale, time.time() - started))
+        for name, setup in benchmarks():
+            if args.only and name not in args.only:
+                continue
+            result = runBenchmark(name, path, scale)
+            results.append(result)
+            if "error" in result:
+                print("{:<28} {:>7} {}".format(name, scale, result["error"]))
+                continue
+            ratio, regressed = compare(result, baseline, args.tolerance)
+            regressions += regressed
+            print("{:<28} {:>7} {:>9} {:>9.2f} {:>12.0f} {:>8} {:>9}".format(
+                name, scale, result["rows"], result["seconds"], result["rows_per_second"],
+                megabytes(result["peak_memory"]),
+                "-" if ratio is None else "{:.2f}x{}".format(ratio, " !" if regressed else "")))
+
+    stamp = time.strftime("%Y-%m-%dT%H:%M:%S")
+    with open(os.path.join(args.data, "results.jsonl"), "a") as history:
+        for result in results:
+            history.write(json.dumps(dict(result, time=stamp), sort_keys=True) + "\n")
+    if args.save_baseline:
+        for result in results:
+            if "error" not in result:
+                baseline["{}@{}".format(result["benchmark"], result["scale"])] = result
+        rammcore.writeCacheFile(baseline_file, json.dumps(baseline, indent=2, sort_keys=True))
+        print("baseline saved to {}".format(baseline_file))
+    if regressions:
+        print("{} benchmarks are more than {}x slower than the baseline".format(regressions, args.tolerance))
+    return 1 if regressions or any("error" in result for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,490 @@
+"""-----------------------------------------------------------------------------
+     Module Name:      synthetic
+     Description:      Seeded synthetic cadastre for the benchmarks. Builds
+                       parcels with the SL_LAND_PR, SG26_CODE, ZONING,
+                       VSTD_DESC and LU_LGL_STS fields, an update of them,
+                       road reserves, municipal boundaries, billing records and
+                       collection points, with duplicates, slivers, overlaps
+                       and malformed SG26 codes injected at known rates. Every
+                       row is a function of the seed and its index so tables
+                       are streamed and a 1M parcel cadastre never has to be
+                       held in memory.
+-----------------------------------------------------------------------------"""
+
+import os
+import sys
+import math
+import random
+import sqlite3
+import itertools
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rammcore
+
+# bump when the generated data changes so cached GeoPackages are rebuilt
+VERSION = 1
+
+SCALES = {"10k": 10000, "100k": 100000, "1m": 1000000}
+
+PARCEL_FIELDS = [("SL_LAND_PR", "Integer"), ("SG26_CODE", "String"), ("STREET_NO", "String"),
+                 ("STREET_NAM", "String"), ("STREET_SUF", "String"), ("SUBURB", "String"),
+                 ("ZONING", "String"), ("VSTD_DESC", "String"), ("LU_LGL_STS", "String")]
+
+CADASTRE_FIELDS = [("SL_LAND_PR", "Integer"), ("CITYSG26CO", "String"), ("STREETNO", "String"),
+                   ("STREETNAME", "String"), ("STREETSUFF", "String"), ("SUBURBNAME", "String"),
+                   ("DESC_", "String"), ("TOWNSHIPCO", "String"), ("EXTENTCO", "String"),
+                   ("ERFNO", "String"), ("PORTIONNO", "String"), ("REMAINDER", "String"),
+                   ("COUNTRY", "String"), ("PROVINCECO", "String"), ("CITYNAME", "String"),
+                   ("LOCALMUN", "String"), ("DISTRICTMU", "String"), ("ADMINDISCO", "String"),
+                   ("PROVINCE", "String"), ("ZONING", "String"), ("VSTD_DESC", "String"),
+                   ("LU_LGL_STS", "String"), ("AREA", "Double"), ("PERIMETER", "Double"),
+                   ("CENT_X", "Double"), ("CENT_Y", "Double"), ("RECNO", "String"), ("EKHAYAID", "String")]
+
+FIELD_MAP = [("SL_LAND_PR", "SL_LAND_PR"), ("SG26_CODE", "CITYSG26CO"), ("STREET_NO", "STREETNO"),
+             ("STREET_NAM", "STREETNAME"), ("STREET_SUF", "STREETSUFF"), ("SUBURB", "SUBURBNAME"),
+             ("ZONING", "ZONING"), ("VSTD_DESC", "VSTD_DESC"), ("LU_LGL_STS", "LU_LGL_STS")]
+
+ZONING = [("Single Residential Zone 1", 50), ("General Residential Zone 2", 12), ("Community Zone 1", 5),
+          ("General Business Zone 1", 8), ("Mixed Use Zone 2", 6), ("Transport Zone 2", 4),
+          ("Open Space Zone 2", 5), ("", 10)]
+LAND_USE = [("Residential", 70), ("Business", 12), ("Public Open Space", 6), ("Waterway", 2),
+            ("Railway", 2), ("Substation", 1), ("Unset", 7)]
+LEGAL_STATUS = [("Registered", 75), ("Confirmed", 10), ("SG Approved", 10), ("Proposed", 5)]
+STREET_NAMES = ["Main", "Church", "Victoria", "Voortrekker", "Long", "Station", "Kloof", "Buitengracht",
+                "Albert", "Klipfontein", "Jan Smuts", "Milner", "Protea", "Disa", "Fynbos", "Oak"]
+STREET_SUFFIXES = ["rd", "st", "ave", "cres", "way", "RD", "ST", "AVE"]
+SUBURBS = ["Woodstock", "Observatory", "Rondebosch", "Claremont", "Bellville", "Parow", "Goodwood",
+           "Athlone", "Khayelitsha", "Mitchells Plain"]
+
+# parcel and road sizes in metres, a block is BLOCK x BLOCK parcels
+PARCEL_WIDTH = 20.0
+PARCEL_DEPTH = 30.0
+ROAD_WIDTH = 10.0
+BLOCK = 10
+ORIGIN = (-60000.0, -3760000.0)
+
+
+def _weighted(rng, choices):
+    total = sum(w for v, w in choices)
+    pick = rng.uniform(0, total)
+    for value, weight in choices:
+        pick -= weight
+        if pick <= 0:
+            return value
+    return choices[-1][0]
+
+
+def _rectangle(x0, y0, x1, y1, rng=None):
+    # clockwise ring, optionally with extra collinear vertices on the edges
+    corners = [(x0, y0), (x0, y1), (x1, y1), (x1, y0)]
+    ring = []
+    for k in range(4):
+        a, b = corners[k], corners[(k + 1) % 4]
+        ring.append(a)
+        if rng is not None:
+            for f in sorted(rng.random() for t in range(rng.randint(0, 3))):
+                ring.append((a[0] + (b[0] - a[0]) * f, a[1] + (b[1] - a[1]) * f))
+    ring.append((x0, y0))
+    return [ring]
+
+
+class SyntheticCadastre(object):
+    """
+    Deterministic synthetic cadastre
+
+    Args:
+        count (int): number of parcels before injected anomalies
+        seed (int): seed of every random choice
+        duplicate_rate (float): share of parcels copied with identical geometry,
+            half of them keeping the LIS key and SG26 code
+        sliver_rate (float): share of parcels with a sliver under 3 square metres
+        overlap_rate (float): share of parcels with a shifted overlapping copy
+        malformed_rate (float): share of parcels with a null or short SG26 code
+        change_rate (float): share of parcels removed, subdivided, rezoned or
+            reshaped in the update dataset
+    """
+
+    def __init__(self, count, seed=0, duplicate_rate=0.01, sliver_rate=0.005, overlap_rate=0.01,
+                 malformed_rate=0.001, change_rate=0.02):
+        self.count = int(count)
+        self.seed = int(seed)
+        self.duplicate_rate = duplicate_rate
+        self.sliver_rate = sliver_rate
+        self.overlap_rate = overlap_rate
+        self.malformed_rate = malformed_rate
+        self.change_rate = change_rate
+        self.columns = max(1, int(math.ceil(math.sqrt(self.count))))
+        self.rows = int(math.ceil(self.count / float(self.columns)))
+        edges = random.Random(self.seed)
+        # jitter of the shared parcel edges inside a block, zero on the block edges
+        self.x_jitter = [0.0 if c % BLOCK == 0 else edges.uniform(-4, 4) for c in range(self.columns + 1)]
+        self.y_jitter = [0.0 if r % BLOCK == 0 else edges.uniform(-6, 6) for r in range(self.rows + 1)]
+
+    def _rng(self, i, salt=0):
+        return random.Random((self.seed * 1000003 + i) * 8 + salt)
+
+    def _edge(self, index, size, jitter):
+        block, offset = divmod(index, BLOCK)
+        return block * (BLOCK * size + ROAD_WIDTH) + offset * size + jitter[index]
+
+    def extent(self):
+        return (ORIGIN[0], ORIGIN[1],
+                ORIGIN[0] + self._edge(self.columns, PARCEL_WIDTH, self.x_jitter + [0.0]),
+                ORIGIN[1] + self._edge(self.rows, PARCEL_DEPTH, self.y_jitter + [0.0]))
+
+    def bounds(self, i):
+        c, r = i % self.columns, i // self.columns
+        x0 = ORIGIN[0] + self._edge(c, PARCEL_WIDTH, self.x_jitter)
+        x1 = ORIGIN[0] + self._edge(c + 1, PARCEL_WIDTH, self.x_jitter)
+        y0 = ORIGIN[1] + self._edge(r, PARCEL_DEPTH, self.y_jitter)
+        y1 = ORIGIN[1] + self._edge(r + 1, PARCEL_DEPTH, self.y_jitter)
+        # the last parcel of a block ends at the block edge, not the road centre
+        if (c + 1) % BLOCK == 0:
+            x1 -= ROAD_WIDTH
+        if (r + 1) % BLOCK == 0:
+            y1 -= ROAD_WIDTH
+        return x0, y0, x1, y1
+
+    def liskey(self, i):
+        return 10000000 + i
+
+    def sg26(self, i):
+        c, r = i % self.columns, i // self.columns
+        extent = (r // BLOCK) * (self.columns // BLOCK + 1) + c // BLOCK
+        return "C016{:04d}{:08d}00000".format(extent % 10000, i + 1)
+
+    def parcel(self, i):
+        # the row of base parcel i, without the injected anomalies
+        rng = self._rng(i)
+        code = self.sg26(i)
+        if rng.random() < self.malformed_rate:
+            code = None if rng.random() < 0.5 else code[:12]
+        return {"SHAPE": _rectangle(*self.bounds(i), rng=rng),
+                "SL_LAND_PR": self.liskey(i),
+                "SG26_CODE": code,
+                "STREET_NO": str(rng.randint(1, 400)),
+                "STREET_NAM": rng.choice(STREET_NAMES),
+                "STREET_SUF": rng.choice(STREET_SUFFIXES),
+                "SUBURB": SUBURBS[(i // (self.columns * BLOCK)) % len(SUBURBS)],
+                "ZONING": _weighted(rng, ZONING),
+                "VSTD_DESC": _weighted(rng, LAND_USE),
+                "LU_LGL_STS": _weighted(rng, LEGAL_STATUS)}
+
+    def anomalies(self, i, row):
+        # duplicates, overlaps and slivers of parcel i, in that order
+        rng = self._rng(i, 1)
+        x0, y0, x1, y1 = self.bounds(i)
+        key = 50000000 + i * 4
+        if rng.random() < self.duplicate_rate:
+            duplicate = dict(row)
+            if rng.random() < 0.5:
+                duplicate["SL_LAND_PR"] = key
+                duplicate["SG26_CODE"] = "C016999{:09d}00001".format(i + 1)
+            yield "duplicate", duplicate
+        if rng.random() < self.overlap_rate:
+            overlap = dict(row, SL_LAND_PR=key + 1, SG26_CODE="C016998{:09d}00001".format(i + 1))
+            shift = (x1 - x0) * 0.3
+            overlap["SHAPE"] = _rectangle(x0 + shift, y0, x1 + shift, y1)
+            yield "overlap", overlap
+        if rng.random() < self.sliver_rate:
+            sliver = dict(row, SL_LAND_PR=key + 2, SG26_CODE="C016997{:09d}00001".format(i + 1),
+                          VSTD_DESC="Unset")
+            length = min(5.0, y1 - y0)
+            sliver["SHAPE"] = _rectangle(x0, y0, x0 + rng.uniform(0.1, 2.5 / length), y0 + length)
+            yield "sliver", sliver
+
+    def parcels(self):
+        for i in range(self.count):
+            row = self.parcel(i)
+            yield row
+            for kind, anomaly in self.anomalies(i, row):
+                yield anomaly
+
+    def roadReserves(self):
+        # one road reserve parcel per block along its eastern road
+        for i in range(self.count):
+            c, r = i % self.columns, i // self.columns
+            if (c + 1) % BLOCK or r % BLOCK:
+                continue
+            x0, y0, x1, y1 = self.bounds(i)
+            top = self.bounds(min(i + (BLOCK - 1) * self.columns, self.count - 1))[3]
+            rng = self._rng(i, 2)
+            yield {"SHAPE": _rectangle(x1, y0, x1 + ROAD_WIDTH, top), "SL_LAND_PR": 90000000 + i,
+                   "SG26_CODE": "C016{:04d}{:08d}00000".format(9999, i + 1),
+                   "STREET_NO": "", "STREET_NAM": rng.choice(STREET_NAMES), "STREET_SUF": "RD",
+                   "SUBURB": SUBURBS[0], "ZONING": rng.choice(["Transport Zone 2", "", "Community Zone 1"]),
+                   "VSTD_DESC": "Roadway", "LU_LGL_STS": "Registered"}
+
+    def cadastre(self):
+        for row in self.parcels():
+            yield row
+        for row in self.roadReserves():
+            yield row
+
+    def update(self):
+        # the cadastre as the next delivery would have it
+        for i in range(self.count):
+            row = self.parcel(i)
+            rng = self._rng(i, 3)
+            change = rng.random()
+            rate = self.change_rate / 4.0
+            if change < rate:
+                continue
+            elif change < rate * 2:
+                # subdivided into two new parcels
+                x0, y0, x1, y1 = self.bounds(i)
+                middle = (x0 + x1) / 2.0
+                for k, (a, b) in enumerate([(x0, middle), (middle, x1)]):
+                    yield dict(row, SHAPE=_rectangle(a, y0, b, y1), SL_LAND_PR=80000000 + i * 2 + k,
+                               SG26_CODE="C016996{:09d}{:05d}".format(i + 1, k + 1))
+                continue
+            elif change < rate * 3:
+                row["ZONING"] = _weighted(rng, ZONING)
+            elif change < rate * 4:
+                x0, y0, x1, y1 = self.bounds(i)
+                row["SHAPE"] = _rectangle(x0, y0, x1 + rng.uniform(-1, 1), y1)
+            yield row
+            for kind, anomaly in self.anomalies(i, row):
+                yield anomaly
+        for row in self.roadReserves():
+            yield row
+
+    def roads(self):
+        x_min, y_min, x_max, y_max = self.extent()
+        for c in range(BLOCK, self.columns + 1, BLOCK):
+            x = ORIGIN[0] + self._edge(c, PARCEL_WIDTH, self.x_jitter + [0.0]) - ROAD_WIDTH
+            yield {"SHAPE": _rectangle(x, y_min, x + ROAD_WIDTH, y_max), "ROADNAME": "Road {}".format(c)}
+        for r in range(BLOCK, self.rows + 1, BLOCK):
+            y = ORIGIN[1] + self._edge(r, PARCEL_DEPTH, self.y_jitter + [0.0]) - ROAD_WIDTH
+            yield {"SHAPE": _rectangle(x_min, y, x_max, y + ROAD_WIDTH), "ROADNAME": "Street {}".format(r)}
+
+    def _split(self, across, down):
+        # the extent split into across x down boundary polygons
+        x_min, y_min, x_max, y_max = self.extent()
+        x_min, y_min, x_max, y_max = x_min - 100, y_min - 100, x_max + 100, y_max + 100
+        width, height = (x_max - x_min) / across, (y_max - y_min) / down
+        for a in range(across):
+            for d in range(down):
+                yield a * down + d, _rectangle(x_min + a * width, y_min + d * height,
+                                               x_min + (a + 1) * width, y_min + (d + 1) * height)
+
+    def localMunicipalities(self):
+        for k, rings in self._split(2, 2):
+            yield {"SHAPE": rings, "FULLNAME": "Local Municipality {}".format(k + 1)}
+
+    def districtMunicipalities(self):
+        for k, rings in self._split(2, 1):
+            yield {"SHAPE": rings, "FULLNAME": "District Municipality {}".format(k + 1),
+                   "DISTRICTCO": "DC{}".format(k + 1)}
+
+    def provinces(self):
+        for k, rings in self._split(1, 1):
+            yield {"SHAPE": rings, "PROVNAME": "Western Cape"}
+
+    def billCount(self, i):
+        rng = self._rng(i, 4)
+        return None if rng.random() < 0.15 else rng.randint(0, 3)
+
+    def billing(self):
+        for i in range(self.count):
+            count = self.billCount(i)
+            if count is not None:
+                yield {"LISKEY": self.liskey(i), "Total_BillCount": count}
+
+    def overlapping(self):
+        # identical geometry groups as the overlap cleaners receive them
+        group = 0
+        for i in range(self.count):
+            row = self.parcel(i)
+            duplicates = [a for kind, a in self.anomalies(i, row) if kind == "duplicate"]
+            if not duplicates:
+                continue
+            group += 1
+            for member in [row] + duplicates:
+                member = dict(member, FEAT_SEQ=group)
+                member["Total_BillCount"] = self.billCount(i) if member["SL_LAND_PR"] == row["SL_LAND_PR"] else None
+                yield member
+
+    def formatted(self):
+        # the parcels in the cadastre schema, ready for the attribute helpers
+        for i in range(self.count):
+            row = self.parcel(i)
+            x0, y0, x1, y1 = self.bounds(i)
+            yield {"SHAPE": row["SHAPE"], "SL_LAND_PR": row["SL_LAND_PR"], "CITYSG26CO": row["SG26_CODE"],
+                   "STREETNO": row["STREET_NO"], "STREETNAME": row["STREET_NAM"],
+                   "STREETSUFF": row["STREET_SUF"].upper(), "SUBURBNAME": row["SUBURB"],
+                   "ZONING": row["ZONING"], "VSTD_DESC": row["VSTD_DESC"], "LU_LGL_STS": row["LU_LGL_STS"],
+                   "AREA": (x1 - x0) * (y1 - y0), "PERIMETER": 2 * ((x1 - x0) + (y1 - y0)),
+                   "CENT_X": (x0 + x1) / 2.0, "CENT_Y": (y0 + y1) / 2.0,
+                   "RECNO": rammcore.populateRecNo("PRC", i + 1), "EKHAYAID": None}
+
+    def collectionPoints(self):
+        rng = random.Random(self.seed * 31 + 7)
+        x_min, y_min, x_max, y_max = self.extent()
+        for i in range(max(1, self.count // 40)):
+            x, y = rng.uniform(x_min, x_max), rng.uniform(y_min, y_max)
+            yield {"SHAPE": [[(x, y)]], "X": x, "Y": y}
+
+    def fieldMap(self):
+        for source, destination in FIELD_MAP:
+            yield {"SourceFieldname": source, "DestinationFieldName": destination}
+
+    def tables(self):
+        """
+        Every table of the synthetic cadastre
+
+        Returns:
+            tables (list): (name, fields, geometry type, row iterator factory)
+                tuples, the geometry type is None for attribute tables
+        """
+        return [("parcels", PARCEL_FIELDS, "POLYGON", self.cadastre),
+                ("parcels_update", PARCEL_FIELDS, "POLYGON", self.update),
+                ("cadastre", CADASTRE_FIELDS, "POLYGON", self.formatted),
+                ("cad_schema", CADASTRE_FIELDS, "POLYGON", lambda: iter([])),
+                ("overlapping", PARCEL_FIELDS + [("FEAT_SEQ", "Integer"), ("Total_BillCount", "Integer")],
+                 "POLYGON", self.overlapping),
+                ("roads", [("ROADNAME", "String")], "POLYGON", self.roads),
+                ("local_municipalities", [("FULLNAME", "String")], "POLYGON", self.localMunicipalities),
+                ("district_municipalities", [("FULLNAME", "String"), ("DISTRICTCO", "String")], "POLYGON",
+                 self.districtMunicipalities),
+                ("provinces", [("PROVNAME", "String")], "POLYGON", self.provinces),
+                ("billing", [("LISKEY", "Integer"), ("Total_BillCount", "Integer")], None, self.billing),
+                ("collection_points", [("X", "Double"), ("Y", "Double")], "POINT", self.collectionPoints),
+                ("field_map", [("SourceFieldname", "String"), ("DestinationFieldName", "String")], None,
+                 self.fieldMap)]
+
+    def toMemoryBackend(self, names=None):
+        backend = rammcore.MemoryBackend()
+        for name, fields, geometry_type, rows in self.tables():
+            if names is None or name in names:
+                backend.addTable(name, fields, rows(), geometry_type)
+        return backend
+
+
+GEOPACKAGE_TYPES = {"Integer": "INTEGER", "SmallInteger": "INTEGER", "Double": "DOUBLE", "Single": "DOUBLE",
+                    "Date": "DATETIME", "String": "TEXT"}
+
+
+def writeGeoPackage(path, tables, batch_size=50000):
+    """
+    Streams tables into a new GeoPackage that ArcGIS and the GeoPackageBackend can read
+
+    Args:
+        path (str): the .gpkg file, replaced if it exists
+        tables (list): tables in the form SyntheticCadastre.tables returns
+        batch_size (int): rows inserted per statement batch
+    """
+    temporary = path + ".tmp"
+    if os.path.exists(temporary):
+        os.remove(temporary)
+    connection = sqlite3.connect(temporary)
+    connection.execute("PRAGMA application_id = 1196444487")
+    connection.execute("PRAGMA user_version = 10200")
+    connection.execute("PRAGMA journal_mode = OFF")
+    connection.execute("PRAGMA synchronous = OFF")
+    connection.executescript("""
+        CREATE TABLE gpkg_spatial_ref_sys (srs_name TEXT NOT NULL, srs_id INTEGER PRIMARY KEY,
+            organization TEXT NOT NULL, organization_coordsys_id INTEGER NOT NULL,
+            definition TEXT NOT NULL, description TEXT);
+        CREATE TABLE gpkg_contents (table_name TEXT PRIMARY KEY, data_type TEXT NOT NULL, identifier TEXT UNIQUE,
+            description TEXT DEFAULT '', last_change DATETIME NOT NULL DEFAULT
+            (strftime('%Y-%m-%dT%H:%M:%fZ','now')), min_x DOUBLE, min_y DOUBLE, max_x DOUBLE, max_y DOUBLE,
+            srs_id INTEGER);
+        CREATE TABLE gpkg_geometry_columns (table_name TEXT NOT NULL, column_name TEXT NOT NULL,
+            geometry_type_name TEXT NOT NULL, srs_id INTEGER NOT NULL, z TINYINT NOT NULL, m TINYINT NOT NULL,
+            CONSTRAINT pk_geom_cols PRIMARY KEY (table_name, column_name));
+        INSERT INTO gpkg_spatial_ref_sys VALUES ('Undefined cartesian SRS', -1, 'NONE', -1, 'undefined', NULL);
+        INSERT INTO gpkg_spatial_ref_sys VALUES ('Undefined geographic SRS', 0, 'NONE', 0, 'undefined', NULL);
+    """)
+    for name, fields, geometry_type, rows in tables:
+        columns = ['"fid" INTEGER PRIMARY KEY AUTOINCREMENT']
+        if geometry_type is not None:
+            columns.append('"geom" {}'.format(geometry_type))
+        columns.extend('"{}" {}'.format(f, GEOPACKAGE_TYPES[t]) for f, t in fields)
+        connection.execute('CREATE TABLE "{}" ({})'.format(name, ", ".join(columns)))
+        names = [f for f, t in fields]
+        insert = 'INSERT INTO "{}" ({}) VALUES ({})'.format(
+            name, ", ".join('"{}"'.format(f) for f in (["geom"] if geometry_type else []) + names),
+            ", ".join("?" * (len(names) + (1 if geometry_type else 0))))
+        extent = [None]
+
+        def values(rows=rows, geometry_type=geometry_type):
+            for row in rows():
+                record = [row.get(f) for f in names]
+                if geometry_type is not None:
+                    rings = row.get("SHAPE")
+                    if rings:
+                        e = rammcore.ringsExtent(rings)
+                        extent[0] = e if extent[0] is None else (min(extent[0][0], e[0]), min(extent[0][1], e[1]),
+                                                                max(extent[0][2], e[2]), max(extent[0][3], e[3]))
+                    record.insert(0, rammcore.ringsToGeoPackage(rings, -1, geometry_type))
+                yield record
+
+        stream = values()
+        while True:
+            batch = list(itertools.islice(stream, batch_size))
+            if not batch:
+                break
+            connection.executemany(insert, batch)
+        if geometry_type is None:
+            connection.execute("INSERT INTO gpkg_contents (table_name, data_type, identifier) VALUES (?, ?, ?)",
+                               (name, "attributes", name))
+        else:
+            e = extent[0] or (None, None, None, None)
+            connection.execute("INSERT INTO gpkg_contents (table_name, data_type, identifier, min_x, min_y, max_x, "
+                               "max_y, srs_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                               (name, "features", name, e[0], e[1], e[2], e[3], -1))
+            connection.execute("INSERT INTO gpkg_geometry_columns VALUES (?, ?, ?, ?, 0, 0)",
+                               (name, "geom", geometry_type, -1))
+        connection.commit()
+    connection.close()
+    if os.path.exists(path):
+        os.remove(path)
+    os.rename(temporary, path)
+
+
+def loadTables(path, names=None):
+    """
+    Reads tables of a GeoPackage into a MemoryBackend with the geometries as rings
+
+    Args:
+        path (str): the .gpkg file
+        names (list): tables to read, all of them if not given
+
+    Returns:
+        backend (MemoryBackend): the tables, object ids taken from the fid column
+    """
+    connection = sqlite3.connect(path)
+    geometry_columns = dict(connection.execute(
+        "SELECT table_name, geometry_type_name FROM gpkg_geometry_columns").fetchall())
+    backend = rammcore.MemoryBackend()
+    types = dict((v, k) for k, v in GEOPACKAGE_TYPES.items() if k in ("Integer", "Double", "Date", "String"))
+    for name, in connection.execute("SELECT table_name FROM gpkg_contents ORDER BY table_name").fetchall():
+        if names is not None and name not in names:
+            continue
+        info = connection.execute('PRAGMA table_info("{}")'.format(name)).fetchall()
+        fields = [(c[1], types.get(c[2], "String")) for c in info if c[1] not in ("fid", "geom")]
+        rows = {}
+        cursor = connection.execute('SELECT * FROM "{}"'.format(name))
+        columns = [d[0] for d in cursor.description]
+        for record in cursor:
+            row = dict(zip(columns, record))
+            oid = row.pop("fid")
+            if "geom" in row:
+                row["SHAPE"] = rammcore.ringsFromGeoPackage(row.pop("geom"))
+            rows[oid] = row
+        backend.tables[name] = {"fields": fields, "geometry": geometry_columns.get(name), "rows": rows}
+    connection.close()
+    return backend
+
+
+def syntheticGeoPackage(folder, scale, seed=0):
+    # path of the GeoPackage for a scale, generated the first time it is asked for
+    count = SCALES.get(scale) or int(scale)
+    path = os.path.join(folder, "synthetic_v{}_{}_{}.gpkg".format(VERSION, count, seed))
+    if not os.path.exists(path):
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        writeGeoPackage(path, SyntheticCadastre(count, seed).tables())
+    return path
@@ -1,14 +1,142 @@
-import arcpy
 import time
 import logging
 import traceback
 import os
 import sys
+import hashlib
+import json
+import struct
+import atexit
+import threading
+import contextlib
+import functools
+import itertools
+import datetime
 
-rec = 0
+# rammcore holds everything that runs without ArcGIS, arcpy itself is only
+# imported the first time a function here uses it
+from rammcore import *
 
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
-def defineLogger(log_location=""):
+
+class BufferedFileHandler(logging.FileHandler):
+    # file handler that leaves flushing to BackgroundLogHandler so records are
+    # written to disk in batches instead of one flush per record
+
+    def emit(self, record):
+        try:
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(self.format(record) + "\n")
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        pass
+
+    def flushBuffer(self):
+        self.acquire()
+        try:
+            if self.stream is not None and hasattr(self.stream, "flush"):
+                self.stream.flush()
+        finally:
+            self.release()
+
+
+class JsonLinesFormatter(logging.Formatter):
+    # one json object per record, extra values passed as extra={"data": {...}}
+
+    def format(self, record):
+        entry = {"time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+                 "level": record.levelname,
+                 "message": record.getMessage().strip()}
+        entry.update(getattr(record, "data", None) or {})
+        if record.exc_text:
+            entry["traceback"] = record.exc_text
+        return json.dumps(entry, sort_keys=True, default=str)
+
+
+class BackgroundLogHandler(logging.Handler):
+    """
+    Queues log records and writes them to the wrapped handlers on a
+    background thread, flushing the files every flush_interval seconds or
+    once capacity records are waiting, whichever comes first
+
+    Args:
+        handlers (list): the handlers that do the actual writing
+        flush_interval (float): longest time a record waits before being flushed
+        capacity (int): number of written records that forces a flush
+    """
+
+    _STOP = object()
+
+    def __init__(self, handlers, flush_interval=1.0, capacity=500):
+        logging.Handler.__init__(self)
+        self.handlers = handlers
+        self.flush_interval = flush_interval
+        self.capacity = capacity
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._monitor, name="ramm-log-writer")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def emit(self, record):
+        # resolve the message now, the arguments may change before it is written
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        self.queue.put(record)
+
+    def _flushHandlers(self):
+        for handler in self.handlers:
+            getattr(handler, "flushBuffer", handler.flush)()
+
+    def _monitor(self):
+        pending = 0
+        while True:
+            try:
+                record = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if pending:
+                    self._flushHandlers()
+                    pending = 0
+                continue
+            try:
+                if record is self._STOP:
+                    self._flushHandlers()
+                    return
+                for handler in self.handlers:
+                    if record.levelno >= handler.level:
+                        handler.handle(record)
+                pending += 1
+                if pending >= self.capacity:
+                    self._flushHandlers()
+                    pending = 0
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        # block until everything queued so far is on disk
+        if self.thread.is_alive():
+            self.queue.join()
+            self._flushHandlers()
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(self._STOP)
+            self.thread.join()
+        for handler in self.handlers:
+            handler.close()
+        logging.Handler.close(self)
+
+
+def defineLogger(log_location="", json_lines=True, flush_interval=1.0):
     logger = logging.getLogger(__name__)
     x = list(logger.handlers)
     for i in x:
@@ -17,156 +145,1595 @@ def defineLogger(log_location=""):
         i.close()
     logger.setLevel(logging.DEBUG)
     formatter = logging.Formatter('%(asctime)s : %(message)s')
-    file_handler = logging.FileHandler(log_location + '/log.log')
+    file_handler = BufferedFileHandler(log_location + '/log.log')
     file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
+    handlers = [file_handler]
+    # structured copy of the log for tooling, one json object per line
+    if json_lines:
+        json_handler = BufferedFileHandler(log_location + '/log.jsonl')
+        json_handler.setFormatter(JsonLinesFormatter())
+        handlers.append(json_handler)
+    background_handler = BackgroundLogHandler(handlers, flush_interval)
+    logger.addHandler(background_handler)
+    atexit.register(background_handler.close)
     logger.debug(
         "\n \n ********************** {} ************************\n \n".format(str(time.ctime())))
     return logger
 
 
-def populateCPID(id_start):
-    pinterval = 1
-    pStart = int(id_start)
-    global rec
+class ProgressLogger(object):
+    """
+    Collapses per feature messages into a progress summary every interval seconds
 
-    if rec == 0:
-        rec = id_start
-    else:
-        rec += pinterval
+    Args:
+        logger (logging.Logger): logger from defineLogger
+        label (str): what is being processed, eg "Extracting overlapping polygons"
+        total (int): number of items expected, if known
+        interval (float): seconds between summaries
+    """
 
-    ans = str(rec)
+    def __init__(self, logger, label, total=None, interval=10.0):
+        self.logger = logger
+        self.label = label
+        self.total = total
+        self.interval = interval
+        self.count = 0
+        self.started = time.time()
+        self.reported = self.started
 
-    finans = ans.rjust(8, '0')
+    def update(self, detail=None, count=1):
+        self.count += count
+        now = time.time()
+        if now - self.reported >= self.interval:
+            self.reported = now
+            self._report(detail)
 
-    return 'CP' + finans
+    def finish(self, detail=None):
+        self._report(detail)
 
+    def _report(self, detail):
+        elapsed = max(time.time() - self.started, 1e-6)
+        done = str(self.count) if self.total is None else "{}/{}".format(self.count, self.total)
+        message = "\t {} - {} processed ({:.1f} per second)".format(self.label, done, self.count / elapsed)
+        if detail is not None:
+            message += ", last {}".format(detail)
+        gpMessage(str(time.ctime()) + " - " + message)
+        self.logger.debug(message, extra={"data": {"progress": self.label, "count": self.count,
+                                                   "total": self.total, "elapsed": round(elapsed, 3)}})
 
-def populateRecNo(recno_prefix, startNumber):
-    pinterval = 1
-    pStart = int(startNumber)
-    global rec
 
-    if rec == 0:
-        rec = pStart
-    else:
-        rec += pinterval
+def peakMemory():
+    # peak resident memory of this process in bytes, None if it can't be read
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
 
-    ans = str(rec)
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                        ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
 
-    finans = ans.rjust(11, '0')
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        if ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(),
+                                                    ctypes.byref(counters), counters.cb):
+            return int(counters.PeakWorkingSetSize)
+        return None
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS bytes
+    return int(peak) if sys.platform == "darwin" else int(peak) * 1024
 
-    return recno_prefix + finans
 
+def _cpuTime():
+    times = os.times()
+    return times[0] + times[1]
 
-def populateEkhayaID(cent_x, cent_y, recno):
-    lat = int(cent_x * 1100000)
-    lon = int(cent_y * 1100000)
-    rec_string = recno[:4]
 
-    finlat = hex(lat)[2:].rjust(8, '0')
-    finlon = hex(lon)[2:].rjust(8, '0')
+class RunProfiler(object):
+    """
+    Records the wall time, CPU time, row counts and peak memory of the named
+    steps of a tool and writes them as a run report next to log.log
 
-    return rec_string.upper() + finlat.upper() + finlon.upper()
+    Args:
+        tool_name (str): name of the tool, used to compare runs of the same tool
+        log_location (str): folder of log.log, run_report.json and run_reports.jsonl
+        logger (logging.Logger): optional logger from defineLogger for the summary
+    """
 
+    def __init__(self, tool_name, log_location, logger=None):
+        self.tool_name = tool_name
+        self.log_location = log_location
+        self.logger = logger
+        self.steps = []
+        self.current = None
+        self.started = time.time()
+        self.started_cpu = _cpuTime()
+        self.wrapped = {}
 
-def populateNewEkhayaID(cent_x, cent_y, recno):
-    lat = int(cent_x * 1100000)
-    lon = int(cent_y * 1100000)
-    rec_string1 = recno[:9]
-    rec_string2 = int(recno[-11:])
+    def begin(self, name, rows_in=None):
+        # end the running step, if any, and start the next one
+        self.end()
+        self.current = {"name": name, "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                        "rows_in": rows_in, "rows_out": None, "geoprocessing": {},
+                        "_wall": time.time(), "_cpu": _cpuTime(), "_peak": peakMemory()}
+        return self.current
 
-    finlat = hex(lat)[2:].rjust(8, '0')
-    finlon = hex(lon)[2:].rjust(8, '0')
-    finrec_string2 = hex(rec_string2)[2:].rjust(10, '0')
+    def end(self, rows_out=None):
+        step = self.current
+        if step is None:
+            return None
+        self.current = None
+        peak = peakMemory()
+        if rows_out is not None:
+            step["rows_out"] = rows_out
+        step["wall_seconds"] = round(time.time() - step.pop("_wall"), 3)
+        step["cpu_seconds"] = round(_cpuTime() - step.pop("_cpu"), 3)
+        peak_before = step.pop("_peak")
+        step["peak_memory_bytes"] = peak
+        step["peak_memory_growth_bytes"] = (peak - peak_before) if peak is not None and peak_before is not None else None
+        self.steps.append(step)
+        return step
 
-    return rec_string1.upper() + finrec_string2.upper() + finlat.upper() + finlon.upper()
+    @contextlib.contextmanager
+    def step(self, name, rows_in=None):
+        # with profiler.step("name") as step: ... step["rows_out"] = n
+        step = self.begin(name, rows_in)
+        try:
+            yield step
+        finally:
+            if self.current is step:
+                self.end()
 
+    def profile(self, name=None):
+        # decorator form of step
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.step(name or function.__name__):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
 
-def populateUsingSpatialJoin(input_dataset, spatialjoin_dataset, update_field, source_field, spatialjoin_type):
-    arcpy.MakeFeatureLayer_management(
-        spatialjoin_dataset, "lyr_spatialjoin_dataset")
-    search_cursor = arcpy.SearchCursor("lyr_spatialjoin_dataset")
-    for row in search_cursor:
-        arcpy.SelectLayerByAttribute_management("lyr_spatialjoin_dataset", "NEW_SELECTION",
-                                                "\"FID\" = " + str(row.getValue("FID")))
-        arcpy.SelectLayerByLocation_management(input_dataset, spatialjoin_type, "lyr_spatialjoin_dataset", "",
-                                               "NEW_SELECTION")
-        arcpy.CalculateField_management(input_dataset, update_field,
-                                        "'{0}'".format(str(row.getValue(source_field))), "PYTHON_9.3", "")
-    del search_cursor
+    def wrapGeoprocessing(self, tool_names=None):
+        """
+        Times arcpy geoprocessing calls against the running step
 
+        Args:
+            tool_names (list): arcpy function names, eg FindIdentical_management,
+                defaults to every *_management, *_analysis and *_conversion tool
+        """
+        if tool_names is None:
+            tool_names = [name for name in dir(arcpy)
+                          if name.endswith(("_management", "_analysis", "_conversion"))]
+        for name in tool_names:
+            function = getattr(arcpy, name, None)
+            if function is None or not callable(function):
+                continue
+            function = getattr(function, "_ramm_original", function)
+            self.wrapped[name] = function
+            setattr(arcpy, name, self._timed(name, function))
 
-def populateUsingSpatialJoinFC(input_dataset, spatialjoin_dataset, update_field, source_field, spatialjoin_type):
-    arcpy.MakeFeatureLayer_management(
-        spatialjoin_dataset, "lyr_spatialjoin_dataset")
-    search_cursor = arcpy.SearchCursor("lyr_spatialjoin_dataset")
-    for row in search_cursor:
-        arcpy.SelectLayerByAttribute_management("lyr_spatialjoin_dataset", "NEW_SELECTION",
-                                                "\"OBJECTID\" = " + str(row.getValue("OBJECTID")))
-        arcpy.SelectLayerByLocation_management(input_dataset, spatialjoin_type, "lyr_spatialjoin_dataset", "",
-                                               "NEW_SELECTION")
-        arcpy.CalculateField_management(input_dataset, update_field,
-                                        "'{0}'".format(str(row.getValue(source_field))), "PYTHON_9.3", "")
-    del search_cursor
+    def _timed(self, name, function):
+        profiler = self
 
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                if profiler.current is not None:
+                    calls = profiler.current["geoprocessing"].setdefault(name, {"calls": 0, "seconds": 0.0})
+                    calls["calls"] += 1
+                    calls["seconds"] = round(calls["seconds"] + time.time() - started, 3)
+        wrapper._ramm_original = function
+        return wrapper
 
-def mapFields(input_dataset, output_dataset, field_map_table):
-    # list the fields which contain the field map info.
-    fields = ["SourceFieldname", "DestinationFieldName"]
+    def unwrapGeoprocessing(self):
+        for name, function in self.wrapped.items():
+            setattr(arcpy, name, function)
+        self.wrapped = {}
 
-    # define function to get unique field values from a table
-    def GetUniqueFieldValues(table, field):
+    def finish(self, status="completed"):
+        # close the last step, write the reports and return the report
+        self.end()
+        self.unwrapGeoprocessing()
+        report = {"tool": self.tool_name, "status": status,
+                  "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+                  "wall_seconds": round(time.time() - self.started, 3),
+                  "cpu_seconds": round(_cpuTime() - self.started_cpu, 3),
+                  "peak_memory_bytes": peakMemory(), "steps": self.steps}
+        writeCacheFile(os.path.join(self.log_location, "run_report.json"),
+                       json.dumps(report, indent=2, sort_keys=True))
+        with open(os.path.join(self.log_location, "run_reports.jsonl"), "a") as history:
+            history.write(json.dumps(report, sort_keys=True) + "\n")
+
+        if self.logger is not None:
+            for step in sorted(self.steps, key=lambda s: -s["wall_seconds"])[:5]:
+                self.logger.debug("\t {} took {}s ({}s CPU)".format(step["name"], step["wall_seconds"],
+                                                                    step["cpu_seconds"]))
+            for name, seconds, baseline in findRegressions(self.log_location, self.tool_name):
+                showPyMessage("\t {} took {}s against a typical {}s in earlier runs".format(
+                    name, seconds, baseline), self.logger, "Warning")
+        return report
+
+
+def findRegressions(log_location, tool_name, tolerance=1.25, minimum_seconds=1.0):
+    """
+    Compares the last run of a tool against the median of its earlier runs
+
+    Args:
+        log_location (str): folder holding run_reports.jsonl
+        tool_name (str): the tool to compare
+        tolerance (float): how many times slower than the median counts as a regression
+        minimum_seconds (float): steps faster than this are ignored
+
+    Returns:
+        regressions (list): (step name, seconds, median seconds) of the slower steps
+    """
+    history_file = os.path.join(log_location, "run_reports.jsonl")
+    if not os.path.isfile(history_file):
+        return []
+    with open(history_file) as history:
+        runs = [json.loads(line) for line in history if line.strip()]
+    runs = [run for run in runs if run.get("tool") == tool_name and run.get("status") == "completed"]
+    if len(runs) < 2:
+        return []
+    earlier = {}
+    for run in runs[:-1]:
+        for step in run["steps"]:
+            earlier.setdefault(step["name"], []).append(step["wall_seconds"])
+    regressions = []
+    for step in runs[-1]["steps"]:
+        timings = sorted(earlier.get(step["name"], []))
+        if not timings or step["wall_seconds"] < minimum_seconds:
+            continue
+        median = timings[len(timings) // 2]
+        if step["wall_seconds"] > median * tolerance:
+            regressions.append((step["name"], step["wall_seconds"], median))
+    return regressions
+
+
+# megabytes of intermediate datasets a ScratchWorkspace keeps in memory
+SCRATCH_MEMORY_MB = int(os.environ.get("RAMM_SCRATCH_MEMORY_MB", 1024))
+
+# bytes a value of each field type takes, strings use their length
+FIELD_TYPE_BYTES = {"OID": 4, "Integer": 4, "SmallInteger": 2, "Single": 4, "Double": 8, "Date": 8,
+                    "GUID": 38, "GlobalID": 38}
+
+
+def estimateDatasetBytes(dataset, sample_size=1000):
+    # rough size of a table or feature class from its field widths and the
+    # average vertex count of its first sample_size shapes
+    count = int(arcpy.GetCount_management(dataset).getOutput(0))
+    if count == 0:
+        return 0
+    row_bytes = 0
+    has_shape = False
+    for field in arcpy.ListFields(dataset):
+        if field.type == "Geometry":
+            has_shape = True
+        elif field.type == "String":
+            row_bytes += field.length
+        else:
+            row_bytes += FIELD_TYPE_BYTES.get(field.type, 8)
+    if has_shape:
+        points = []
+        with arcpy.da.SearchCursor(dataset, ["SHAPE@"]) as cursor:
+            for row in itertools.islice(cursor, sample_size):
+                points.append(row[0].pointCount if row[0] is not None else 0)
+        del cursor
+        row_bytes += 16 * sum(points) // max(len(points), 1)
+    return count * row_bytes
+
+
+class ScratchWorkspace(object):
+    """
+    Keeps the intermediate datasets of a tool in the in_memory workspace while
+    they fit a memory budget and moves the largest ones to scratch.gdb when
+    they do not. cleanup deletes everything in it, so only the outputs and
+    reports written elsewhere are kept
+
+    Args:
+        folder (str): folder of scratch.gdb, created the first time it is needed
+        memory_mb (int): megabytes of intermediate datasets kept in memory
+        logger (logging.Logger): optional logger from defineLogger
+    """
+
+    def __init__(self, folder, memory_mb=SCRATCH_MEMORY_MB, logger=None):
+        self.folder = folder
+        self.budget = memory_mb * 1024 * 1024
+        self.logger = logger
+        self.gdb = None
+        # name to path of every intermediate, the estimated bytes of the ones
+        # in memory and the layer name to intermediate name of the layers made
+        self.datasets = {}
+        self.sizes = {}
+        self.layers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cleanup()
+        return False
+
+    def _disk(self, name):
+        if self.gdb is None:
+            arcpy.CreateFileGDB_management(self.folder, "scratch.gdb")
+            self.gdb = os.path.join(self.folder, "scratch.gdb")
+        return os.path.join(self.gdb, name)
+
+    def inMemory(self, name):
+        return name in self.sizes
+
+    def path(self, name):
+        # where the intermediate is, new ones go to memory unless the ones
+        # already there use up the budget
+        if name not in self.datasets:
+            if sum(self.sizes.values()) < self.budget:
+                self.datasets[name] = "in_memory/" + name
+                self.sizes[name] = 0
+            else:
+                self.datasets[name] = self._disk(name)
+        return self.datasets[name]
+
+    def createFeatureclass(self, name, template, geometry_type="POLYGON"):
+        # empty intermediate with the schema and spatial reference of template
+        out_path, out_name = os.path.split(self.path(name))
+        arcpy.CreateFeatureclass_management(out_path, out_name, geometry_type, template, "DISABLED", "DISABLED",
+                                            arcpy.Describe(template).spatialReference)
+        return self.datasets[name]
+
+    def layer(self, name, layer_name):
+        # feature layer on an intermediate that follows it if it is moved to disk
+        arcpy.MakeFeatureLayer_management(self.path(name), layer_name)
+        self.layers[layer_name] = name
+        return layer_name
+
+    def addSpatialIndex(self, name):
+        # in_memory datasets are not indexed
+        if not self.inMemory(name):
+            arcpy.AddSpatialIndex_management(self.datasets[name])
+
+    def addIndex(self, name, fields, index_name, unique="NON_UNIQUE"):
+        if not self.inMemory(name):
+            arcpy.AddIndex_management(self.datasets[name], fields, index_name, unique)
+
+    def fit(self):
+        """
+        Measures the intermediates in memory and moves the largest to
+        scratch.gdb until the rest fit the budget. Layers on a moved dataset
+        are made again without their selection, so only call this between
+        steps
         """
-        Retrieves and prints a list of unique values in a user-specified field
+        for name in list(self.sizes):
+            path = self.datasets[name]
+            self.sizes[name] = estimateDatasetBytes(path) if arcpy.Exists(path) else 0
+        while self.sizes and sum(self.sizes.values()) > self.budget:
+            name = max(self.sizes, key=self.sizes.get)
+            self._spill(name)
+
+    def _spill(self, name):
+        source = self.datasets[name]
+        target = self._disk(name)
+        if self.logger:
+            self.logger.debug("Moving {} ({} MB) to {}".format(
+                name, self.sizes[name] // (1024 * 1024), self.gdb))
+        copyDataset(source, target)
+        arcpy.Delete_management(source)
+        self.datasets[name] = target
+        del self.sizes[name]
+        for layer_name, dataset_name in self.layers.items():
+            if dataset_name == name:
+                arcpy.Delete_management(layer_name)
+                arcpy.MakeFeatureLayer_management(target, layer_name)
+
+    def delete(self, name):
+        # delete an intermediate and the layers made on it
+        for layer_name in [l for l, n in self.layers.items() if n == name]:
+            arcpy.Delete_management(layer_name)
+            del self.layers[layer_name]
+        path = self.datasets.pop(name, None)
+        self.sizes.pop(name, None)
+        if path is not None and arcpy.Exists(path):
+            arcpy.Delete_management(path)
+
+    def cleanup(self):
+        # delete every intermediate and scratch.gdb, after success or failure
+        for name in list(self.datasets):
+            try:
+                self.delete(name)
+            except Exception:
+                if self.logger:
+                    self.logger.debug("Could not delete the intermediate {}".format(name))
+        if self.gdb is not None and arcpy.Exists(self.gdb):
+            arcpy.Delete_management(self.gdb)
+        self.gdb = None
+
+
+def copyDataset(source, target):
+    # copy a feature class or table, replacing target
+    if arcpy.Exists(target):
+        arcpy.Delete_management(target)
+    if hasattr(arcpy.Describe(source), "shapeType"):
+        arcpy.CopyFeatures_management(source, target)
+    else:
+        arcpy.CopyRows_management(source, target)
+
+
+def inputsFingerprint(inputs):
+    # hash of the parameters of a run, datasets by their path, modified time and row count
+    values = []
+    for value in inputs:
+        if value and arcpy.Exists(value):
+            description = arcpy.Describe(value)
+            if hasattr(description, "fields"):
+                path = description.catalogPath
+                value = [path, _datasetStamp(path), int(arcpy.GetCount_management(path).getOutput(0))]
+        values.append(value)
+    return hashlib.sha1(json.dumps(values, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class Checkpoints(object):
+    """
+    Records the steps of a tool as they complete, with a copy of the
+    intermediates and outputs later steps change, so a run that failed can be
+    started again with the same inputs and carry on after the last completed
+    step instead of from the start
+
+    The record is kept in checkpoints.json and the copies in checkpoints.gdb
+    in the output location until finish is called at the end of a successful
+    run. Only the latest copy of each dataset is kept, so a step can only be
+    resumed from while none of the datasets it copied was copied again by a
+    later step. A run with different inputs starts afresh.
+
+    Args:
+        tool_name (str): name of the tool
+        folder (str): the output location
+        inputs (list): the parameters of the tool, datasets are compared by
+            their path, modified time and row count
+        scratch (ScratchWorkspace): the intermediates of the tool
+        rerun (str): steps to run again even if they completed, by name or
+            number and separated by semicolons, eg "Step 7;Step 10". The steps
+            after them run again too as they depend on them, and so do the
+            steps before them back to the last one that can be resumed from
+        logger (logging.Logger): optional logger from defineLogger
+    """
+
+    def __init__(self, tool_name, folder, inputs, scratch, rerun="", logger=None):
+        self.tool_name = tool_name
+        self.folder = folder
+        self.scratch = scratch
+        self.logger = logger
+        self.path = os.path.join(folder, "checkpoints.json")
+        self.gdb = os.path.join(folder, "checkpoints.gdb")
+        self.rerun = [step.strip() for step in (rerun or "").split(";") if step.strip()]
+        self.inputs = inputsFingerprint(inputs)
+        # layers on outputs, made again when a run is resumed
+        self.layers = {}
+        self.steps = []
+        self.position = 0
+        self.current = None
+        record = {}
+        if os.path.exists(self.path):
+            with open(self.path) as record_file:
+                record = json.load(record_file)
+        if record.get("tool") == tool_name and record.get("inputs") == self.inputs:
+            self.steps = record["steps"]
+            # resume from the last step before the first forced one whose
+            # copies were not replaced by those of a later step
+            stop = next((i for i, recorded in enumerate(self.steps) if self._forced(recorded["name"])),
+                        len(self.steps))
+            kept = stop
+            while kept > 0 and not all(arcpy.Exists(copy) for copy in self.steps[kept - 1]["copies"].values()
+                                       if copy is not None):
+                kept -= 1
+            if kept < stop:
+                self._log("\t ...The copies of {} were replaced by a later step, running again from {}".format(
+                    self.steps[stop - 1]["name"], self.steps[kept]["name"]))
+            self._truncate(kept)
+        elif arcpy.Exists(self.gdb):
+            arcpy.Delete_management(self.gdb)
+        self.resuming = bool(self.steps)
+
+    def _log(self, message):
+        if self.logger is not None:
+            showPyMessage(message, self.logger)
+        else:
+            gpMessage(message)
+
+    def _forced(self, step):
+        return any(step == name or step.startswith(name + " ") for name in self.rerun)
+
+    def _truncate(self, count):
+        # forget the steps after the first count and delete the copies only they used
+        kept = set(copy for recorded in self.steps[:count] for copy in recorded["copies"].values())
+        for recorded in self.steps[count:]:
+            for copy in recorded["copies"].values():
+                if copy is not None and copy not in kept and arcpy.Exists(copy):
+                    arcpy.Delete_management(copy)
+                    kept.add(copy)
+        del self.steps[count:]
+
+    def done(self, step, outputs=None):
+        """
+        Whether a step completed in an earlier run with the same inputs and
+        can be skipped. At the first step that cannot, the intermediates,
+        outputs and layers are put back as the last completed step left them,
+        and the same is done after the last recorded step is skipped for the
+        work that follows it
 
         Args:
-            table (str): path or name of a feature class, layer, table, or table view
-            field (str): name of the field for which the user wants unique values
+            step (str): name of the step, the steps must be checked in order
+            outputs (list): paths of the outputs the step creates, deleted
+                before it runs so that a step that failed part way through
+                starts again without the outputs it already made
 
         Returns:
-            uniqueValues (list): a list of the unique values in the field
+            done (bool): True when the step should be skipped
         """
-        # get the values
-        with arcpy.da.SearchCursor(table, [field]) as cursor:
-            return sorted({row[0] for row in cursor})
+        self.current = step
+        if self.resuming:
+            recorded = self.steps[self.position] if self.position < len(self.steps) else None
+            if recorded is not None and recorded["name"] == step and not self._forced(step):
+                self.position += 1
+                self._log("\t ...Completed in an earlier run")
+                if self.position == len(self.steps):
+                    self.resuming = False
+                    self._restore(recorded)
+                return True
+            self.resuming = False
+            self._truncate(self.position)
+            if self.steps:
+                self._restore(self.steps[-1])
+        for output in outputs or []:
+            if arcpy.Exists(output):
+                arcpy.Delete_management(output)
+        return False
 
-    # get a list of unique output fields
-    output_fields = GetUniqueFieldValues(
-        field_map_table, "DestinationFieldName")
+    def values(self):
+        # the values recorded when the current step completed
+        return self.steps[self.position - 1]["values"]
+
+    def layer(self, dataset, layer_name):
+        # feature layer on an output that is made again when a run is resumed
+        arcpy.MakeFeatureLayer_management(dataset, layer_name)
+        self.layers[layer_name] = dataset
+        return layer_name
+
+    def complete(self, values=None, changed=None):
+        """
+        Records the current step and copies the intermediates and outputs it
+        changed. The earlier copy of a dataset is deleted once its new copy
+        is recorded
+
+        Args:
+            values (dict): counts and other values later steps use
+            changed (list): names of the intermediates and paths of the
+                outputs the step changed, every intermediate when None. The
+                others are taken from the copies of earlier steps
+        """
+        previous = self.steps[-1] if self.steps else {"copies": {}, "intermediates": []}
+        names = list(self.scratch.datasets)
+        changed = names if changed is None else list(changed)
+        # the outputs copied by earlier steps are still needed to resume
+        outputs = [key for key in previous["copies"] if key not in previous["intermediates"]]
+        outputs += [key for key in changed if key not in names and key not in outputs]
+        copies = {}
+        replaced = []
+        for key in names + outputs:
+            if key not in changed and key in previous["copies"]:
+                copies[key] = previous["copies"][key]
+                continue
+            source = self.scratch.datasets.get(key, key)
+            if not arcpy.Exists(source):
+                copies[key] = None
+                continue
+            if not arcpy.Exists(self.gdb):
+                arcpy.CreateFileGDB_management(self.folder, "checkpoints.gdb")
+            copies[key] = os.path.join(self.gdb, "s{:02d}_{}".format(len(self.steps) + 1, os.path.basename(key)))
+            copyDataset(source, copies[key])
+            if previous["copies"].get(key) not in (None, copies[key]):
+                replaced.append(previous["copies"][key])
+        self.steps.append({"name": self.current, "values": values or {}, "copies": copies,
+                           "intermediates": names, "scratch_layers": dict(self.scratch.layers),
+                           "layers": dict(self.layers), "completed": time.strftime("%Y-%m-%dT%H:%M:%S")})
+        self.position = len(self.steps)
+        writeCacheFile(self.path, json.dumps({"tool": self.tool_name, "inputs": self.inputs,
+                                              "steps": self.steps}, indent=2, sort_keys=True))
+        for copy in replaced:
+            if arcpy.Exists(copy):
+                arcpy.Delete_management(copy)
+
+    def _restore(self, record):
+        self._log("\t ...Resuming from the end of {}".format(record["name"]))
+        for key, copy in record["copies"].items():
+            target = self.scratch.path(key) if key in record["intermediates"] else key
+            if copy is not None:
+                copyDataset(copy, target)
+            elif arcpy.Exists(target):
+                arcpy.Delete_management(target)
+        for layer_name, name in record["scratch_layers"].items():
+            self.scratch.layer(name, layer_name)
+        self.layers = dict(record["layers"])
+        for layer_name, dataset in self.layers.items():
+            if arcpy.Exists(dataset):
+                arcpy.MakeFeatureLayer_management(dataset, layer_name)
+
+    def finish(self):
+        # the run completed, the record and the copies are no longer needed
+        if arcpy.Exists(self.gdb):
+            arcpy.Delete_management(self.gdb)
+        if os.path.exists(self.path):
+            os.remove(self.path)
 
-    # create an empty field mappings object
-    fm = arcpy.FieldMappings()
 
-    # build the field mappings object
-    for f in output_fields:
-        # create a field map object
+def numberDataset(dataset, field, prefix, start, format_id, allocator=None):
+    # reserve a block the size of the dataset and write it in one pass
+    allocator = allocator or SequenceAllocator()
+    count = int(arcpy.GetCount_management(dataset).getOutput(0))
+    first, last = allocator.allocate(prefix, count, start, arcpy.Describe(dataset).catalogPath)
+    numbered = [first]
+
+    def transform(chunk):
+        ids = [format_id(number) for number in range(numbered[0], numbered[0] + len(chunk))]
+        numbered[0] += len(chunk)
+        return {field: ids}
+
+    updateTableInChunks(dataset, [field], [field], transform)
+    return (first, last)
+
+
+def _fieldSchema(dataset):
+    return [[f.name, f.type, f.length] for f in arcpy.ListFields(dataset)]
+
+
+def loadFieldMapPlan(input_dataset, output_dataset, field_map_table):
+    # read the field map table once and reuse the compiled plan while neither
+    # the table nor the schemas change
+    with arcpy.da.SearchCursor(field_map_table, ["SourceFieldname", "DestinationFieldName"]) as cursor:
+        map_rows = [list(row) for row in cursor]
+    del cursor
+    input_schema = _fieldSchema(input_dataset)
+    output_schema = _fieldSchema(output_dataset)
+    key = hashlib.sha1(json.dumps([map_rows, input_schema, output_schema],
+                                  sort_keys=True).encode("utf-8")).hexdigest()
+    cache_file = os.path.join(CACHE_FOLDER, "fieldmaps", key + ".json")
+    if os.path.isfile(cache_file):
+        with open(cache_file) as f:
+            return json.load(f)
+
+    plan = compileFieldMapPlan(map_rows, input_schema, output_schema)
+    writeCacheFile(cache_file, json.dumps(plan, sort_keys=True))
+    return plan
+
+
+def buildFieldMappings(plan, input_dataset):
+    fm = arcpy.FieldMappings()
+    for field in plan["fields"]:
+        if not field["sources"]:
+            continue
         fMap = arcpy.FieldMap()
-        with arcpy.da.SearchCursor(field_map_table, fields,
-                                   """{0} = '{1}'""".format("DestinationFieldName", f)) as cursor:
-            for row in cursor:
-                # add the input field to the field map
-                fMap.addInputField(input_dataset, row[0])
-        # set the output name
+        for source in field["sources"]:
+            fMap.addInputField(input_dataset, source)
         output_field_name = fMap.outputField
-        output_field_name.name = f
+        output_field_name.name = field["destination"]
         fMap.outputField = output_field_name
-
-        # add the field map to the field mappings object
         fm.addFieldMap(fMap)
+    return fm
+
+
+def mapFields(input_dataset, output_dataset, field_map_table, use_append=False):
+    plan = loadFieldMapPlan(input_dataset, output_dataset, field_map_table)
+    checkFieldMapPlan(plan, input_dataset)
+
+    if use_append:
+        arcpy.Append_management(input_dataset, output_dataset, "NO_TEST",
+                                buildFieldMappings(plan, input_dataset))
+        return plan
+
+    # copy the rows across with the plan instead of going through Append
+    source_fields, destination_fields, transform = fieldMapTransform(plan)
+    shape = ["SHAPE@"] if hasattr(arcpy.Describe(output_dataset), "shapeType") else []
+    with arcpy.da.SearchCursor(input_dataset, shape + source_fields) as search_cursor:
+        with arcpy.da.InsertCursor(output_dataset, shape + destination_fields) as insert_cursor:
+            for row in search_cursor:
+                insert_cursor.insertRow(list(row[:len(shape)]) + transform(row[len(shape):]))
+        del insert_cursor
+    del search_cursor
+    return plan
+
+
+# attributes that make a parcel count as modified when they change
+CHANGE_FIELDS = ["SG26_CODE", "ZONING", "VSTD_DESC", "LU_LGL_STS"]
+
+
+def _fileGdbTableId(gdb, name):
+    # number of the files of a table in a file geodatabase, which is the
+    # object id of the table's row in its system catalog a00000001. Each row
+    # of the catalog is the table name, as a varuint length and UTF-8, and
+    # its format as an int32. None when the catalog can't be read that way
+    try:
+        with open(os.path.join(gdb, "a00000001.gdbtablx"), "rb") as f:
+            offsets = bytearray(f.read())
+        with open(os.path.join(gdb, "a00000001.gdbtable"), "rb") as f:
+            rows = bytearray(f.read())
+    except (IOError, OSError):
+        return None
+    if len(offsets) < 16:
+        return None
+    blocks = struct.unpack("<i", bytes(offsets[4:8]))[0]
+    offset_size = struct.unpack("<i", bytes(offsets[12:16]))[0]
+    for oid in range(1, blocks * 1024 + 1):
+        entry = offsets[16 + (oid - 1) * offset_size:16 + oid * offset_size]
+        if len(entry) < offset_size:
+            break
+        offset = sum(byte << (8 * i) for i, byte in enumerate(entry))
+        if not offset or offset + 4 > len(rows):
+            continue
+        size = struct.unpack("<i", bytes(rows[offset:offset + 4]))[0]
+        row = rows[offset + 4:offset + 4 + size]
+        length, shift, position = 0, 0, 0
+        while position < len(row):
+            length |= (row[position] & 0x7F) << shift
+            shift += 7
+            position += 1
+            if not row[position - 1] & 0x80:
+                break
+        if position + length + 4 != len(row):
+            continue
+        if bytes(row[position:position + length]).decode("utf-8", "replace").upper() == name.upper():
+            return oid
+    return None
+
+
+def _datasetStamp(dataset):
+    # latest modified time of the files of the dataset. In a file geodatabase
+    # those are the files of its table, so opening the geodatabase or editing
+    # another feature class doesn't change it, and the whole geodatabase but
+    # its lock files when the table can't be found in the catalog
+    path = dataset
+    while path and not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+    if not path:
+        return None
+    if os.path.isdir(path):
+        names = [f for f in os.listdir(path) if not f.lower().endswith(".lock")]
+        if path != dataset:
+            table_id = _fileGdbTableId(path, os.path.basename(dataset))
+            if table_id is not None:
+                prefix = "a{:08x}.".format(table_id)
+                names = [f for f in names if f.lower().startswith(prefix)]
+        if not names:
+            return os.path.getmtime(path)
+        return max(os.path.getmtime(os.path.join(path, f)) for f in names)
+    # a shapefile keeps its attributes and index next to the .shp
+    stem = os.path.splitext(os.path.basename(path))[0]
+    folder = os.path.dirname(path) or "."
+    files = [os.path.join(folder, f) for f in os.listdir(folder) if os.path.splitext(f)[0] == stem]
+    return max([os.path.getmtime(f) for f in files] + [os.path.getmtime(path)])
+
+
+def _fieldName(fields, name):
+    # the field as it is spelt in the dataset
+    for field in fields:
+        if field.upper() == name.upper():
+            return field
+    raise ValueError("{} has no {} field".format(fields, name))
 
-    # perform the append
-    arcpy.Append_management(input_dataset, output_dataset, "NO_TEST", fm)
 
+def extractCadastreChanges(existing_dataset, update_dataset, changes_dataset, key_field="SL_LAND_PR",
+                           attribute_fields=None, precision=FINGERPRINT_PRECISION, pool=None, batch_size=100000):
+    """
+    Finds the parcels added, removed and modified since the last delivery and
+    copies the added ones to a new feature class, reading the update once
+
+    Only the keys are compared first. When the update has no new keys the
+    changes feature class is left empty and no geometry is read at all.
+    Otherwise the fingerprints of the existing dataset come from the index
+    saved when it was the update of the previous run, and are only read from
+    the dataset again when its row count, modified time or the fingerprint
+    settings differ.
+
+    Args:
+        existing_dataset (str): the last delivery
+        update_dataset (str): the new delivery
+        changes_dataset (str): feature class created for the features whose
+            key is not in the last delivery
+        key_field (str): the parcel key, SL_LAND_PR by default
+        attribute_fields (list): attributes fingerprinted with the geometry,
+            the CHANGE_FIELDS found in the update by default
+        precision (float): grid the coordinates are compared on
+        pool (WorkerPool): processes the features are fingerprinted in, a
+            batch at a time split into tiles, this one when None
+        batch_size (int): features read before they are fingerprinted
+
+    Returns:
+        added (list): new keys
+        removed (list): keys no longer delivered
+        modified (list): keys whose geometry or attributes changed, None when
+            there were no new keys and the geometry was not read
+    """
+    existing_path = arcpy.Describe(existing_dataset).catalogPath
+    update_path = arcpy.Describe(update_dataset).catalogPath
+    copy_fields = [f.name for f in arcpy.ListFields(update_path) if f.type not in ("OID", "Geometry") and f.editable]
+    if attribute_fields is None:
+        attribute_fields = [f for f in CHANGE_FIELDS if f.upper() in [c.upper() for c in copy_fields]]
+    key_field = _fieldName(copy_fields, key_field)
+    attribute_fields = [_fieldName(copy_fields, f) for f in attribute_fields]
+    settings = {"key": key_field.upper(), "fields": [f.upper() for f in attribute_fields], "precision": precision}
+
+    index = FingerprintIndex(fingerprintIndexPath(existing_path))
+    count = int(arcpy.GetCount_management(existing_path).getOutput(0))
+    metadata = index.metadata()
+    index_valid = (metadata.get("settings") == settings and metadata.get("count") == count and
+                   metadata.get("stamp") == _datasetStamp(existing_path))
+
+    # compare the keys alone first, most deliveries add no parcels
+    previous_keys = index.keys() if index_valid else readKeys(existing_path, key_field)[0]
+    current_keys, null_keys = readKeys(update_path, key_field)
+    out_path, out_name = os.path.split(changes_dataset)
+    arcpy.CreateFeatureclass_management(out_path, out_name, "POLYGON", update_path, "DISABLED", "DISABLED",
+                                        arcpy.Describe(update_path).spatialReference)
+    if len(newKeys(previous_keys, current_keys)) == 0 and null_keys == 0:
+        index.close()
+        return [], newKeys(current_keys, previous_keys).tolist(), None
+
+    # fingerprints of the last delivery
+    if index_valid:
+        previous = index.load()
+    else:
+        previous = fingerprintTable(existing_path, key_field, attribute_fields, precision, pool=pool,
+                                    batch_size=batch_size)
+        index.save(previous, settings=settings, count=count, stamp=_datasetStamp(existing_path))
+    index.close()
+
+    # stream the update, fingerprinting every feature and copying the new ones
+    key_position = copy_fields.index(key_field) + 1
+    attribute_positions = [copy_fields.index(f) + 1 for f in attribute_fields]
+    current = {}
+    count = 0
+    keys = []
+    features = []
+
+    def fingerprintBatch():
+        for key, fingerprint in zip(keys, fingerprintFeatures(features, precision, pool)):
+            addFingerprint(current, key, fingerprint)
+        del keys[:], features[:]
+
+    with arcpy.da.SearchCursor(update_path, ["SHAPE@"] + copy_fields) as search_cursor:
+        with arcpy.da.InsertCursor(changes_dataset, ["SHAPE@"] + copy_fields) as insert_cursor:
+            for row in search_cursor:
+                count += 1
+                key = row[key_position]
+                if key is None or key not in previous:
+                    insert_cursor.insertRow(row)
+                if key is not None:
+                    keys.append(key)
+                    features.append((ringsFromGeometry(row[0]), [row[i] for i in attribute_positions]))
+                    if len(features) == batch_size:
+                        fingerprintBatch()
+        del insert_cursor
+    del search_cursor
+    fingerprintBatch()
+
+    # the update is the existing dataset of the next run
+    index = FingerprintIndex(fingerprintIndexPath(update_path))
+    index.save(current, settings=settings, count=count, stamp=_datasetStamp(update_path))
+    index.close()
+    return diffFingerprints(previous, current)
+
+
+# AddField type of every ListFields type a snapshot can be read back with
+ADD_FIELD_TYPES = {"String": "TEXT", "Integer": "LONG", "SmallInteger": "SHORT", "Double": "DOUBLE",
+                   "Single": "FLOAT", "Date": "DATE", "GUID": "GUID"}
+
+
+def geometryFromRings(rings, spatial_reference=None):
+    # arcpy polygon from the rings ringsFromGeometry returns
+    return arcpy.Polygon(arcpy.Array([arcpy.Array([arcpy.Point(x, y) for x, y in ring]) for ring in rings]),
+                         spatial_reference)
+
+
+def ingestDelivery(store_path, dataset, name=None, key_field="SL_LAND_PR", fields=None,
+                   precision=FINGERPRINT_PRECISION):
+    """
+    Adds a delivery to a SnapshotStore as its latest snapshot, storing only
+    the parcels that changed since the delivery before it
+
+    Args:
+        store_path (str): the store, created if it doesn't exist
+        dataset (str): the delivery
+        name (str): name of the snapshot, the name of the dataset by default
+        key_field (str): the parcel key, SL_LAND_PR by default
+        fields (list): fields to keep, every editable field by default
+        precision (float): grid the coordinates are compared on
+
+    Returns:
+        added, removed, modified (list): keys compared to the previous
+            snapshot, see SnapshotStore.ingest. None when the store already
+            has a snapshot of that name
+    """
+    path = arcpy.Describe(dataset).catalogPath
+    editable = [f for f in arcpy.ListFields(path) if f.type not in ("OID", "Geometry") and f.editable]
+    names = [f.name for f in editable]
+    fields = names if fields is None else [_fieldName(names, f) for f in fields]
+    key_field = _fieldName(names, key_field)
+    field_types = dict((f.name, (f.type, f.length)) for f in editable if f.name in fields)
+    spatial_reference = arcpy.Describe(path).spatialReference
+    store = SnapshotStore(store_path)
+    try:
+        name = name or os.path.basename(path)
+        if name in [snapshot["name"] for snapshot in store.snapshots()]:
+            return None
+        with arcpy.da.SearchCursor(path, ["SHAPE@", key_field] + fields) as cursor:
+            changes = store.ingest(name, ((row[1], ringsFromGeometry(row[0]), row[2:]) for row in cursor),
+                                   fields, field_types, precision, spatial_reference=(
+                                       spatial_reference.exportToString() if spatial_reference else None))
+        del cursor
+    finally:
+        store.close()
+    return changes
+
+
+def _dateValue(value):
+    # snapshots keep dates as text
+    if isinstance(value, string_types):
+        return datetime.datetime.strptime(value[:19], "%Y-%m-%d %H:%M:%S" if len(value) > 10 else "%Y-%m-%d")
+    return value
+
+
+def materializeSnapshot(store_path, name, output, keys=None):
+    """
+    Writes a snapshot of a SnapshotStore to a new feature class
+
+    Args:
+        store_path (str): the store
+        name (str): the snapshot
+        output (str): feature class created with the fields and spatial
+            reference of the snapshot
+        keys (iterable): only write these keys, eg the added and modified
+            keys of SnapshotStore.diff
+
+    Returns:
+        count (int): number of features written
+    """
+    store = SnapshotStore(store_path)
+    try:
+        fields, field_types = store.fields(name)
+        spatial_reference = None
+        if store.metadata(name).get("spatial_reference"):
+            spatial_reference = arcpy.SpatialReference()
+            spatial_reference.loadFromString(store.metadata(name)["spatial_reference"])
+        out_path, out_name = os.path.split(output)
+        arcpy.CreateFeatureclass_management(out_path, out_name, "POLYGON", spatial_reference=spatial_reference)
+        for field in fields:
+            field_type, length = field_types.get(field, ("String", 255))
+            arcpy.AddField_management(output, field, ADD_FIELD_TYPES.get(field_type, "TEXT"), field_length=length)
+        dates = [i for i, field in enumerate(fields) if field_types.get(field, ("String",))[0] == "Date"]
+        count = 0
+        with arcpy.da.InsertCursor(output, ["SHAPE@"] + fields) as cursor:
+            for key, rings, values in store.materialize(name, keys):
+                for i in dates:
+                    values[i] = _dateValue(values[i])
+                cursor.insertRow([geometryFromRings(rings, spatial_reference)] + values)
+                count += 1
+        del cursor
+    finally:
+        store.close()
+    return count
+
+
+def referenceIndex(dataset, spatial_reference=None):
+    """
+    Packed R-tree of the extents of a reference dataset such as the roads or
+    the master cadastre, with the object ids as values
+
+    The tree is saved in the cache the first time and memory mapped back by
+    later runs of any tool that read it in the same coordinate system, until
+    the row count or modified time of the dataset changes.
+
+    Args:
+        dataset (str): feature class or layer
+        spatial_reference (SpatialReference): coordinate system the extents
+            are in, the dataset's own when None
+
+    Returns:
+        index (PackedRTree): query it with an extent for the object ids
+    """
+    path = arcpy.Describe(dataset).catalogPath
+    projection = spatial_reference.exportToString() if spatial_reference is not None else ""
+    key = {"source": os.path.normcase(os.path.abspath(path)), "stamp": _datasetStamp(path),
+           "count": int(arcpy.GetCount_management(path).getOutput(0)), "spatial_reference": projection}
+    index_path = spatialIndexPath(path, projection)
+    index = loadSpatialIndex(index_path, **key)
+    if index is None:
+        extents = []
+        oids = []
+        with arcpy.da.SearchCursor(path, ["OID@", "SHAPE@"], spatial_reference=spatial_reference) as cursor:
+            for row in cursor:
+                extent = ringsExtent(ringsFromGeometry(row[1]))
+                if extent is not None:
+                    extents.append(extent)
+                    oids.append(row[0])
+        del cursor
+        index = PackedRTree.build(extents, oids)
+        saveSpatialIndex(index_path, index, **key)
+    return index
+
+
+def _shapes(dataset, oids=None, spatial_reference=None, batch_size=1000):
+    # rings or paths of every feature of a dataset, or of the ones with these
+    # object ids, read one at a time in spatial_reference
+    if oids is None:
+        with arcpy.da.SearchCursor(dataset, ["SHAPE@"], spatial_reference=spatial_reference) as cursor:
+            for row in cursor:
+                yield ringsFromGeometry(row[0])
+        del cursor
+        return
+    oid_field = arcpy.AddFieldDelimiters(dataset, arcpy.Describe(dataset).OIDFieldName)
+    oids = sorted(oids)
+    for i in range(0, len(oids), batch_size):
+        where_clause = "{} IN ({})".format(oid_field, ", ".join(str(oid) for oid in oids[i:i + batch_size]))
+        with arcpy.da.SearchCursor(dataset, ["SHAPE@"], where_clause, spatial_reference=spatial_reference) as cursor:
+            for row in cursor:
+                yield ringsFromGeometry(row[0])
+        del cursor
+
+
+def _candidateShapes(dataset, extents, spatial_reference=None):
+    # the shapes of a reference dataset that may touch any of the extents,
+    # found with its cached index rather than by reading all of it. The
+    # extents and the shapes are in spatial_reference
+    index = referenceIndex(dataset, spatial_reference)
+    oids = set(index.queryMany(extents)[1].tolist())
+    # reading everything is quicker than many small queries once most match
+    if len(oids) > index.size // 2:
+        return _shapes(dataset, spatial_reference=spatial_reference)
+    return _shapes(dataset, oids, spatial_reference)
+
+
+def classifyCadastreChanges(changes_dataset, roads_dataset, master_dataset, outputs, area_threshold=3.0,
+                            pool=None):
+    """
+    Sorts the changes into road reserves, slivers, overlaps and legitimate
+    changes, writing all four outputs in one pass. Only the roads and master
+    parcels the cached indexes of referenceIndex place near a change are read
+
+    Args:
+        changes_dataset (str): the formatted changes, with an AREA field
+        roads_dataset (str): roads, polygons or polylines
+        master_dataset (str): the current master cadastre
+        outputs (dict): feature class to create for each of ROADRESERVE,
+            SLIVER, OVERLAP and LEGITIMATE. Each gets a CHANGE_FLAGS field
+            listing every flag of the feature, a feature is written to the
+            output of its first flag only
+        area_threshold (float): changes with a smaller AREA are slivers
+        pool (WorkerPool): processes the changes are classified in tile by
+            tile, see classifyChangesByTile, this one when None
+
+    Returns:
+        counts (dict): number of features written to each output
+    """
+    fields = [f.name for f in arcpy.ListFields(changes_dataset) if f.type not in ("OID", "Geometry") and f.editable]
+    area_field = _fieldName(fields, "AREA")
+    with arcpy.da.SearchCursor(changes_dataset, ["OID@", "SHAPE@", area_field]) as cursor:
+        changes = [(row[0], ringsFromGeometry(row[1]), row[2]) for row in cursor]
+    del cursor
+    road_lines = arcpy.Describe(roads_dataset).shapeType == "Polyline"
+    extents = [extent for extent in (ringsExtent(rings) for oid, rings, area in changes) if extent is not None]
+    # the roads and master parcels are read in the coordinate system of the changes
+    spatial_reference = arcpy.Describe(changes_dataset).spatialReference
+    flags = classifyChangesByTile(changes, _candidateShapes(roads_dataset, extents, spatial_reference),
+                                  _candidateShapes(master_dataset, extents, spatial_reference), area_threshold,
+                                  road_lines, pool)
+
+    cursors = {}
+    counts = {}
+    try:
+        for category, output in outputs.items():
+            out_path, out_name = os.path.split(output)
+            arcpy.CreateFeatureclass_management(out_path, out_name, "POLYGON", changes_dataset, "DISABLED",
+                                                "DISABLED", spatial_reference)
+            arcpy.AddField_management(output, "CHANGE_FLAGS", "TEXT", field_length=50)
+            cursors[category] = arcpy.da.InsertCursor(output, ["SHAPE@"] + fields + ["CHANGE_FLAGS"])
+            counts[category] = 0
+        with arcpy.da.SearchCursor(changes_dataset, ["OID@", "SHAPE@"] + fields) as cursor:
+            for row in cursor:
+                category = changeCategory(flags[row[0]])
+                cursors[category].insertRow(list(row[1:]) + [";".join(flags[row[0]])])
+                counts[category] += 1
+        del cursor
+    finally:
+        # dropping the insert cursors releases their locks
+        cursors.clear()
+    return counts
+
+
+def analyzeDuplicates(dataset, stages, precision=FINGERPRINT_PRECISION, pool=None):
+    """
+    Reads a dataset once and runs a chain of identical feature checks on it,
+    replacing consecutive FindIdentical and DeleteIdentical calls
+
+    Args:
+        dataset (str): feature class or layer
+        stages (list): (name, fields, action) tuples, see findDuplicates.
+            SHAPE compares the geometries on a grid of the given precision
+        precision (float): the xy tolerance of the geometry comparison
+        pool (WorkerPool): processes the geometries are fingerprinted in tile
+            by tile, this one when None. The groups are always found over the
+            whole dataset as duplicate keys may be far apart
+
+    Returns:
+        results (list): the result of every stage, see findDuplicates
+    """
+    fields = []
+    for name, stage_fields, action in stages:
+        fields.extend(f for f in stage_fields if f != "SHAPE" and f not in fields)
+    use_shape = any("SHAPE" in stage_fields for name, stage_fields, action in stages)
+    records = []
+    shapes = []
+    with arcpy.da.SearchCursor(dataset, ["OID@"] + (["SHAPE@"] if use_shape else []) + fields) as cursor:
+        for row in cursor:
+            records.append((row[0], dict(zip(fields, row[2:] if use_shape else row[1:]))))
+            if use_shape:
+                shapes.append((ringsFromGeometry(row[1]), ()))
+    del cursor
+    if use_shape:
+        for (oid, values), fingerprint in zip(records, fingerprintFeatures(shapes, precision, pool)):
+            values["SHAPE"] = fingerprint
+    return findDuplicates(records, stages)
+
+
+def _addDuplicateFields(table):
+    arcpy.AddField_management(table, "IN_FID", "LONG")
+    arcpy.AddField_management(table, "FEAT_SEQ", "LONG")
+
+
+def writeDuplicateReport(groups, report_table):
+    # IN_FID and FEAT_SEQ table like the one FindIdentical writes
+    out_path, out_name = os.path.split(report_table)
+    arcpy.CreateTable_management(out_path, out_name)
+    _addDuplicateFields(report_table)
+    with arcpy.da.InsertCursor(report_table, ["IN_FID", "FEAT_SEQ"]) as cursor:
+        for feat_seq, group in enumerate(groups, 1):
+            for oid in group:
+                cursor.insertRow([oid, feat_seq])
+    del cursor
+
+
+def copyDuplicateGroups(dataset, groups, output):
+    # every member of the groups with its IN_FID and FEAT_SEQ, in one pass
+    members = dict((oid, feat_seq) for feat_seq, group in enumerate(groups, 1) for oid in group)
+    fields = [f.name for f in arcpy.ListFields(dataset) if f.type not in ("OID", "Geometry") and f.editable]
+    description = arcpy.Describe(dataset)
+    out_path, out_name = os.path.split(output)
+    arcpy.CreateFeatureclass_management(out_path, out_name, description.shapeType.upper(), dataset,
+                                        "DISABLED", "DISABLED", description.spatialReference)
+    _addDuplicateFields(output)
+    with arcpy.da.SearchCursor(dataset, ["OID@", "SHAPE@"] + fields) as search_cursor:
+        with arcpy.da.InsertCursor(output, ["SHAPE@"] + fields + ["IN_FID", "FEAT_SEQ"]) as insert_cursor:
+            for row in search_cursor:
+                if row[0] in members:
+                    insert_cursor.insertRow(list(row[1:]) + [row[0], members[row[0]]])
+        del insert_cursor
+    del search_cursor
+
+
+def deleteRows(dataset, oids):
+    # delete the rows with these object ids in one pass
+    if not oids:
+        return
+    with arcpy.da.UpdateCursor(dataset, ["OID@"]) as cursor:
+        for row in cursor:
+            if row[0] in oids:
+                cursor.deleteRow()
+    del cursor
+
+
+def _toleranceKey(spatial_reference):
+    # what CheckGeometry results depend on besides the geometry
+    if spatial_reference is None:
+        return ""
+    return "{}|{!r}|{!r}".format(spatial_reference.name, spatial_reference.XYTolerance,
+                                 spatial_reference.XYResolution)
+
+
+def checkGeometry(dataset, report_table, batch_size=1000):
+    """
+    Runs CheckGeometry on only the features of a dataset whose geometry has
+    not been found valid before, with the same tolerances, by an earlier run
+
+    Args:
+        dataset (str): feature class or layer to check
+        report_table (str): the CheckGeometry report, deleted when there are
+            no problems
+        batch_size (int): object ids in the where clause of each layer
+            CheckGeometry is run on
+
+    Returns:
+        problems (dict): object id to the problems of every feature with any
+    """
+    description = arcpy.Describe(dataset)
+    settings = _toleranceKey(description.spatialReference)
+    hashes = {}
+    with arcpy.da.SearchCursor(dataset, ["OID@", "SHAPE@WKB"]) as cursor:
+        for oid, wkb in cursor:
+            hashes[oid] = None if wkb is None else geometryHash(wkb)
+    del cursor
+    cache = GeometryCache(geometryCachePath())
+    valid = cache.lookup(settings, [key for key in hashes.values() if key is not None])
+    unchecked = sorted(oid for oid, key in hashes.items() if key is None or key not in valid)
+
+    problems = {}
+    if unchecked:
+        # checking everything is quicker than many small layers once most are new
+        layers = []
+        if len(unchecked) > len(hashes) // 2:
+            check_features = [dataset]
+        else:
+            oid_field = arcpy.AddFieldDelimiters(description.catalogPath, description.OIDFieldName)
+            for i in range(0, len(unchecked), batch_size):
+                layer = "lyr_geometry_check_{}".format(len(layers))
+                arcpy.MakeFeatureLayer_management(description.catalogPath, layer, "{} IN ({})".format(
+                    oid_field, ", ".join(str(oid) for oid in unchecked[i:i + batch_size])))
+                layers.append(layer)
+            check_features = layers
+        arcpy.CheckGeometry_management(check_features, report_table)
+        for layer in layers:
+            arcpy.Delete_management(layer)
+        with arcpy.da.SearchCursor(report_table, ["FEATURE_ID", "PROBLEM"]) as cursor:
+            for oid, problem in cursor:
+                problems.setdefault(oid, []).append(problem)
+        del cursor
+        cache.add(settings, set(hashes[oid] for oid in unchecked if oid not in problems and hashes[oid] is not None))
+    cache.close()
+    if not problems and arcpy.Exists(report_table):
+        arcpy.Delete_management(report_table)
+    return problems
+
+
+def repairGeometry(dataset, oids, batch_size=1000):
+    # RepairGeometry on only the features with these object ids, through a
+    # layer limited to a batch of them at a time
+    description = arcpy.Describe(dataset)
+    oid_field = arcpy.AddFieldDelimiters(description.catalogPath, description.OIDFieldName)
+    oids = sorted(oids)
+    for i in range(0, len(oids), batch_size):
+        where_clause = "{} IN ({})".format(oid_field, ", ".join(str(oid) for oid in oids[i:i + batch_size]))
+        arcpy.MakeFeatureLayer_management(description.catalogPath, "lyr_geometry_repair", where_clause)
+        arcpy.RepairGeometry_management("lyr_geometry_repair")
+        arcpy.Delete_management("lyr_geometry_repair")
+
+
+def joinFields(dataset, key_field, table, table_key_field, fields):
+    """
+    Joins fields of a table, such as a CSV, dBASE or geodatabase table, onto a
+    dataset by key with one read of each, in place of copying the table and
+    running JoinField
+
+    The table is read into a lookup, see buildLookup, and the fields are
+    added to the dataset and filled in one update pass. Features without a
+    match get nulls.
+
+    Args:
+        dataset (str): feature class, table or layer updated in place
+        key_field (str): key of the dataset, eg SL_LAND_PR
+        table (str): table the values come from
+        table_key_field (str): key of the table, eg LISKEY
+        fields (list): fields of the table to join
+
+    Returns:
+        statistics (dict): number of features that matched and that did
+            not, of table keys no feature matched, and of table rows with a
+            repeated or missing key
+    """
+    table_fields = arcpy.ListFields(table)
+    table_names = [f.name for f in table_fields]
+    table_key_field = _fieldName(table_names, table_key_field)
+    fields = [_fieldName(table_names, field) for field in fields]
+    with arcpy.da.SearchCursor(table, [table_key_field] + fields) as cursor:
+        lookup, duplicates_num, null_num = buildLookup((row[0], row[1:]) for row in cursor)
+    del cursor
+
+    names = [f.name.upper() for f in arcpy.ListFields(dataset)]
+    for field in [f for f in table_fields if f.name in fields]:
+        if field.name.upper() not in names:
+            arcpy.AddField_management(dataset, field.name, ADD_FIELD_TYPES.get(field.type, "TEXT"),
+                                      field_length=field.length)
+    matched = set()
+    matched_num = 0
+    unmatched_num = 0
+    empty = [None] * len(fields)
+    with arcpy.da.UpdateCursor(dataset, [key_field] + fields) as cursor:
+        for row in cursor:
+            key = joinKey(row[0])
+            values = lookup.get(key)
+            if values is None:
+                unmatched_num += 1
+                values = empty
+            else:
+                matched_num += 1
+                matched.add(key)
+            cursor.updateRow([row[0]] + list(values))
+    del cursor
+    return {"matched": matched_num, "unmatched": unmatched_num,
+            "unused": len(lookup) - len(matched), "duplicates": duplicates_num, "null_keys": null_num}
+
+
+def resolveIdenticalGeometries(dataset, output, group_field="FEAT_SEQ"):
+    """
+    Writes the features to keep of every group of identical geometries, see
+    resolveIdenticalGroup, reading the groups once and writing the kept
+    features with one insert cursor
+
+    Args:
+        dataset (str): identical geometries with SL_LAND_PR, Total_BillCount,
+            LU_LGL_STS and the group field, as written by copyDuplicateGroups
+        output (str): existing feature class or layer the kept features are
+            added to, with the fields it shares with the dataset
+        group_field (str): the field numbering the groups
+
+    Returns:
+        groups_num, kept_num (int): number of groups and of features kept
+    """
+    fields = [f.name for f in arcpy.ListFields(dataset) if f.type not in ("OID", "Geometry") and f.editable]
+    positions = [fields.index(_fieldName(fields, name)) for name in
+                 [group_field, "SL_LAND_PR", "Total_BillCount", "LU_LGL_STS"]]
+    groups = {}
+    order = []
+    rows = {}
+    with arcpy.da.SearchCursor(dataset, ["OID@", "SHAPE@"] + fields) as cursor:
+        for row in cursor:
+            group, liskey, bill_count, legal_status = [row[2 + i] for i in positions]
+            if group not in groups:
+                groups[group] = []
+                order.append(group)
+            groups[group].append((row[0], liskey, bill_count, legal_status))
+            rows[row[0]] = row[1:]
+    del cursor
+    output_fields = [f.name for f in arcpy.ListFields(output)
+                     if f.type not in ("OID", "Geometry") and f.editable and f.name in fields]
+    output_positions = [1 + fields.index(f) for f in output_fields]
+    kept_num = 0
+    with arcpy.da.InsertCursor(output, ["SHAPE@"] + output_fields) as cursor:
+        for group in order:
+            for oid in resolveIdenticalGroup(groups[group]):
+                row = rows[oid]
+                cursor.insertRow([row[0]] + [row[i] for i in output_positions])
+                kept_num += 1
+    del cursor
+    return len(order), kept_num
+
+
+# Service Layer Cleanup sorts the cadastre with rule tables of (name,
+# disposition, conditions), see evaluateRules. A feature takes the disposition
+# of the first rule it meets and is kept when it meets none. ROADS is true for
+# features that intersect a road and AREA is the area of the feature in the
+# units of its coordinate system, square metres for the cadastre
+
+# deleted before the duplicates are looked for
+CLEANUP_RULES = [
+    ("road reserves that are not billed", "delete",
+     [("ROADS", "=", True), ("Total_BillCount", "IS NULL", None)]),
+    ("sliver polygons that are not billed", "delete",
+     [("AREA", "<", 15), ("Total_BillCount", "IS NULL", None)])] + [
+    ("features where Vested Description is Substation, Waterway, Railway or Unset or Roadway that is also zoned as transport",
+     "delete", conditions) for conditions in [
+        [("VSTD_DESC", "IN", ["Substation", "Waterway", "Railway", "Unset"])],
+        [("VSTD_DESC", "=", "Roadway"), ("ZONING", "LIKE", "%Transport%")],
+        [("VSTD_DESC", "=", "Roadway"), ("ZONING", "=", "")]]] + [
+    ("zoning cases that contain \" Transport \"", "delete", [("ZONING", "LIKE", "% Transport %")])]
+
+# zoning cases that start with Transport and are being billed, and those that
+# contain Transport and any of Community, Mixed, Residential or Business and
+# are not billed. Also applied to the features copied out as duplicates
+ZONING_RULES = [
+    ("zoning cases that start with \"Transport\" and are being billed", "Zoning_Case_A",
+     [("ZONING", "LIKE", "Transport%"), ("Total_BillCount", "IS NOT NULL", None)]),
+    ("zoning cases that start with \"Transport\" and are not billed", "delete",
+     [("ZONING", "LIKE", "Transport%")])] + [
+    ("zoning cases that contain \"Transport\" and any of Community, Mixed Use, Residential or Business",
+     "Zoning_Case_B", [("ZONING", "LIKE", "%Transport%"), ("ZONING", "LIKE", "%{}%".format(zoning)),
+                       ("Total_BillCount", "IS NULL", None)])
+    for zoning in ["Community", "Mixed", "Residential", "Business"]]
+
+# isolated once the duplicates are removed
+SERVICE_LAYER_RULES = [
+    ("road reserves being billed", "Road_Reserves", [("ROADS", "=", True)]),
+    ("sliver polygons being billed", "Sliver_Polygons", [("AREA", "<", 15)])] + ZONING_RULES + [
+    ("other zoning cases that contain \"Transport\"", "delete", [("ZONING", "LIKE", "%Transport%")])]
+
+
+def _ruleFields(rules):
+    # the fields the conditions of the rules read
+    fields = []
+    for name, disposition, conditions in rules:
+        fields.extend(field for field, operator, value in conditions if field not in fields)
+    return fields
+
+
+def _ruleColumns(dataset, fields, tokens=()):
+    # object ids, the values of the tokens and the fields as columns, read in one pass
+    names = [f.name for f in arcpy.ListFields(dataset)]
+    field_types = dict((f.name.upper(), f.type) for f in arcpy.ListFields(dataset))
+    fields = [_fieldName(names, field) for field in fields]
+    with arcpy.da.SearchCursor(dataset, ["OID@"] + list(tokens) + fields) as cursor:
+        rows = [row for row in cursor]
+    del cursor
+    oids = [row[0] for row in rows]
+    token_values = [[row[1 + i] for row in rows] for i in range(len(tokens))]
+    chunk = chunkToArray([row[1 + len(tokens):] for row in rows], fields, field_types)
+    return oids, token_values, dict((field.upper(), chunk[field]) for field in fields)
+
+
+def _upperRules(rules):
+    # field names are matched whatever their case
+    return [(name, disposition, [(field.upper(), operator, value) for field, operator, value in conditions])
+            for name, disposition, conditions in rules]
+
+
+def assignDispositions(dataset, roads_dataset, rules, early_rules=(), pool=None):
+    """
+    Gives every feature of a dataset its disposition from a rule table in a
+    single read of the dataset, writing it to a DISPOSITION field along with
+    the AREA of the feature in square metres
+
+    Args:
+        dataset (str): feature class or layer
+        roads_dataset (str): roads, polygons or polylines, for the ROADS
+            conditions. Only the roads the cached index of referenceIndex
+            places near a feature are read
+        rules (list): (name, disposition, conditions) tuples, see evaluateRules
+        early_rules (list): rules evaluated ahead of rules in the same pass.
+            The features they match are deleted straight away, so steps run
+            before the dispositions are acted on never see them
+        pool (WorkerPool): processes the road check runs in tile by tile,
+            see classifyChangesByTile, this one when None
+
+    Returns:
+        counts (dict): number of features decided by the rules of each name
+    """
+    all_rules = list(early_rules) + list(rules)
+    fields = [field for field in _ruleFields(all_rules) if field.upper() not in ("ROADS", "AREA")]
+    names = [f.name.upper() for f in arcpy.ListFields(dataset)]
+    if "AREA" not in names:
+        arcpy.AddField_management(dataset, "AREA", "DOUBLE")
+    if "DISPOSITION" not in names:
+        arcpy.AddField_management(dataset, "DISPOSITION", "TEXT", field_length=20)
+    oids, (shapes,), columns = _ruleColumns(dataset, fields, ["SHAPE@"])
+    areas = [shapeArea(shape) for shape in shapes]
+    columns["AREA"] = numpy.array([numpy.nan if area is None else area for area in areas], dtype=numpy.float64)
+
+    features = [(oid, ringsFromGeometry(shape), 0.0) for oid, shape in zip(oids, shapes)]
+    del shapes
+    extents = [extent for extent in (ringsExtent(rings) for oid, rings, area in features) if extent is not None]
+    # the roads are read in the coordinate system of the dataset
+    spatial_reference = arcpy.Describe(dataset).spatialReference
+    roads = list(_candidateShapes(roads_dataset, extents, spatial_reference)) if extents else []
+    road_lines = arcpy.Describe(roads_dataset).shapeType == "Polyline"
+
+    # the road check and the attribute checks are independent until the
+    # dispositions are decided, so they run side by side
+    upper_rules = _upperRules(all_rules)
+    road_rules = [i for i, rule in enumerate(upper_rules) if "ROADS" in [c[0] for c in rule[2]]]
+    attribute_rules = [i for i in range(len(upper_rules)) if i not in road_rules]
+
+    def roadCheck(features, roads):
+        # the features that touch a road, found with the features indexed and
+        # the nearby roads streamed past them, tile by tile in the pool
+        flags = classifyChangesByTile(features, roads, [], 0.0, road_lines, pool) if roads else {}
+        return numpy.array(["ROADRESERVE" in flags.get(oid, []) for oid, rings, area in features], dtype=bool)
+
+    def decide(attribute_masks, road_masks):
+        masks = dict(zip(attribute_rules, attribute_masks))
+        masks.update(zip(road_rules, road_masks))
+        return mergeRuleMasks([masks[i] for i in range(len(upper_rules))], len(oids))
+
+    graph = StageGraph()
+    graph.add("Road check", roadCheck, ["features", "roads"], ["roads_flags"])
+    graph.add("Attribute checks", lambda columns: ruleMasks(columns, [upper_rules[i] for i in attribute_rules]),
+              ["columns"], ["attribute_masks"])
+    graph.add("Road rules", lambda columns, flags: ruleMasks(dict(columns, ROADS=flags),
+                                                             [upper_rules[i] for i in road_rules]),
+              ["columns", "roads_flags"], ["road_masks"])
+    graph.add("Decision", decide, ["attribute_masks", "road_masks"], ["matched"])
+    matched = graph.run({"features": features, "roads": roads, "columns": columns})["matched"]
+    del features, roads
+
+    dispositions = ruleDispositions(matched, all_rules).tolist()
+    early = (matched >= 0) & (matched < len(early_rules))
+    values = dict((oid, (area, disposition, delete)) for oid, area, disposition, delete in
+                  zip(oids, areas, dispositions, early.tolist()))
+    with arcpy.da.UpdateCursor(dataset, ["OID@", "AREA", "DISPOSITION"]) as cursor:
+        for row in cursor:
+            area, disposition, delete = values[row[0]]
+            if delete:
+                cursor.deleteRow()
+            else:
+                cursor.updateRow([row[0], area, disposition])
+    del cursor
+    return ruleCounts(matched, all_rules)
+
+
+def writeDispositions(dataset, outputs, template=None, rules=None):
+    """
+    Moves every feature of a dataset that isn't to be kept out of it in one
+    pass, writing it to the output of its disposition
+
+    Args:
+        dataset (str): feature class or layer with a DISPOSITION field, see
+            assignDispositions
+        outputs (dict): feature class for each disposition written out,
+            created from the template if it doesn't exist and appended to
+            otherwise. Features whose disposition has no output are deleted
+        template (str): schema of the outputs, the dataset by default. The
+            DISPOSITION field is left out of them
+        rules (list): work the dispositions out from these rules rather than
+            reading them, see evaluateRules. The rules can't use ROADS
+
+    Returns:
+        counts (dict): number of features of each disposition moved out
+    """
+    fields = [f.name for f in arcpy.ListFields(dataset) if f.type not in ("OID", "Geometry") and f.editable]
+    if rules is None:
+        position = fields.index(_fieldName(fields, "DISPOSITION"))
+        dispositions = None
+    else:
+        oids, token_values, columns = _ruleColumns(dataset, _ruleFields(rules))
+        dispositions = dict(zip(oids, ruleDispositions(evaluateRules(columns, _upperRules(rules)), rules).tolist()))
+    template = template or dataset
+    description = arcpy.Describe(template)
+    cursors = {}
+    counts = dict((disposition, 0) for disposition in outputs)
+    try:
+        for disposition, output in outputs.items():
+            if not arcpy.Exists(output):
+                out_path, out_name = os.path.split(output)
+                arcpy.CreateFeatureclass_management(out_path, out_name, description.shapeType.upper(), template,
+                                                    "DISABLED", "DISABLED", description.spatialReference)
+                if "DISPOSITION" in [f.name.upper() for f in arcpy.ListFields(output)]:
+                    arcpy.DeleteField_management(output, "DISPOSITION")
+            output_fields = [f.name for f in arcpy.ListFields(output)
+                             if f.type not in ("OID", "Geometry") and f.editable and f.name in fields]
+            cursors[disposition] = (arcpy.da.InsertCursor(output, ["SHAPE@"] + output_fields),
+                                    [2 + fields.index(f) for f in output_fields])
+        with arcpy.da.UpdateCursor(dataset, ["OID@", "SHAPE@"] + fields) as cursor:
+            for row in cursor:
+                disposition = row[2 + position] if dispositions is None else dispositions[row[0]]
+                if disposition in (None, "keep"):
+                    continue
+                if disposition in cursors:
+                    insert_cursor, positions = cursors[disposition]
+                    insert_cursor.insertRow([row[1]] + [row[i] for i in positions])
+                counts[disposition] = counts.get(disposition, 0) + 1
+                cursor.deleteRow()
+        del cursor
+    finally:
+        # dropping the insert cursors releases their locks
+        cursors.clear()
+    return counts
 
-def decodeCitySG26Code(citySG26Code_field):
-    townshipCode_field = citySG26Code_field[:4]
-    extentCode_field = citySG26Code_field[4:8]
-    erfNumber_field = citySG26Code_field[8:16].lstrip('0')
-    portionNumber_field = citySG26Code_field[16:21]
-    remainder_field = citySG26Code_field[24:]
 
-    return [townshipCode_field, extentCode_field, erfNumber_field, portionNumber_field, remainder_field]
+def gpMessage(message, messageType="Message"):
+    # geoprocessing message, printed instead when arcpy is not available
+    try:
+        add = {"Message": arcpy.AddMessage, "Warning": arcpy.AddWarning, "Error": arcpy.AddError}[messageType]
+    except ImportError:
+        print(message)
+        return
+    add(message)
 
 
 def prepareOutput(gdbFeatureClass, outputLocation, shapefileName):
@@ -180,13 +1747,13 @@ def prepareOutput(gdbFeatureClass, outputLocation, shapefileName):
 
 def showPyMessage(message, logger, messageType="Message"):
     if (messageType == "Message"):
-        arcpy.AddMessage(str(time.ctime()) + " - " + message)
+        gpMessage(str(time.ctime()) + " - " + message)
         logger.debug(message)
     if (messageType == "Warning"):
-        arcpy.AddWarning(str(time.ctime()) + " - " + message)
+        gpMessage(str(time.ctime()) + " - " + message, "Warning")
         logger.warning(message)
     if (messageType == "Error"):
-        arcpy.AddError(str(time.ctime()) + " - " + message)
+        gpMessage(str(time.ctime()) + " - " + message, "Error")
         logger.error(message)
 
 
@@ -197,5 +1764,5 @@ def handleExcept(logger):
         traceback.format_tb(sys.exc_info()[2])[0]
     showPyMessage(message, logger, "Error")
     message = "Python Error Info: " + \
-        str(sys.exc_type) + ": " + str(sys.exc_value) + "\n"
+        str(sys.exc_info()[0]) + ": " + str(sys.exc_info()[1]) + "\n"
     showPyMessage(message, logger, "Error")
@@ -18,8 +18,6 @@ try:
     startNumber = arcpy.GetParameterAsText(1)
     output_location = arcpy.GetParameterAsText(3)
 
-    rec = 0
-
     # initialize logger
     logger = ramm.defineLogger(output_location)
 
@@ -28,16 +26,17 @@ try:
         ramm.showPyMessage(message, logger)
 
     log("- Starting Process")
-    arcpy.MakeFeatureLayer_management(input_data, "lyr_input_data")
-    arcpy.AddField_management("lyr_input_data", "CPID", "TEXT")
-
-    with arcpy.da.UpdateCursor("lyr_input_data", 'CPID') as update_cursor:
-        for x in update_cursor:
-            # generate CPID
-            x[0] = ramm.populateCPID(startNumber)
-
-            update_cursor.updateRow(x)
-    del update_cursor
+    # CPIDs come from the shared sequence store so datasets can be numbered
+    # by several runs at once without colliding
+    allocator = ramm.SequenceAllocator()
+
+    for data in input_data.split(';'):
+        arcpy.AddField_management(data, "CPID", "TEXT")
+        first, last = ramm.numberDataset(data, 'CPID', 'CP', startNumber, ramm.populateCPID, allocator)
+        if first != int(startNumber):
+            log("- The CPIDs from {} are already used, {} starts from {}".format(
+                ramm.populateCPID(int(startNumber)), data, ramm.populateCPID(first)))
+        log("- Numbered {} from {} to {}".format(data, ramm.populateCPID(first), ramm.populateCPID(last)))
 
     log("- Process Complete")
 except:
@@ -39,13 +39,14 @@ try:
     log("\t --- Repairing Geometry.")
     arcpy.MakeFeatureLayer_management(
         "col_points_clipped.shp", "lyr_col_points_clipped")
-    arcpy.CheckGeometry_management(
+    geom_errors = ramm.checkGeometry(
         "lyr_col_points_clipped", "geomErrorReport.dbf")
-    no_of_errors = int(arcpy.GetCount_management(
-        "geomErrorReport.dbf").getOutput(0))
-    arcpy.RepairGeometry_management("lyr_col_points_clipped")
-    log(
-        "\t ----- {} geometry errors were found and repaired. Check geomErrorReport.dbf for details.".format(no_of_errors))
+    if geom_errors:
+        ramm.repairGeometry("lyr_col_points_clipped", geom_errors)
+        log(
+            "\t ----- {} geometry errors were found and repaired. Check geomErrorReport.dbf for details.".format(len(geom_errors)))
+    else:
+        log("\t ----- No geometry errors were found.")
 
     # Create Buffers
     log("\t --- Creating Buffers")
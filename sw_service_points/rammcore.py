@@ -0,0 +1,2583 @@
+""" -----------------------------------------------------------------------------
+Module Name:        rammcore
+Description:        The parts of ramm that do not need ArcGIS: ID encoding, SG26
+                    decoding, field map planning, geometry kernels and the
+                    chunked table helpers with their backends. numpy and arcpy
+                    are only imported when something first uses them, arcpy
+                    only by ArcpyBackend.
+------------------------------------------------------------------------------ """
+
+import os
+import sys
+import math
+import time
+import sqlite3
+import itertools
+import importlib
+import struct
+import hashlib
+import json
+import zlib
+
+
+class LazyModule(object):
+    # stands in for a module and imports it the first time it is used
+
+    def __init__(self, name):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_module", None)
+
+    def _load(self):
+        if self._module is None:
+            object.__setattr__(self, "_module", importlib.import_module(self._name))
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+numpy = LazyModule("numpy")
+arcpy = LazyModule("arcpy")
+
+
+def arcpyAvailable():
+    try:
+        arcpy._load()
+    except ImportError:
+        return False
+    return True
+
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+# folder for the caches the tools keep between runs
+CACHE_FOLDER = os.environ.get("RAMM_CACHE", os.path.join(os.path.expanduser("~"), ".ramm", "cache"))
+
+
+def writeCacheFile(path, content):
+    # write to a temporary file first so readers never see a partial file
+    folder = os.path.dirname(path)
+    if not os.path.isdir(folder):
+        try:
+            os.makedirs(folder)
+        except OSError:
+            if not os.path.isdir(folder):
+                raise
+    temporary = "{}.{}.tmp".format(path, os.getpid())
+    with open(temporary, "w") as f:
+        f.write(content)
+    if os.path.exists(path):
+        os.remove(path)
+    os.rename(temporary, path)
+
+
+NUMERIC_FIELD_TYPES = ("Integer", "SmallInteger", "Double", "Single", "OID")
+
+# virtual field every backend reads as a list of rings, see ringsFromGeometry
+RINGS_FIELD = "SHAPE@RINGS"
+
+# virtual field every backend reads as the (area in square metres, perimeter
+# in metres, centroid x, centroid y) of the geometry
+MEASURES_FIELD = "SHAPE@MEASURES"
+
+
+def _measureMethod(shape):
+    # the field calculator measures geographic data geodesically
+    spatial_reference = shape.spatialReference
+    return "GEODESIC" if spatial_reference is not None and spatial_reference.type == "Geographic" else "PLANAR"
+
+
+def shapeArea(shape):
+    # what !SHAPE.AREA@SQUAREMETERS! gives in the field calculator
+    return None if shape is None else shape.getArea(_measureMethod(shape), "SQUAREMETERS")
+
+
+def _shapeMeasures(shape):
+    # what !SHAPE.AREA@SQUAREMETERS!, !SHAPE.LENGTH@METERS! and !SHAPE.CENTROID!
+    # give in the field calculator, the centroid is arcpy's label point when
+    # the true centroid falls outside the polygon
+    if shape is None:
+        return (None, None, None, None)
+    centroid = shape.centroid
+    return (shapeArea(shape), shape.getLength(_measureMethod(shape), "METERS"), centroid.X, centroid.Y)
+
+
+class ArcpyBackend(object):
+    # tables and feature classes read and written through arcpy.da cursors
+
+    def fieldTypes(self, table):
+        return dict((f.name.upper(), f.type) for f in arcpy.ListFields(table))
+
+    def spatialReference(self, table):
+        return arcpy.Describe(table).spatialReference
+
+    def iterRows(self, table, fields, where_clause=None, spatial_reference=None):
+        # geometries are projected to spatial_reference when it is given
+        fields = list(fields)
+        shape_fields = (RINGS_FIELD, MEASURES_FIELD)
+        read_shape = any(f in shape_fields for f in fields)
+        cursor_fields = ["OID@"] + [f for f in fields if f not in shape_fields] + (["SHAPE@"] if read_shape else [])
+        with arcpy.da.SearchCursor(table, cursor_fields, where_clause, spatial_reference=spatial_reference) as cursor:
+            for row in cursor:
+                if read_shape:
+                    shape = row[-1]
+                    values = iter(row[1:-1])
+                    row = tuple([row[0]] + [ringsFromGeometry(shape) if f == RINGS_FIELD else
+                                            _shapeMeasures(shape) if f == MEASURES_FIELD else next(values)
+                                            for f in fields])
+                yield row
+        del cursor
+
+    def writeRows(self, table, fields, updates):
+        # only the rows in the object id range of the updates are visited, so
+        # writing a chunk at a time does not read the whole table every time
+        if not updates:
+            return
+        oid_field = arcpy.AddFieldDelimiters(table, arcpy.Describe(table).OIDFieldName)
+        where_clause = "{0} >= {1} AND {0} <= {2}".format(oid_field, min(updates), max(updates))
+        with arcpy.da.UpdateCursor(table, ["OID@"] + list(fields), where_clause) as cursor:
+            for row in cursor:
+                values = updates.get(row[0])
+                if values is not None:
+                    cursor.updateRow([row[0]] + list(values))
+        del cursor
+
+
+class GeoPackageBackend(object):
+    """
+    Attribute tables of a GeoPackage, or any SQLite database, read and written
+    with sqlite3 so the chunked helpers can run without arcpy
+
+    Args:
+        path (str): path of the .gpkg file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+
+    def _columns(self, table):
+        return self.connection.execute('PRAGMA table_info("{}")'.format(table)).fetchall()
+
+    def _key(self, table):
+        keys = [c[1] for c in self._columns(table) if c[5]]
+        return keys[0] if keys else "rowid"
+
+    def fieldTypes(self, table):
+        types = {}
+        for column in self._columns(table):
+            declared = (column[2] or "").upper()
+            if any(t in declared for t in ("INT", "BOOLEAN")):
+                types[column[1].upper()] = "Integer"
+            elif any(t in declared for t in ("REAL", "FLOA", "DOUB")):
+                types[column[1].upper()] = "Double"
+            elif "DATE" in declared:
+                types[column[1].upper()] = "Date"
+            else:
+                types[column[1].upper()] = "String"
+        return types
+
+    def _geometryColumn(self, table):
+        row = self.connection.execute("SELECT column_name FROM gpkg_geometry_columns WHERE table_name = ?",
+                                      (table,)).fetchone()
+        if row is None:
+            raise ValueError("{} has no geometry column".format(table))
+        return row[0]
+
+    def _checkMetres(self, table):
+        # the measures are worked out from the coordinates, so they must be in metres
+        row = self.connection.execute("SELECT s.definition FROM gpkg_geometry_columns g JOIN gpkg_spatial_ref_sys s "
+                                      "ON g.srs_id = s.srs_id WHERE g.table_name = ?", (table,)).fetchone()
+        definition = (row[0] if row else "").upper()
+        if definition.startswith("GEOGCS") or (definition.startswith("PROJCS") and
+                                               definition.rsplit('UNIT["', 1)[-1][:6] not in ('METRE"', 'METER"')):
+            raise ValueError("{} is not in a projected coordinate system in metres".format(table))
+
+    def spatialReference(self, table):
+        return None
+
+    def iterRows(self, table, fields, where_clause=None, spatial_reference=None, batch_size=10000):
+        # the tables of a GeoPackage are expected to share a coordinate system,
+        # nothing is projected. The rows are read a batch at a time after the
+        # last key read, so no statement is left open while rows are written
+        fields = list(fields)
+        rings = [i + 1 for i, f in enumerate(fields) if f == RINGS_FIELD]
+        measures = [i + 1 for i, f in enumerate(fields) if f == MEASURES_FIELD]
+        if rings or measures:
+            geometry_column = self._geometryColumn(table)
+            fields = [geometry_column if f in (RINGS_FIELD, MEASURES_FIELD) else f for f in fields]
+        if measures:
+            self._checkMetres(table)
+        key = self._key(table)
+        sql = 'SELECT "{0}", {1} FROM "{2}" WHERE "{0}" > ?'.format(
+            key, ", ".join('"{}"'.format(f) for f in fields), table)
+        if where_clause:
+            sql += " AND ({})".format(where_clause)
+        sql += ' ORDER BY "{}" LIMIT {}'.format(key, batch_size)
+        # integers sort before any text in SQLite, so this is below every key
+        last = -2 ** 63
+        while True:
+            rows = self.connection.execute(sql, (last,)).fetchall()
+            if not rows:
+                break
+            last = rows[-1][0]
+            for row in rows:
+                yield self._convertRow(row, rings, measures)
+
+    def _convertRow(self, row, rings, measures):
+        # the geometry blobs of a row as rings or measures
+        if not rings and not measures:
+            return row
+        row = list(row)
+        for i in rings:
+            row[i] = ringsFromGeoPackage(row[i])
+        for i in measures:
+            row[i] = polygonMeasures(ringsFromGeoPackage(row[i]))
+        return tuple(row)
+
+    def writeRows(self, table, fields, updates):
+        sql = 'UPDATE "{}" SET {} WHERE "{}" = ?'.format(
+            table, ", ".join('"{}" = ?'.format(f) for f in fields), self._key(table))
+        with self.connection:
+            self.connection.executemany(sql, (list(values) + [oid] for oid, values in updates.items()))
+
+
+class MemoryBackend(object):
+    """
+    In-memory stand-in for a workspace, used by tests and benchmarks
+
+    Args:
+        tables (dict): table name to a dict with "fields", a list of (name, type)
+            pairs, and "rows", a dict of object id to a dict of field values.
+            Geometries are stored as lists of rings under "SHAPE", with their
+            coordinates in metres
+    """
+
+    def __init__(self, tables=None):
+        self.tables = tables or {}
+
+    def addTable(self, name, fields, rows, geometry_type=None):
+        # rows is a list of dicts, object ids are assigned from 1
+        self.tables[name] = {"fields": list(fields), "geometry": geometry_type,
+                             "rows": dict((i + 1, dict(row)) for i, row in enumerate(rows))}
+
+    def fieldTypes(self, table):
+        return dict((name.upper(), field_type) for name, field_type in self.tables[table]["fields"])
+
+    def spatialReference(self, table):
+        return None
+
+    def iterRows(self, table, fields, where_clause=None, spatial_reference=None):
+        # every table is in the same coordinate system, nothing is projected
+        rows = self.tables[table]["rows"]
+        for oid in sorted(rows):
+            if where_clause is None or where_clause(rows[oid]):
+                yield tuple([oid] + [polygonMeasures(rows[oid].get("SHAPE")) if f == MEASURES_FIELD else
+                                     rows[oid].get("SHAPE" if f == RINGS_FIELD else f) for f in fields])
+
+    def writeRows(self, table, fields, updates):
+        rows = self.tables[table]["rows"]
+        for oid, values in updates.items():
+            rows[oid].update(zip(fields, values))
+
+
+def chunkToArray(rows, fields, field_types):
+    """
+    Converts cursor rows into a NumPy structured array
+
+    Args:
+        rows (list): rows of values in field order
+        fields (list): field names
+        field_types (dict): upper case field name to arcpy field type
+
+    Returns:
+        chunk (numpy.ndarray): numeric fields as float64 with NaN for nulls,
+            every other field as objects
+    """
+    numeric = [field_types.get(f.upper()) in NUMERIC_FIELD_TYPES for f in fields]
+    chunk = numpy.empty(len(rows), dtype=[(str(f), numpy.float64 if n else object)
+                                          for f, n in zip(fields, numeric)])
+    columns = list(zip(*rows)) if rows else [[] for f in fields]
+    for f, is_numeric, column in zip(fields, numeric, columns):
+        if is_numeric:
+            chunk[str(f)] = [numpy.nan if v is None else v for v in column]
+        else:
+            # fill element by element so lists such as rings stay single objects
+            target = chunk[str(f)]
+            for i, v in enumerate(column):
+                target[i] = v
+    return chunk
+
+
+def _columnToValues(column, field_type):
+    # numpy column back to python values the cursors accept
+    values = column.tolist() if isinstance(column, numpy.ndarray) else list(column)
+    if field_type in NUMERIC_FIELD_TYPES:
+        values = [None if v is None or v != v else v for v in values]
+        if field_type in ("Integer", "SmallInteger"):
+            values = [None if v is None else int(v) for v in values]
+    return values
+
+
+def readChunks(table, fields, chunk_size=100000, backend=None, where_clause=None):
+    # yield (object ids, structured array) for every chunk_size rows of table
+    backend = backend or ArcpyBackend()
+    field_types = backend.fieldTypes(table)
+    rows = backend.iterRows(table, fields, where_clause)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            break
+        yield (numpy.array([row[0] for row in chunk], dtype=numpy.int64),
+               chunkToArray([row[1:] for row in chunk], fields, field_types))
+
+
+def updateTableInChunks(table, read_fields, write_fields, transform, chunk_size=100000, backend=None,
+                        where_clause=None):
+    """
+    Reads a table in chunks, transforms each chunk and writes its results back
+    before the next chunk is read, so only one chunk is held at a time
+
+    Args:
+        table (str): table, feature class or layer
+        read_fields (list): fields passed to transform
+        write_fields (list): fields written back
+        transform (function): takes the structured array of a chunk and returns a
+            dict of write field to column, or a structured array with those fields
+        chunk_size (int): number of rows read at a time
+        backend: ArcpyBackend (default), GeoPackageBackend or MemoryBackend
+        where_clause: limits the rows read, a function of the row for MemoryBackend
+
+    Returns:
+        updated_num (int): number of rows whose values changed
+    """
+    backend = backend or ArcpyBackend()
+    field_types = backend.fieldTypes(table)
+    updated_num = 0
+    for oids, chunk in readChunks(table, read_fields, chunk_size, backend, where_clause):
+        result = transform(chunk)
+        columns = [_columnToValues(result[f], field_types.get(f.upper())) for f in write_fields]
+        # leave rows alone when the new values match what was read
+        unchanged = [_columnToValues(chunk[f], field_types.get(f.upper())) if f in read_fields else None
+                     for f in write_fields]
+        updates = {}
+        for i, oid in enumerate(oids.tolist()):
+            values = [column[i] for column in columns]
+            if all(old is not None and old[i] == value for old, value in zip(unchanged, values)):
+                continue
+            updates[oid] = values
+        if updates:
+            backend.writeRows(table, write_fields, updates)
+            updated_num += len(updates)
+    return updated_num
+
+
+def populateCPID(number):
+    return 'CP' + str(int(number)).rjust(8, '0')
+
+
+def populateRecNo(recno_prefix, number):
+    return recno_prefix + str(int(number)).rjust(11, '0')
+
+
+# default location of the durable sequence store shared by all the tools
+SEQUENCE_STORE = os.environ.get("RAMM_SEQUENCE_STORE",
+                                os.path.join(os.path.expanduser("~"), ".ramm", "sequences.sqlite"))
+
+
+class SequenceAllocator(object):
+    """
+    Hands out contiguous blocks of ID numbers per prefix and keeps the high
+    water mark of every prefix in a SQLite store. Allocations are made under
+    SQLite's database file lock so concurrent tools never get overlapping blocks.
+
+    Args:
+        store (str): path of the SQLite file holding the sequences
+        timeout (float): seconds to wait for another process holding the lock
+    """
+
+    def __init__(self, store=None, timeout=60):
+        self.store = store or SEQUENCE_STORE
+        store_folder = os.path.dirname(self.store)
+        if store_folder and not os.path.isdir(store_folder):
+            os.makedirs(store_folder)
+        self.connection = sqlite3.connect(self.store, timeout=timeout, isolation_level=None)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS sequences "
+                                "(prefix TEXT PRIMARY KEY, high_water INTEGER NOT NULL)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS blocks "
+                                "(prefix TEXT NOT NULL, owner TEXT NOT NULL, first INTEGER NOT NULL, "
+                                "last INTEGER NOT NULL, PRIMARY KEY (prefix, owner))")
+
+    def highWater(self, prefix):
+        row = self.connection.execute("SELECT high_water FROM sequences WHERE prefix = ?",
+                                      (prefix,)).fetchone()
+        return row[0] if row else None
+
+    def allocate(self, prefix, count, start=1, owner=None):
+        """
+        Reserves count consecutive numbers for prefix
+
+        Args:
+            prefix (str): sequence name, eg the RECNO prefix or CP
+            count (int): number of IDs needed
+            start (int): lowest number to hand out if the sequence is behind it
+            owner (str): optional name of the dataset being numbered, a rerun
+                for the same owner and count gets its earlier block back
+                unless the block starts below start
+
+        Returns:
+            block (tuple): first and last number of the block, which starts
+                after start when the sequence is already past it
+        """
+        count = int(count)
+        start = int(start)
+        cursor = self.connection.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            if owner is not None:
+                row = cursor.execute("SELECT first, last FROM blocks WHERE prefix = ? AND owner = ?",
+                                     (prefix, owner)).fetchone()
+                if row and row[1] - row[0] + 1 == count and row[0] >= start:
+                    cursor.execute("COMMIT")
+                    return (row[0], row[1])
+            row = cursor.execute("SELECT high_water FROM sequences WHERE prefix = ?",
+                                 (prefix,)).fetchone()
+            first = start if row is None else max(start, row[0] + 1)
+            last = first + count - 1
+            if count > 0:
+                cursor.execute("INSERT OR REPLACE INTO sequences (prefix, high_water) VALUES (?, ?)",
+                               (prefix, last if row is None else max(last, row[0])))
+                if owner is not None:
+                    cursor.execute("INSERT OR REPLACE INTO blocks (prefix, owner, first, last) "
+                                   "VALUES (?, ?, ?, ?)", (prefix, owner, first, last))
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        return (first, last)
+
+    def reset(self, prefix):
+        # forget the high water mark and blocks so the prefix starts over
+        cursor = self.connection.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("DELETE FROM sequences WHERE prefix = ?", (prefix,))
+        cursor.execute("DELETE FROM blocks WHERE prefix = ?", (prefix,))
+        cursor.execute("COMMIT")
+
+    def close(self):
+        self.connection.close()
+
+
+def populateEkhayaID(cent_x, cent_y, recno):
+    lat = int(cent_x * 1100000)
+    lon = int(cent_y * 1100000)
+    rec_string = recno[:4]
+
+    finlat = hex(lat)[2:].rjust(8, '0')
+    finlon = hex(lon)[2:].rjust(8, '0')
+
+    return rec_string.upper() + finlat.upper() + finlon.upper()
+
+
+def populateNewEkhayaID(cent_x, cent_y, recno):
+    lat = int(cent_x * 1100000)
+    lon = int(cent_y * 1100000)
+    rec_string1 = recno[:9]
+    rec_string2 = int(recno[-11:])
+
+    finlat = hex(lat)[2:].rjust(8, '0')
+    finlon = hex(lon)[2:].rjust(8, '0')
+    finrec_string2 = hex(rec_string2)[2:].rjust(10, '0')
+
+    return rec_string1.upper() + finrec_string2.upper() + finlat.upper() + finlon.upper()
+
+
+# upper case hex digits indexed by nibble value, built on first use
+_HEX_DIGITS = []
+
+
+def _hexDigits():
+    if not _HEX_DIGITS:
+        _HEX_DIGITS.append(numpy.array([ord(c) for c in "0123456789ABCDEF"], dtype=numpy.uint32))
+    return _HEX_DIGITS[0]
+
+
+def _hexColumn(values, width):
+    # fixed width upper case hex of non-negative integers as code points
+    shifts = numpy.arange(width - 1, -1, -1, dtype=numpy.int64) * 4
+    return _hexDigits()[(values[:, None] >> shifts) & 0xF]
+
+
+def _textMatrix(values, min_width):
+    # matrix of unicode code points, one row per value, with the value lengths
+    text = numpy.array([v if isinstance(v, string_types) else u"" for v in values], dtype="U")
+    width = text.dtype.itemsize // 4
+    matrix = text.view(numpy.uint32).reshape(len(values), width)
+    if width < min_width:
+        matrix = numpy.hstack(
+            [matrix, numpy.zeros((len(values), min_width - width), dtype=numpy.uint32)])
+    return matrix, numpy.char.str_len(text)
+
+
+def _asciiUpper(codes):
+    return numpy.where((codes >= 97) & (codes <= 122), codes - 32, codes)
+
+
+def _scaledCoordinates(values):
+    # int(value * 1100000) for the values that fit in eight hex digits
+    if isinstance(values, numpy.ndarray) and values.dtype.kind == "f":
+        coords = values.astype(numpy.float64)
+    else:
+        coords = numpy.array([v if isinstance(v, (int, float)) else numpy.nan for v in values],
+                             dtype=numpy.float64)
+    with numpy.errstate(invalid="ignore"):
+        scaled = numpy.trunc(coords * 1100000)
+        valid = numpy.isfinite(scaled) & (scaled >= 0) & (scaled < 16 ** 8)
+    return numpy.where(valid, scaled, 0).astype(numpy.int64), valid
+
+
+def encodeEkhayaIDs(cent_x, cent_y, recno, new_format=False):
+    """
+    Vectorised populateEkhayaID and populateNewEkhayaID for whole columns
+
+    Args:
+        cent_x (sequence): CENT_X values
+        cent_y (sequence): CENT_Y values
+        recno (sequence): RECNO values
+        new_format (bool): encode like populateNewEkhayaID instead of populateEkhayaID
+
+    Returns:
+        ekhaya_ids (list): the EkhayaID of every row, identical to the row by row functions
+    """
+    n = len(recno)
+    if n == 0:
+        return []
+    lat, lat_valid = _scaledCoordinates(cent_x)
+    lon, lon_valid = _scaledCoordinates(cent_y)
+    prefix_width = 9 if new_format else 4
+    text, lengths = _textMatrix(recno, prefix_width)
+    prefix = text[:, :prefix_width]
+    valid = lat_valid & lon_valid & (prefix < 128).all(axis=1)
+    parts = [_asciiUpper(prefix)]
+
+    if new_format:
+        valid &= lengths >= 11
+        positions = numpy.maximum(lengths, 11)[:, None] - 11 + numpy.arange(11)
+        digits = text[numpy.arange(n)[:, None], positions].astype(numpy.int64) - 48
+        valid &= ((digits >= 0) & (digits <= 9)).all(axis=1)
+        numbers = (numpy.where(digits >= 0, digits, 0) *
+                   10 ** numpy.arange(10, -1, -1, dtype=numpy.int64)).sum(axis=1)
+        parts.append(_hexColumn(numbers, 10))
+    else:
+        valid &= lengths >= 4
+
+    parts.append(_hexColumn(lat, 8))
+    parts.append(_hexColumn(lon, 8))
+    encoded = numpy.ascontiguousarray(numpy.hstack(parts), dtype=numpy.uint32)
+    ekhaya_ids = encoded.view("U{}".format(encoded.shape[1])).ravel().tolist()
+
+    # anything outside the fixed width layout goes through the row function
+    encode = populateNewEkhayaID if new_format else populateEkhayaID
+    for i in numpy.flatnonzero(~valid):
+        ekhaya_ids[i] = encode(cent_x[i], cent_y[i], recno[i])
+    return ekhaya_ids
+
+
+def populateEkhayaIDs(dataset, new_format=False, chunk_size=100000, backend=None):
+    # encode the table a chunk at a time and write the changed ids back in one pass
+    def transform(chunk):
+        return {"EKHAYAID": encodeEkhayaIDs(chunk["CENT_X"], chunk["CENT_Y"], chunk["RECNO"], new_format)}
+
+    return updateTableInChunks(dataset, ["CENT_X", "CENT_Y", "RECNO", "EKHAYAID"], ["EKHAYAID"],
+                               transform, chunk_size, backend)
+
+
+def ringsFromGeometry(geometry):
+    # flatten an arcpy polygon into a list of rings of (x, y) tuples, interior
+    # rings are separated from their exterior ring by a None point
+    rings = []
+    if geometry is None:
+        return rings
+    for part in geometry:
+        ring = []
+        for point in part:
+            if point is None:
+                if ring:
+                    rings.append(ring)
+                ring = []
+            else:
+                ring.append((point.X, point.Y))
+        if ring:
+            rings.append(ring)
+    return rings
+
+
+def ringsFromWKB(wkb, offset=0):
+    """
+    Reads the rings of a well known binary polygon, multipolygon or point
+
+    Args:
+        wkb (bytes): the geometry, Z and M values are dropped
+        offset (int): position of the geometry in wkb
+
+    Returns:
+        rings (list): rings in the form ringsFromGeometry returns
+    """
+    rings, offset = _readWKB(bytearray(wkb), offset)
+    return rings
+
+
+def _readWKB(wkb, offset):
+    order = "<" if wkb[offset] == 1 else ">"
+    geometry_type = struct.unpack_from(order + "I", wkb, offset + 1)[0]
+    offset += 5
+    # ISO (1000s) and EWKB (high bits) flags for Z and M
+    dimensions = 2
+    if geometry_type & 0x80000000:
+        dimensions += 1
+    if geometry_type & 0x40000000:
+        dimensions += 1
+    geometry_type &= 0xFFFF
+    if geometry_type >= 1000:
+        dimensions += {1: 1, 2: 1, 3: 2}[geometry_type // 1000]
+        geometry_type %= 1000
+    if geometry_type == 1:
+        values = struct.unpack_from(order + "{}d".format(dimensions), wkb, offset)
+        return [[(values[0], values[1])]], offset + dimensions * 8
+    if geometry_type == 3:
+        rings = []
+        count = struct.unpack_from(order + "I", wkb, offset)[0]
+        offset += 4
+        for r in range(count):
+            points = struct.unpack_from(order + "I", wkb, offset)[0]
+            offset += 4
+            values = struct.unpack_from(order + "{}d".format(points * dimensions), wkb, offset)
+            offset += points * dimensions * 8
+            rings.append([(values[i], values[i + 1]) for i in range(0, len(values), dimensions)])
+        return rings, offset
+    if geometry_type in (6, 7):
+        rings = []
+        count = struct.unpack_from(order + "I", wkb, offset)[0]
+        offset += 4
+        for g in range(count):
+            part, offset = _readWKB(wkb, offset)
+            rings.extend(part)
+        return rings, offset
+    raise ValueError("Unsupported WKB geometry type: {}".format(geometry_type))
+
+
+def ringsFromGeoPackage(blob):
+    # GeoPackage geometries are WKB behind a header with an optional envelope
+    if blob is None:
+        return []
+    blob = bytearray(blob)
+    if blob[:2] != bytearray(b"GP"):
+        raise ValueError("Not a GeoPackage geometry")
+    flags = blob[3]
+    if flags & 0x10:
+        # empty geometry
+        return []
+    envelope = {0: 0, 1: 32, 2: 48, 3: 48, 4: 64}[(flags >> 1) & 0x07]
+    return ringsFromWKB(blob, 8 + envelope)
+
+
+def ringsToWKB(rings, geometry_type="POLYGON"):
+    # little endian WKB of a polygon, or of a point from the first vertex
+    if geometry_type == "POINT":
+        return struct.pack("<BIdd", 1, 1, rings[0][0][0], rings[0][0][1])
+    parts = [struct.pack("<BII", 1, 3, len(rings))]
+    for ring in rings:
+        parts.append(struct.pack("<I", len(ring)))
+        parts.append(struct.pack("<{}d".format(len(ring) * 2), *[c for point in ring for c in point]))
+    return b"".join(parts)
+
+
+def ringsToGeoPackage(rings, srs_id=0, geometry_type="POLYGON"):
+    # GeoPackage geometry blob with an xy envelope for polygons
+    if not rings:
+        return None
+    if geometry_type == "POINT":
+        header = struct.pack("<2sBBi", b"GP", 0, 1, srs_id)
+    else:
+        header = struct.pack("<2sBBi4d", b"GP", 0, 3, srs_id, *_envelope(ringsExtent(rings)))
+    return header + ringsToWKB(rings, geometry_type)
+
+
+def _envelope(extent):
+    # GeoPackage envelopes are ordered minx, maxx, miny, maxy
+    return (extent[0], extent[2], extent[1], extent[3])
+
+
+def ringsExtent(rings):
+    xs = [x for ring in rings for x, y in ring]
+    ys = [y for ring in rings for x, y in ring]
+    if not xs:
+        return None
+    return (min(xs), min(ys), max(xs), max(ys))
+
+
+def extentsOverlap(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def ringSegments(ring):
+    segments = [(ring[i][0], ring[i][1], ring[i + 1][0], ring[i + 1][1])
+                for i in range(len(ring) - 1)]
+    if len(ring) > 2 and ring[0] != ring[-1]:
+        segments.append((ring[-1][0], ring[-1][1], ring[0][0], ring[0][1]))
+    return segments
+
+
+def _orientation(ax, ay, bx, by, cx, cy):
+    value = (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+    if value > 0:
+        return 1
+    if value < 0:
+        return -1
+    return 0
+
+
+def _onSegment(ax, ay, bx, by, px, py):
+    return min(ax, bx) <= px <= max(ax, bx) and min(ay, by) <= py <= max(ay, by)
+
+
+def segmentsIntersect(s, t):
+    # true if the two segments share at least one point, touching included
+    o1 = _orientation(s[0], s[1], s[2], s[3], t[0], t[1])
+    o2 = _orientation(s[0], s[1], s[2], s[3], t[2], t[3])
+    o3 = _orientation(t[0], t[1], t[2], t[3], s[0], s[1])
+    o4 = _orientation(t[0], t[1], t[2], t[3], s[2], s[3])
+    if o1 != o2 and o3 != o4:
+        return True
+    if o1 == 0 and _onSegment(s[0], s[1], s[2], s[3], t[0], t[1]):
+        return True
+    if o2 == 0 and _onSegment(s[0], s[1], s[2], s[3], t[2], t[3]):
+        return True
+    if o3 == 0 and _onSegment(t[0], t[1], t[2], t[3], s[0], s[1]):
+        return True
+    if o4 == 0 and _onSegment(t[0], t[1], t[2], t[3], s[2], s[3]):
+        return True
+    return False
+
+
+def segmentsCross(s, t):
+    # true only if the two segments cross at a single interior point
+    o1 = _orientation(s[0], s[1], s[2], s[3], t[0], t[1])
+    o2 = _orientation(s[0], s[1], s[2], s[3], t[2], t[3])
+    o3 = _orientation(t[0], t[1], t[2], t[3], s[0], s[1])
+    o4 = _orientation(t[0], t[1], t[2], t[3], s[2], s[3])
+    return o1 * o2 < 0 and o3 * o4 < 0
+
+
+def polygonCentroid(rings):
+    # area weighted centroid of all the rings, holes are expected to be wound
+    # opposite to their exterior ring as they are in arcpy geometries
+    area = 0.0
+    cx = 0.0
+    cy = 0.0
+    for ring in rings:
+        for x1, y1, x2, y2 in ringSegments(ring):
+            cross = x1 * y2 - x2 * y1
+            area += cross
+            cx += (x1 + x2) * cross
+            cy += (y1 + y2) * cross
+    if area == 0:
+        extent = ringsExtent(rings)
+        if extent is None:
+            return None
+        return ((extent[0] + extent[2]) / 2.0, (extent[1] + extent[3]) / 2.0)
+    return (cx / (3.0 * area), cy / (3.0 * area))
+
+
+def polygonArea(rings):
+    # area of the rings, holes wound opposite to their exterior ring
+    area = 0.0
+    for ring in rings:
+        for x1, y1, x2, y2 in ringSegments(ring):
+            area += x1 * y2 - x2 * y1
+    return abs(area) / 2.0
+
+
+def pointInRing(x, y, ring):
+    # even-odd test of a point against a single ring
+    inside = False
+    for x1, y1, x2, y2 in ringSegments(ring):
+        if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / float(y2 - y1):
+            inside = not inside
+    return inside
+
+
+def geometryHash(wkb):
+    # hash of the exact well known binary of a geometry, unlike
+    # featureFingerprint nothing is snapped or reordered as any change can
+    # make it valid or invalid
+    return hashlib.sha1(bytes(wkb)).hexdigest()[:24]
+
+
+def labelPoint(rings, y):
+    # the middle of the widest span of the polygon along the line at y, used
+    # where the centroid falls outside it. arcpy's label point is not public
+    # so this is only close to it
+    crossings = sorted(x1 + (y - y1) * (x2 - x1) / float(y2 - y1)
+                       for ring in rings for x1, y1, x2, y2 in ringSegments(ring) if (y1 > y) != (y2 > y))
+    spans = [(crossings[i + 1] - crossings[i], crossings[i]) for i in range(0, len(crossings) - 1, 2)]
+    if not spans:
+        return None
+    width, start = max(spans)
+    return (start + width / 2.0, y)
+
+
+def polygonMeasures(rings):
+    """
+    Area, perimeter and centroid of a polygon whose coordinates are in metres,
+    for the backends that do not read the geometry with arcpy
+
+    Args:
+        rings (list): rings of the polygon, see ringsFromGeometry
+
+    Returns:
+        area, perimeter, cent_x, cent_y (float): None for a missing geometry.
+            Like arcpy's centroid the point is moved inside the polygon when
+            the area weighted centroid falls outside it, see labelPoint
+    """
+    if not rings:
+        return (None, None, None, None)
+    # coordinates relative to the first point keep the cross products small
+    # for projected coordinates
+    x0, y0 = rings[0][0]
+    rings = [[(x - x0, y - y0) for x, y in ring] for ring in rings]
+    perimeter = sum(math.hypot(x2 - x1, y2 - y1) for ring in rings for x1, y1, x2, y2 in ringSegments(ring))
+    x, y = polygonCentroid(rings)
+    if sum(1 for ring in rings if pointInRing(x, y, ring)) % 2 == 0:
+        x, y = labelPoint(rings, y) or (x, y)
+    return (polygonArea(rings), perimeter, x + x0, y + y0)
+
+
+class STRtree(object):
+    """
+    Packed R-tree built with the Sort-Tile-Recursive algorithm
+
+    Args:
+        items (list): (extent, value) tuples where extent is (xmin, ymin, xmax, ymax)
+        node_capacity (int): maximum number of entries in a node
+    """
+
+    def __init__(self, items, node_capacity=10):
+        self.node_capacity = node_capacity
+        self.size = len(items)
+        level = [(extent, value, True) for extent, value in items]
+        while len(level) > node_capacity:
+            level = self._pack(level)
+        self.root = (self._union([node[0] for node in level]), level, False) if level else None
+
+    def _union(self, extents):
+        return (min(e[0] for e in extents), min(e[1] for e in extents),
+                max(e[2] for e in extents), max(e[3] for e in extents))
+
+    def _pack(self, nodes):
+        capacity = self.node_capacity
+        leaf_count = int(math.ceil(len(nodes) / float(capacity)))
+        slice_count = int(math.ceil(math.sqrt(leaf_count)))
+        slice_size = slice_count * capacity
+        nodes = sorted(nodes, key=lambda n: n[0][0] + n[0][2])
+        packed = []
+        for i in range(0, len(nodes), slice_size):
+            vertical_slice = sorted(nodes[i:i + slice_size],
+                                    key=lambda n: n[0][1] + n[0][3])
+            for j in range(0, len(vertical_slice), capacity):
+                children = vertical_slice[j:j + capacity]
+                packed.append(
+                    (self._union([child[0] for child in children]), children, False))
+        return packed
+
+    def query(self, extent):
+        # return the values of all the entries whose extent overlaps extent
+        found = []
+        if self.root is None or not extentsOverlap(self.root[0], extent):
+            return found
+        stack = [self.root]
+        while stack:
+            node_extent, children, is_entry = stack.pop()
+            for child in children:
+                if extentsOverlap(child[0], extent):
+                    if child[2]:
+                        found.append(child[1])
+                    else:
+                        stack.append(child)
+        return found
+
+
+def hilbertValues(x, y, order=16):
+    """
+    Position of grid cells along a Hilbert curve, nearby cells get nearby values
+
+    Args:
+        x, y (numpy.ndarray): integer cell coordinates from 0 to 2 ** order - 1
+        order (int): bits per coordinate
+
+    Returns:
+        values (numpy.ndarray): int64 Hilbert value of every cell
+    """
+    x = numpy.asarray(x, dtype=numpy.int64).copy()
+    y = numpy.asarray(y, dtype=numpy.int64).copy()
+    n = 1 << order
+    values = numpy.zeros(len(x), dtype=numpy.int64)
+    s = n >> 1
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        values += s * s * ((3 * rx.astype(numpy.int64)) ^ ry.astype(numpy.int64))
+        # rotate the quadrant so the curve stays continuous
+        flip = ~ry & rx
+        x[flip] = n - 1 - x[flip]
+        y[flip] = n - 1 - y[flip]
+        swap = ~ry
+        x[swap], y[swap] = y[swap], x[swap]
+        s >>= 1
+    return values
+
+
+class PackedRTree(object):
+    """
+    Static R-tree whose entries are sorted along a Hilbert curve and packed
+    bottom up into a single NumPy array, so it can be saved and memory mapped
+    back without rebuilding
+
+    Args:
+        boxes (numpy.ndarray): (n, 5) rows of xmin, ymin, xmax, ymax and value,
+            the entries first and then every level of nodes up to the root. The
+            value of a node is the row of its first child
+        size (int): number of entries
+        node_capacity (int): maximum number of children of a node
+    """
+
+    def __init__(self, boxes, size, node_capacity=16):
+        self.boxes = boxes
+        self.size = size
+        self.node_capacity = node_capacity
+        # the row every level ends at, entries first
+        self.level_ends = [size]
+        count = size
+        while count > 1:
+            count = int(math.ceil(count / float(node_capacity)))
+            self.level_ends.append(self.level_ends[-1] + count)
+
+    @classmethod
+    def build(cls, extents, values, node_capacity=16):
+        # extents are (xmin, ymin, xmax, ymax), values are integers such as object ids
+        extents = numpy.asarray(extents, dtype=numpy.float64).reshape(-1, 4)
+        values = numpy.asarray(values, dtype=numpy.float64)
+        if len(extents) == 0:
+            return cls(numpy.empty((0, 5)), 0, node_capacity)
+        centre_x = (extents[:, 0] + extents[:, 2]) / 2.0
+        centre_y = (extents[:, 1] + extents[:, 3]) / 2.0
+        cells = float((1 << 16) - 1)
+        width = max(centre_x.max() - centre_x.min(), 1e-12)
+        height = max(centre_y.max() - centre_y.min(), 1e-12)
+        order = numpy.argsort(hilbertValues(((centre_x - centre_x.min()) / width * cells).astype(numpy.int64),
+                                            ((centre_y - centre_y.min()) / height * cells).astype(numpy.int64)),
+                              kind="mergesort")
+        level = numpy.column_stack((extents[order], values[order]))
+        levels = [level]
+        offset = 0
+        while len(level) > 1:
+            starts = numpy.arange(0, len(level), node_capacity)
+            level = numpy.column_stack((numpy.minimum.reduceat(level[:, 0], starts),
+                                        numpy.minimum.reduceat(level[:, 1], starts),
+                                        numpy.maximum.reduceat(level[:, 2], starts),
+                                        numpy.maximum.reduceat(level[:, 3], starts),
+                                        offset + starts))
+            offset += len(levels[-1])
+            levels.append(level)
+        return cls(numpy.vstack(levels), len(extents), node_capacity)
+
+    def query(self, extent):
+        # values of all the entries whose extent overlaps extent
+        if self.size == 0:
+            return []
+        xmin, ymin, xmax, ymax = extent
+        boxes = self.boxes
+        found = []
+        # (first row, last row, level) of the blocks left to search
+        stack = [(self.level_ends[-2] if len(self.level_ends) > 1 else 0, self.level_ends[-1],
+                  len(self.level_ends) - 1)]
+        while stack:
+            start, end, level = stack.pop()
+            block = boxes[start:end]
+            hits = numpy.nonzero((block[:, 0] <= xmax) & (block[:, 2] >= xmin) &
+                                 (block[:, 1] <= ymax) & (block[:, 3] >= ymin))[0]
+            if level == 0:
+                found.extend(int(v) for v in block[hits, 4])
+                continue
+            for row in (start + hits).tolist():
+                first = int(boxes[row, 4])
+                stack.append((first, min(first + self.node_capacity, self.level_ends[level - 1]), level - 1))
+        return found
+
+    def queryMany(self, extents):
+        """
+        Queries many extents at once, walking the tree a level at a time for
+        all of them together
+
+        Args:
+            extents (list): (xmin, ymin, xmax, ymax) of every query
+
+        Returns:
+            queries, values (numpy.ndarray): the position of the query and the
+                value of the entry for every overlapping pair
+        """
+        extents = numpy.asarray(extents, dtype=numpy.float64).reshape(-1, 4)
+        if self.size == 0 or len(extents) == 0:
+            return numpy.empty(0, dtype=numpy.int64), numpy.empty(0, dtype=numpy.int64)
+        boxes = self.boxes
+        queries = numpy.arange(len(extents))
+        rows = numpy.full(len(extents), self.level_ends[-1] - 1, dtype=numpy.int64)
+        level = len(self.level_ends) - 1
+        while True:
+            block = boxes[rows]
+            query_extents = extents[queries]
+            hits = ((block[:, 0] <= query_extents[:, 2]) & (block[:, 2] >= query_extents[:, 0]) &
+                    (block[:, 1] <= query_extents[:, 3]) & (block[:, 3] >= query_extents[:, 1]))
+            queries = queries[hits]
+            rows = rows[hits]
+            if level == 0:
+                return queries, boxes[rows, 4].astype(numpy.int64)
+            # replace every node by its children
+            first = boxes[rows, 4].astype(numpy.int64)
+            counts = numpy.minimum(first + self.node_capacity, self.level_ends[level - 1]) - first
+            offsets = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+            queries = numpy.repeat(queries, counts)
+            rows = numpy.repeat(first, counts) + offsets
+            level -= 1
+
+    def save(self, path):
+        # numpy.save to a temporary file first so readers never see a partial index
+        temporary = "{}.{}.tmp.npy".format(os.path.splitext(path)[0], os.getpid())
+        numpy.save(temporary, numpy.ascontiguousarray(self.boxes))
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(temporary, path)
+
+    @classmethod
+    def load(cls, path, size, node_capacity=16):
+        # the array is memory mapped, only the blocks a query visits are read
+        return cls(numpy.load(path, mmap_mode="r"), size, node_capacity)
+
+
+def spatialIndexPath(dataset, spatial_reference=""):
+    # one index and its metadata per dataset and coordinate system it is read
+    # in, kept with the other caches
+    source = os.path.normcase(os.path.abspath(dataset)) + spatial_reference
+    key = hashlib.sha1(source.encode("utf-8")).hexdigest()
+    return os.path.join(CACHE_FOLDER, "spatial_index", key + ".npy")
+
+
+def loadSpatialIndex(path, **key):
+    # the saved index when it was built with the same key, else None
+    try:
+        with open(path + ".json") as f:
+            metadata = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if metadata.get("key") != json.loads(json.dumps(key)) or not os.path.exists(path):
+        return None
+    return PackedRTree.load(path, metadata["size"], metadata["node_capacity"])
+
+
+def saveSpatialIndex(path, tree, **key):
+    # key holds whatever identifies the version of the source, such as its
+    # path, modified time and row count
+    # the metadata is cleared while the array is replaced
+    writeCacheFile(path + ".json", "")
+    tree.save(path)
+    writeCacheFile(path + ".json", json.dumps({"key": key, "size": tree.size,
+                                               "node_capacity": tree.node_capacity}))
+
+
+class PreparedPolygon(object):
+    """
+    Polygon with its extent and edges precomputed so that it can be tested
+    against many other geometries, the edges of large polygons are indexed
+
+    Args:
+        rings (list): list of rings of (x, y) tuples
+    """
+
+    def __init__(self, rings):
+        self.rings = rings
+        self.extent = ringsExtent(rings)
+        self.segments = [s for ring in rings for s in ringSegments(ring)]
+        self.index = None
+        if len(self.segments) > 64:
+            self.index = STRtree([((min(s[0], s[2]), min(s[1], s[3]),
+                                    max(s[0], s[2]), max(s[1], s[3])), s) for s in self.segments])
+
+    def candidateSegments(self, extent):
+        if self.index is not None:
+            return self.index.query(extent)
+        return [s for s in self.segments
+                if extentsOverlap((min(s[0], s[2]), min(s[1], s[3]), max(s[0], s[2]), max(s[1], s[3])), extent)]
+
+    def locatePoint(self, x, y):
+        # 1 if the point is inside, 0 if it is on the boundary and -1 if outside
+        if self.extent is None or not extentsOverlap(self.extent, (x, y, x, y)):
+            return -1
+        inside = False
+        for x1, y1, x2, y2 in self.candidateSegments((x, y, self.extent[2], y)):
+            if _orientation(x1, y1, x2, y2, x, y) == 0 and _onSegment(x1, y1, x2, y2, x, y):
+                return 0
+            if (y1 > y) != (y2 > y):
+                if x < (x2 - x1) * (y - y1) / (y2 - y1) + x1:
+                    inside = not inside
+        return 1 if inside else -1
+
+    def intersects(self, other):
+        if self.extent is None or other.extent is None or not extentsOverlap(self.extent, other.extent):
+            return False
+        # quick accept for the common case of one polygon lying inside the other
+        if self.locatePoint(other.rings[0][0][0], other.rings[0][0][1]) >= 0:
+            return True
+        if other.locatePoint(self.rings[0][0][0], self.rings[0][0][1]) >= 0:
+            return True
+        for s in other.segments:
+            for t in self.candidateSegments((min(s[0], s[2]), min(s[1], s[3]), max(s[0], s[2]), max(s[1], s[3]))):
+                if segmentsIntersect(s, t):
+                    return True
+        return False
+
+    def intersectsPaths(self, paths):
+        # polylines given as lists of (x, y) vertices, touching counts
+        for path in paths:
+            if not path:
+                continue
+            if self.locatePoint(path[0][0], path[0][1]) >= 0:
+                return True
+            for k in range(len(path) - 1):
+                s = (path[k][0], path[k][1], path[k + 1][0], path[k + 1][1])
+                for t in self.candidateSegments((min(s[0], s[2]), min(s[1], s[3]),
+                                                 max(s[0], s[2]), max(s[1], s[3]))):
+                    if segmentsIntersect(s, t):
+                        return True
+        return False
+
+    def contains(self, other):
+        # other is within this polygon, sharing boundary is allowed
+        if self.extent is None or other.extent is None:
+            return False
+        e = self.extent
+        o = other.extent
+        if not (e[0] <= o[0] and e[1] <= o[1] and e[2] >= o[2] and e[3] >= o[3]):
+            return False
+        for ring in other.rings:
+            for x, y in ring:
+                if self.locatePoint(x, y) < 0:
+                    return False
+        for s in other.segments:
+            for t in self.candidateSegments((min(s[0], s[2]), min(s[1], s[3]), max(s[0], s[2]), max(s[1], s[3]))):
+                if segmentsCross(s, t):
+                    return False
+            # an edge running between two boundary vertices can still leave the polygon
+            if self.locatePoint((s[0] + s[2]) / 2.0, (s[1] + s[3]) / 2.0) < 0:
+                return False
+        return True
+
+
+SPATIAL_JOIN_TYPES = ("INTERSECT", "WITHIN", "HAVE_THEIR_CENTER_IN")
+
+
+def resolveSpatialJoin(input_rings, join_polygons, spatialjoin_type="INTERSECT", join_index=None):
+    """
+    Finds the join polygon matching an input geometry
+
+    Args:
+        input_rings (list): rings of the input geometry
+        join_polygons (list): PreparedPolygon objects of the join dataset
+        spatialjoin_type (str): INTERSECT, WITHIN or HAVE_THEIR_CENTER_IN
+        join_index (STRtree): index over the join polygons, built if not given
+
+    Returns:
+        match (int): position of the last matching join polygon, or None
+    """
+    if spatialjoin_type not in SPATIAL_JOIN_TYPES:
+        raise ValueError("Unsupported spatial join type: {}".format(spatialjoin_type))
+    if join_index is None:
+        join_index = STRtree([(p.extent, i) for i, p in enumerate(join_polygons) if p.extent is not None])
+    if not input_rings:
+        return None
+    if spatialjoin_type == "HAVE_THEIR_CENTER_IN":
+        x, y = polygonCentroid(input_rings)
+        candidates = join_index.query((x, y, x, y))
+        matches = [i for i in candidates if join_polygons[i].locatePoint(x, y) >= 0]
+    else:
+        feature = PreparedPolygon(input_rings)
+        candidates = join_index.query(feature.extent)
+        if spatialjoin_type == "INTERSECT":
+            matches = [i for i in candidates if join_polygons[i].intersects(feature)]
+        else:
+            matches = [i for i in candidates if join_polygons[i].contains(feature)]
+    # the selection based implementation applied the join features in cursor
+    # order so the last matching join feature wins
+    return max(matches) if matches else None
+
+
+def populateFieldsUsingSpatialJoin(input_dataset, spatialjoin_dataset, update_fields, source_fields, spatialjoin_type,
+                                   backend=None):
+    backend = backend or ArcpyBackend()
+    # read the join dataset once, in the coordinate system of the input, and index it
+    join_polygons = []
+    join_values = []
+    for row in backend.iterRows(spatialjoin_dataset, [RINGS_FIELD] + list(source_fields),
+                                spatial_reference=backend.spatialReference(input_dataset)):
+        join_polygons.append(PreparedPolygon(row[1]))
+        join_values.append([value if value is None or isinstance(value, string_types) else str(value)
+                            for value in row[2:]])
+    join_index = STRtree([(p.extent, i) for i, p in enumerate(join_polygons) if p.extent is not None])
+
+    # resolve the match of every input feature, then write them in one pass
+    updates = {}
+    for row in backend.iterRows(input_dataset, [RINGS_FIELD]):
+        match = resolveSpatialJoin(row[1], join_polygons, spatialjoin_type, join_index)
+        if match is not None:
+            updates[row[0]] = join_values[match]
+    backend.writeRows(input_dataset, list(update_fields), updates)
+
+
+def populateUsingSpatialJoin(input_dataset, spatialjoin_dataset, update_field, source_field, spatialjoin_type):
+    populateFieldsUsingSpatialJoin(input_dataset, spatialjoin_dataset, [update_field], [source_field],
+                                   spatialjoin_type)
+
+
+def populateUsingSpatialJoinFC(input_dataset, spatialjoin_dataset, update_field, source_field, spatialjoin_type):
+    populateFieldsUsingSpatialJoin(input_dataset, spatialjoin_dataset, [update_field], [source_field],
+                                   spatialjoin_type)
+
+
+def compileFieldMapPlan(map_rows, input_schema, output_schema):
+    """
+    Compiles the rows of a field map table into a plan for mapFields
+
+    Args:
+        map_rows (list): (SourceFieldname, DestinationFieldName) pairs
+        input_schema (list): [name, type, length] of every input field
+        output_schema (list): [name, type, length] of every output field
+
+    Returns:
+        plan (dict): destination fields in name order with their source fields,
+            type and width, plus the source fields missing from the input and
+            the destinations missing from the output
+    """
+    input_fields = dict((f[0].upper(), f) for f in input_schema)
+    output_fields = dict((f[0].upper(), f) for f in output_schema)
+    sources = {}
+    for source, destination in map_rows:
+        sources.setdefault(destination, [])
+        if source not in sources[destination]:
+            sources[destination].append(source)
+
+    plan = {"fields": [], "missing": [], "unused": []}
+    for destination in sorted(sources):
+        # Append ignores field maps that have no matching output field
+        if output_fields and destination.upper() not in output_fields:
+            plan["unused"].append(destination)
+            continue
+        present = [input_fields[s.upper()][0] for s in sources[destination] if s.upper() in input_fields]
+        plan["missing"].extend(s for s in sources[destination] if s.upper() not in input_fields)
+        # the output field takes its properties from the schema, or from the
+        # first source field the way arcpy.FieldMap does
+        template = output_fields.get(destination.upper()) or (input_fields[present[0].upper()] if present
+                                                              else [destination, "String", 255])
+        plan["fields"].append({"destination": output_fields.get(destination.upper(), [destination])[0],
+                               "sources": present, "type": template[1], "length": template[2]})
+    return plan
+
+
+def checkFieldMapPlan(plan, input_dataset):
+    # a source field missing from the input would leave its destination
+    # empty, where arcpy.FieldMap refused to map it
+    if plan["missing"]:
+        raise ValueError("{} has no {} field{} named in the field map table".format(
+            input_dataset, ", ".join(sorted(set(plan["missing"]))), "s" if len(set(plan["missing"])) > 1 else ""))
+
+
+def _fieldConverter(field_type, length):
+    def toText(value):
+        text = value if isinstance(value, string_types) else str(value)
+        return text[:length] if length else text
+
+    def toNumber(cast):
+        def convert(value):
+            try:
+                return cast(value)
+            except (TypeError, ValueError):
+                return None
+        return convert
+
+    if field_type == "String":
+        return toText
+    if field_type in ("Integer", "SmallInteger"):
+        return toNumber(int)
+    if field_type in ("Double", "Single"):
+        return toNumber(float)
+    return lambda value: value
+
+
+def fieldMapTransform(plan):
+    """
+    Builds a pure python row transform from a field map plan
+
+    Args:
+        plan (dict): plan from compileFieldMapPlan or loadFieldMapPlan
+
+    Returns:
+        source_fields (list): fields to read from the input, in row order
+        destination_fields (list): fields the transformed rows are written to
+        transform (function): maps a row of source values to a row of destination values
+    """
+    source_fields = []
+    for field in plan["fields"]:
+        for source in field["sources"]:
+            if source not in source_fields:
+                source_fields.append(source)
+    destination_fields = [field["destination"] for field in plan["fields"]]
+    columns = [([source_fields.index(s) for s in field["sources"]],
+                _fieldConverter(field["type"], field["length"])) for field in plan["fields"]]
+
+    def transform(row):
+        output = []
+        for positions, convert in columns:
+            # like the First merge rule, take the first source that has a value
+            value = None
+            for i in positions:
+                if row[i] is not None:
+                    value = row[i]
+                    break
+            output.append(None if value is None else convert(value))
+        return output
+
+    return source_fields, destination_fields, transform
+
+
+def decodeCitySG26Code(citySG26Code_field):
+    townshipCode_field = citySG26Code_field[:4]
+    extentCode_field = citySG26Code_field[4:8]
+    erfNumber_field = citySG26Code_field[8:16].lstrip('0')
+    portionNumber_field = citySG26Code_field[16:21]
+    remainder_field = citySG26Code_field[24:]
+
+    return [townshipCode_field, extentCode_field, erfNumber_field, portionNumber_field, remainder_field]
+
+
+def _textColumn(matrix):
+    # turn a matrix of code points back into a list of strings
+    if matrix.shape[1] == 0:
+        return [u""] * matrix.shape[0]
+    matrix = numpy.ascontiguousarray(matrix, dtype=numpy.uint32)
+    return matrix.view("U{}".format(matrix.shape[1])).ravel().tolist()
+
+
+def decodeCitySG26Codes(citySG26Codes):
+    """
+    Decodes a whole column of SG26 codes the same way as decodeCitySG26Code
+
+    Args:
+        citySG26Codes (sequence): CITYSG26CO values
+
+    Returns:
+        columns (list): TOWNSHIPCO, EXTENTCO, ERFNO, PORTIONNO and REMAINDER lists
+        malformed (numpy.ndarray): true for codes that are null, shorter than
+            21 characters or have a non numeric erf or portion number
+    """
+    n = len(citySG26Codes)
+    if n == 0:
+        return [[], [], [], [], []], numpy.zeros(0, dtype=bool)
+    text, lengths = _textMatrix(citySG26Codes, 24)
+    missing = numpy.array([not isinstance(code, string_types) for code in citySG26Codes])
+    numbers = text[:, 8:21]
+    malformed = missing | (lengths < 21) | ~((numbers >= 48) & (numbers <= 57)).all(axis=1)
+
+    # strip the leading zeros of the erf number by shifting each row left
+    erf = text[:, 8:16]
+    significant = erf != 48
+    leading = numpy.where(significant.any(axis=1), significant.argmax(axis=1), 8)
+    positions = leading[:, None] + numpy.arange(8)
+    erf = numpy.where(positions < 8, erf[numpy.arange(n)[:, None], numpy.minimum(positions, 7)], 0)
+
+    columns = [_textColumn(text[:, 0:4]), _textColumn(text[:, 4:8]), _textColumn(erf),
+               _textColumn(text[:, 16:21]), _textColumn(text[:, 24:])]
+    for i in numpy.flatnonzero(missing):
+        for column in columns:
+            column[i] = None
+    return columns, malformed
+
+
+DERIVED_FIELDS = ['DESC_', 'TOWNSHIPCO', 'EXTENTCO', 'ERFNO', 'PORTIONNO', 'REMAINDER',
+                   'COUNTRY', 'PROVINCECO', 'CITYNAME']
+MEASURE_FIELDS = ['AREA', 'PERIMETER', 'CENT_X', 'CENT_Y']
+
+
+def _cadastreValues(chunk, country, provcode, city_name, street_suffixes):
+    # DESC_, the decoded SG26 code and the constant fields of a chunk, and the
+    # number of malformed SG26 codes
+    columns, malformed = decodeCitySG26Codes(chunk["CITYSG26CO"])
+    n = len(chunk)
+    values = dict(zip(['TOWNSHIPCO', 'EXTENTCO', 'ERFNO', 'PORTIONNO', 'REMAINDER'], columns))
+    values['DESC_'] = [a + ', ' + b + ', ' + c + ', ' + d for a, b, c, d in
+                       zip(chunk['STREETNO'], chunk['STREETNAME'], street_suffixes, chunk['SUBURBNAME'])]
+    values['COUNTRY'] = [country] * n
+    values['PROVINCECO'] = [provcode] * n
+    values['CITYNAME'] = [city_name] * n
+    return values, int(malformed.sum())
+
+
+def populateCadastreFields(dataset, country, provcode, city_name, chunk_size=100000, backend=None):
+    # DESC_, the decoded SG26 code and the constant fields, computed a chunk at a time
+    malformed_num = [0]
+
+    def transform(chunk):
+        values, malformed = _cadastreValues(chunk, country, provcode, city_name, chunk['STREETSUFF'])
+        malformed_num[0] += malformed
+        return values
+
+    updateTableInChunks(dataset, ['CITYSG26CO', 'STREETNO', 'STREETNAME', 'STREETSUFF', 'SUBURBNAME'],
+                        DERIVED_FIELDS, transform, chunk_size, backend)
+    return malformed_num[0]
+
+
+def deriveCadastreFields(dataset, country, provcode, city_name, chunk_size=100000, backend=None):
+    """
+    Computes every derived field of a formatted cadastre in one read and write
+    pass: the upper case STREETSUFF, AREA, PERIMETER, CENT_X and CENT_Y from
+    the geometry and the fields of populateCadastreFields. AREA and PERIMETER
+    are in square metres and metres and CENT_X and CENT_Y are arcpy's
+    centroid, as the field calculator gave them
+
+    Args:
+        dataset (str): formatted cadastre
+        country (str): COUNTRY value
+        provcode (str): PROVINCECO value
+        city_name (str): CITYNAME value
+        chunk_size (int): number of rows read at a time
+        backend: ArcpyBackend (default), GeoPackageBackend or MemoryBackend
+
+    Returns:
+        malformed_num (int): number of features with a malformed CITYSG26CO code
+    """
+    malformed_num = [0]
+
+    def transform(chunk):
+        # DESC_ is built from the upper case suffix
+        suffixes = [None if suffix is None else suffix.upper() for suffix in chunk['STREETSUFF']]
+        values, malformed = _cadastreValues(chunk, country, provcode, city_name, suffixes)
+        malformed_num[0] += malformed
+        values['STREETSUFF'] = suffixes
+        measures = chunk[MEASURES_FIELD].tolist()
+        values.update((f, [m[i] for m in measures]) for i, f in enumerate(MEASURE_FIELDS))
+        return values
+
+    updateTableInChunks(dataset, [MEASURES_FIELD, 'CITYSG26CO', 'STREETNO', 'STREETNAME', 'STREETSUFF', 'SUBURBNAME'],
+                        ['STREETSUFF'] + MEASURE_FIELDS + DERIVED_FIELDS, transform, chunk_size, backend)
+    return malformed_num[0]
+
+
+# worker processes of the tile parallel mode, 1 runs everything in this process
+PROCESSES = int(os.environ.get("RAMM_PROCESSES", 1))
+
+
+def _runTask(task):
+    # a function and its argument sent to a worker together
+    function, argument = task
+    return function(argument)
+
+
+class WorkerPool(object):
+    """
+    Processes that run the work of the tile parallel mode, started the first
+    time they are needed. With a single process everything runs in this one
+
+    The tool scripts do not guard their top level code, so the scripts are
+    hidden from the workers while they start and only rammcore is imported by
+    them. Inside ArcMap or ArcGIS Pro the workers are started with the python
+    of the ArcGIS install rather than the application itself.
+    """
+
+    def __init__(self, processes=None):
+        self.processes = max(1, int(PROCESSES if processes is None else processes))
+        self.pool = None
+
+    def _start(self):
+        import multiprocessing
+        if os.name == "nt" and not os.path.basename(sys.executable).lower().startswith("python"):
+            multiprocessing.set_executable(os.path.join(sys.exec_prefix, "python.exe"))
+        main = sys.modules.get("__main__")
+        main_file = getattr(main, "__file__", None)
+        if main_file is not None:
+            del main.__file__
+        try:
+            return multiprocessing.Pool(self.processes)
+        finally:
+            if main_file is not None:
+                main.__file__ = main_file
+
+    def map(self, function, tasks):
+        # the result of function for every task, in the order of the tasks
+        tasks = list(tasks)
+        if self.processes == 1 or len(tasks) < 2:
+            return [function(task) for task in tasks]
+        if self.pool is None:
+            self.pool = self._start()
+        return self.pool.map(_runTask, [(function, task) for task in tasks], 1)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None and self.pool is not None:
+            self.pool.terminate()
+        self.close()
+        return False
+
+
+class StageGraph(object):
+    """
+    The stages of a pipeline with the values each one reads and writes. A
+    stage runs once all of its inputs are ready, stages that don't depend on
+    each other side by side in threads
+
+    Stages that call arcpy should stay out of the threads, run them before
+    or after the graph and pass their results in as values.
+    """
+
+    def __init__(self):
+        self.stages = []
+
+    def add(self, name, function, inputs=(), outputs=()):
+        """
+        Args:
+            name (str): name of the stage
+            function (function): takes the inputs in order and returns the
+                output, or a tuple of them when there are several
+            inputs (list): names of the values the stage reads
+            outputs (list): names of the values the stage writes
+        """
+        for stage in self.stages:
+            if stage[0] == name:
+                raise ValueError("The graph already has a stage named {}".format(name))
+            for output in outputs:
+                if output in stage[3]:
+                    raise ValueError("{} is written by both {} and {}".format(output, stage[0], name))
+        self.stages.append((name, function, list(inputs), list(outputs)))
+
+    def waves(self, values=()):
+        """
+        Groups the stages into waves, every stage in a wave only reading the
+        given values and the outputs of earlier waves
+
+        Args:
+            values (iterable): names of the values given to run
+
+        Returns:
+            waves (list): lists of stage names
+        """
+        ready = set(values)
+        remaining = list(self.stages)
+        waves = []
+        while remaining:
+            wave = [stage for stage in remaining if all(name in ready for name in stage[2])]
+            if not wave:
+                raise ValueError("Stages with inputs that are never written or that depend on each other: {}".format(
+                    ", ".join(stage[0] for stage in remaining)))
+            waves.append([stage[0] for stage in wave])
+            for stage in wave:
+                ready.update(stage[3])
+            remaining = [stage for stage in remaining if stage not in wave]
+        return waves
+
+    def run(self, values=None, threads=2):
+        """
+        Runs every stage, a wave at a time
+
+        Args:
+            values (dict): the values the graph starts with
+            threads (int): stages run at the same time, 1 runs them in turn
+
+        Returns:
+            values (dict): the given values and the outputs of every stage
+        """
+        values = dict(values or {})
+        stages = dict((stage[0], stage) for stage in self.stages)
+
+        def runStage(name):
+            name, function, inputs, outputs = stages[name]
+            result = function(*[values[value] for value in inputs])
+            return dict(zip(outputs, [result] if len(outputs) == 1 else result or ()))
+
+        pool = None
+        try:
+            for wave in self.waves(values):
+                if threads > 1 and len(wave) > 1:
+                    if pool is None:
+                        from multiprocessing.pool import ThreadPool
+                        pool = ThreadPool(threads)
+                    results = pool.map(runStage, wave, 1)
+                else:
+                    results = [runStage(name) for name in wave]
+                for result in results:
+                    values.update(result)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        return values
+
+
+def tileSize(extents, tiles):
+    # side of the square tiles that split the combined extents into about this many tiles
+    extents = [extent for extent in extents if extent is not None]
+    if not extents or tiles < 1:
+        return 1.0
+    width = max(e[2] for e in extents) - min(e[0] for e in extents)
+    height = max(e[3] for e in extents) - min(e[1] for e in extents)
+    return math.sqrt(width * height / float(tiles)) or max(width, height) / float(tiles) or 1.0
+
+
+def tileOf(extent, tile_size):
+    # the tile holding the centre of an extent, so a feature straddling a tile
+    # boundary still belongs to exactly one tile
+    if extent is None:
+        return None
+    return (int(math.floor((extent[0] + extent[2]) / 2.0 / tile_size)),
+            int(math.floor((extent[1] + extent[3]) / 2.0 / tile_size)))
+
+
+def partitionByTile(extents, tile_size):
+    """
+    Splits features into tiles by the centre of their extents
+
+    Args:
+        extents (list): (xmin, ymin, xmax, ymax) of every feature, None for
+            features without geometry
+        tile_size (float): side of the square tiles
+
+    Returns:
+        tiles (list): the positions of the features in each tile, tiles in
+            row order followed by the features without geometry
+    """
+    tiles = {}
+    for i, extent in enumerate(extents):
+        tiles.setdefault(tileOf(extent, tile_size), []).append(i)
+    return [tiles[tile] for tile in sorted(tiles, key=lambda tile: (tile is None, tile or (0, 0)))]
+
+
+# coordinates are compared on a 1mm grid when fingerprinting
+FINGERPRINT_PRECISION = 0.001
+
+
+def normalizeRing(ring, precision=FINGERPRINT_PRECISION):
+    """
+    Puts a ring in a canonical form so the same shape always fingerprints the same
+
+    Args:
+        ring (list): (x, y) tuples
+        precision (float): grid the coordinates are snapped to
+
+    Returns:
+        points (list): integer grid points without the closing point, repeated
+            or collinear vertices, starting at the smallest point
+    """
+    points = []
+    for x, y in ring:
+        point = (int(round(x / precision)), int(round(y / precision)))
+        if not points or points[-1] != point:
+            points.append(point)
+    if len(points) > 1 and points[0] == points[-1]:
+        points.pop()
+    changed = True
+    while changed and len(points) > 2:
+        n = len(points)
+        kept = [points[k] for k in range(n)
+                if (points[k][0] - points[k - 1][0]) * (points[(k + 1) % n][1] - points[k - 1][1]) !=
+                (points[k][1] - points[k - 1][1]) * (points[(k + 1) % n][0] - points[k - 1][0])]
+        changed = len(kept) != n
+        points = kept
+    if not points:
+        return points
+    start = points.index(min(points))
+    return points[start:] + points[:start]
+
+
+def _fingerprintText(value):
+    # the same text for a value in Python 2 and 3, floats that are whole numbers as integers
+    if value is None:
+        return u"\x00"
+    if isinstance(value, float):
+        return u"%d" % value if value.is_integer() else u"%r" % value
+    if isinstance(value, bytes):
+        return value.decode("utf-8", "replace")
+    if isinstance(value, string_types):
+        return value
+    return u"{}".format(value)
+
+
+def featureFingerprint(rings, values=(), precision=FINGERPRINT_PRECISION):
+    # hash of the normalized geometry and the attribute values of a feature
+    digest = hashlib.sha1()
+    for ring in rings:
+        points = normalizeRing(ring, precision)
+        digest.update(struct.pack("<q", len(points)))
+        digest.update(struct.pack("<{}q".format(len(points) * 2), *[c for point in points for c in point]))
+    for value in values:
+        digest.update(b"\x1f" + _fingerprintText(value).encode("utf-8"))
+    return digest.hexdigest()[:24]
+
+
+def addFingerprint(fingerprints, key, fingerprint):
+    # features sharing a key are fingerprinted together, in any order
+    if key in fingerprints:
+        fingerprint = "+".join(sorted(fingerprints[key].split("+") + [fingerprint]))
+    fingerprints[key] = fingerprint
+
+
+def _fingerprintTile(task):
+    # fingerprints of the (rings, values) of the features of one tile
+    features, precision = task
+    return [featureFingerprint(rings, values, precision) for rings, values in features]
+
+
+def fingerprintFeatures(features, precision=FINGERPRINT_PRECISION, pool=None, tiles_per_process=4):
+    """
+    Fingerprints features tile by tile in the processes of a pool
+
+    Args:
+        features (list): (rings, values) of every feature
+        precision (float): grid the coordinates are snapped to
+        pool (WorkerPool): processes to use, this one when None
+        tiles_per_process (int): tiles made for every process so a slow tile
+            does not hold up the others
+
+    Returns:
+        fingerprints (list): the fingerprint of every feature, in order
+    """
+    if pool is None or pool.processes == 1:
+        return _fingerprintTile((features, precision))
+    extents = [ringsExtent(rings) for rings, values in features]
+    tiles = partitionByTile(extents, tileSize(extents, pool.processes * tiles_per_process))
+    results = pool.map(_fingerprintTile, [([features[i] for i in tile], precision) for tile in tiles])
+    fingerprints = [None] * len(features)
+    for tile, result in zip(tiles, results):
+        for i, fingerprint in zip(tile, result):
+            fingerprints[i] = fingerprint
+    return fingerprints
+
+
+def fingerprintTable(table, key_field, attribute_fields, precision=FINGERPRINT_PRECISION, backend=None,
+                     pool=None, batch_size=100000):
+    # key to fingerprint of every feature with a key, read in one pass and
+    # fingerprinted a batch at a time in the pool
+    backend = backend or ArcpyBackend()
+    fingerprints = {}
+    rows = backend.iterRows(table, [RINGS_FIELD, key_field] + list(attribute_fields))
+    while True:
+        batch = [row for row in itertools.islice(rows, batch_size) if row[2] is not None]
+        if not batch:
+            break
+        for row, fingerprint in zip(batch, fingerprintFeatures([(row[1], row[3:]) for row in batch],
+                                                              precision, pool)):
+            addFingerprint(fingerprints, row[2], fingerprint)
+    return fingerprints
+
+
+def diffFingerprints(previous, current):
+    """
+    Compares the fingerprints of two deliveries
+
+    Args:
+        previous (dict): key to fingerprint of the last delivery
+        current (dict): key to fingerprint of the new delivery
+
+    Returns:
+        added (list): keys only in the new delivery
+        removed (list): keys only in the last delivery
+        modified (list): keys in both whose geometry or attributes changed
+    """
+    added = [key for key in current if key not in previous]
+    removed = [key for key in previous if key not in current]
+    modified = [key for key, fingerprint in current.items()
+                if key in previous and previous[key] != fingerprint]
+    return added, removed, modified
+
+
+def keyArray(keys):
+    # sorted unique keys, as int64 when every key is a whole number
+    array = numpy.asarray(list(keys))
+    if array.dtype.kind == "f" and numpy.all(numpy.isfinite(array)) and numpy.all(array == numpy.floor(array)):
+        array = array.astype(numpy.int64)
+    elif array.dtype.kind in "iub":
+        array = array.astype(numpy.int64)
+    elif array.dtype.kind not in "U":
+        array = array.astype("U")
+    return numpy.unique(array)
+
+
+def readKeys(table, key_field, backend=None):
+    """
+    Reads only the key column of a table
+
+    Args:
+        table (str): the table
+        key_field (str): the key column
+        backend: ArcpyBackend (default), GeoPackageBackend or MemoryBackend
+
+    Returns:
+        keys (numpy.ndarray): the sorted unique keys, see keyArray
+        null_count (int): rows without a key
+    """
+    backend = backend or ArcpyBackend()
+    values = [row[1] for row in backend.iterRows(table, [key_field])]
+    keys = [value for value in values if value is not None]
+    return keyArray(keys), len(values) - len(keys)
+
+
+def newKeys(previous_keys, current_keys):
+    # keys of current_keys missing from previous_keys, both from keyArray
+    if previous_keys.dtype.kind != current_keys.dtype.kind:
+        previous_keys, current_keys = previous_keys.astype("U"), current_keys.astype("U")
+    return numpy.setdiff1d(current_keys, previous_keys, assume_unique=True)
+
+
+def joinKey(value):
+    # keys read as text, whole numbers or floats match when they are the same
+    # number, eg a LISKEY read from a CSV and the SL_LAND_PR of the cadastre
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else value
+    if isinstance(value, string_types):
+        value = value.strip()
+        if value.isdigit():
+            return int(value)
+        return value or None
+    return value
+
+
+def buildLookup(rows):
+    """
+    Indexes the values of a table by key for joining them onto another table
+    as it is read, keeping the first row of a repeated key as JoinField does
+
+    Args:
+        rows (iterable): (key, values) pairs
+
+    Returns:
+        lookup (dict): joinKey of every key to its values
+        duplicates_num (int): rows whose key was already indexed
+        null_num (int): rows without a key
+    """
+    lookup = {}
+    duplicates_num = 0
+    null_num = 0
+    for key, values in rows:
+        key = joinKey(key)
+        if key is None:
+            null_num += 1
+        elif key in lookup:
+            duplicates_num += 1
+        else:
+            lookup[key] = values
+    return lookup, duplicates_num, null_num
+
+
+def fingerprintIndexPath(dataset):
+    # one index per dataset, kept with the other caches
+    key = hashlib.sha1(os.path.normcase(os.path.abspath(dataset)).encode("utf-8")).hexdigest()
+    return os.path.join(CACHE_FOLDER, "fingerprints", key + ".sqlite")
+
+
+class FingerprintIndex(object):
+    """
+    Fingerprints of a delivery kept between runs in SQLite
+
+    Args:
+        path (str): the index file, created if it doesn't exist
+    """
+
+    def __init__(self, path):
+        folder = os.path.dirname(path)
+        if folder and not os.path.isdir(folder):
+            try:
+                os.makedirs(folder)
+            except OSError:
+                if not os.path.isdir(folder):
+                    raise
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS fingerprints (key PRIMARY KEY, fingerprint TEXT)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)")
+
+    def metadata(self):
+        return dict((name, json.loads(value)) for name, value in
+                    self.connection.execute("SELECT name, value FROM metadata"))
+
+    def load(self):
+        return dict(self.connection.execute("SELECT key, fingerprint FROM fingerprints"))
+
+    def keys(self):
+        return keyArray(key for key, in self.connection.execute("SELECT key FROM fingerprints"))
+
+    def save(self, fingerprints, **metadata):
+        # replaces the whole index in one transaction so it is never half written
+        with self.connection:
+            self.connection.execute("DELETE FROM fingerprints")
+            self.connection.execute("DELETE FROM metadata")
+            self.connection.executemany("INSERT INTO fingerprints VALUES (?, ?)", fingerprints.items())
+            self.connection.executemany("INSERT INTO metadata VALUES (?, ?)",
+                                        ((name, json.dumps(value)) for name, value in metadata.items()))
+
+    def close(self):
+        self.connection.close()
+
+
+def _packFeatures(features):
+    # rings and attribute values of the features sharing a key, compressed
+    parts = []
+    for rings, values in features:
+        wkb = ringsToWKB(rings)
+        text = json.dumps(list(values), default=_fingerprintText).encode("utf-8")
+        parts.append(struct.pack("<II", len(wkb), len(text)) + wkb + text)
+    return sqlite3.Binary(zlib.compress(b"".join(parts)))
+
+
+def _unpackFeatures(blob):
+    data = zlib.decompress(bytes(blob))
+    features = []
+    offset = 0
+    while offset < len(data):
+        wkb_length, text_length = struct.unpack_from("<II", data, offset)
+        offset += 8
+        rings = ringsFromWKB(data[offset:offset + wkb_length])
+        offset += wkb_length
+        values = json.loads(data[offset:offset + text_length].decode("utf-8"))
+        offset += text_length
+        features.append((rings, values))
+    return features
+
+
+class SnapshotStore(object):
+    """
+    Every delivery of a cadastre kept in SQLite as the parcels that changed
+    since the delivery before it
+
+    A parcel is only stored again when its fingerprint changed, and a removed
+    parcel is stored without its geometry and attributes. Any snapshot can be
+    read back whole, and the changes between any two are found from the
+    parcels stored between them without reading either snapshot.
+
+    Args:
+        path (str): the store file, created if it doesn't exist
+    """
+
+    def __init__(self, path):
+        folder = os.path.dirname(path)
+        if folder and not os.path.isdir(folder):
+            try:
+                os.makedirs(folder)
+            except OSError:
+                if not os.path.isdir(folder):
+                    raise
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS snapshots (id INTEGER PRIMARY KEY, name TEXT UNIQUE, "
+                                    "fields TEXT, field_types TEXT, created TEXT, summary TEXT, metadata TEXT)")
+            # the fingerprint and features of a key from a snapshot on, a
+            # NULL fingerprint when it was removed in that snapshot
+            self.connection.execute("CREATE TABLE IF NOT EXISTS parcels (key, snapshot INTEGER, fingerprint TEXT, "
+                                    "features BLOB, PRIMARY KEY (key, snapshot))")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS parcels_snapshot ON parcels (snapshot)")
+            # the fingerprint of every key in the latest snapshot
+            self.connection.execute("CREATE TABLE IF NOT EXISTS head (key PRIMARY KEY, fingerprint TEXT)")
+
+    def snapshots(self):
+        # name, creation time, fields and change counts of every snapshot, oldest first
+        snapshots = []
+        for name, fields, created, summary in self.connection.execute(
+                "SELECT name, fields, created, summary FROM snapshots ORDER BY id"):
+            snapshot = {"name": name, "fields": json.loads(fields), "created": created}
+            snapshot.update(json.loads(summary))
+            snapshots.append(snapshot)
+        return snapshots
+
+    def _id(self, name):
+        row = self.connection.execute("SELECT id FROM snapshots WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            raise ValueError("The snapshot store has no snapshot named {}".format(name))
+        return row[0]
+
+    def fields(self, name):
+        # the fields of a snapshot and their (type, length) when they were given
+        fields, field_types = self.connection.execute(
+            "SELECT fields, field_types FROM snapshots WHERE id = ?", (self._id(name),)).fetchone()
+        return json.loads(fields), json.loads(field_types)
+
+    def metadata(self, name):
+        return json.loads(self.connection.execute(
+            "SELECT metadata FROM snapshots WHERE id = ?", (self._id(name),)).fetchone()[0])
+
+    def _stored(self, key):
+        # the features of a key in the latest snapshot
+        row = self.connection.execute("SELECT features FROM parcels WHERE key = ? ORDER BY snapshot DESC LIMIT 1",
+                                      (key,)).fetchone()
+        return _unpackFeatures(row[0]) if row is not None and row[0] is not None else []
+
+    def ingest(self, name, features, fields, field_types=None, precision=FINGERPRINT_PRECISION, **metadata):
+        """
+        Adds a delivery as the latest snapshot, storing only the parcels that
+        were added or modified since the previous one and the removed keys
+
+        Args:
+            name (str): name of the snapshot, eg the delivery dataset
+            features (iterable): (key, rings, values) of every parcel with
+                values in the order of fields. Parcels without a key are skipped
+            fields (list): names of the attribute fields
+            field_types (dict): optional field name to (type, length), used
+                to create the feature class a snapshot is read back into
+            precision (float): grid the coordinates are compared on
+            metadata: anything else to keep with the snapshot, eg its
+                spatial reference
+
+        Returns:
+            added (list): keys that are new in this snapshot
+            removed (list): keys of the previous snapshot no longer delivered
+            modified (list): keys whose geometry or attributes changed
+        """
+        if self.connection.execute("SELECT 1 FROM snapshots WHERE name = ?", (name,)).fetchone():
+            raise ValueError("The snapshot store already has a snapshot named {}".format(name))
+        previous = self.connection.execute("SELECT fields FROM snapshots ORDER BY id DESC LIMIT 1").fetchone()
+        head = dict(self.connection.execute("SELECT key, fingerprint FROM head"))
+        # every parcel is stored again when the fields changed, so older
+        # parcels never need reading with the fields of a later snapshot
+        same_fields = previous is not None and [f.upper() for f in json.loads(previous[0])] == [
+            f.upper() for f in fields]
+        current = {}
+        # the features that differ from the previous snapshot, and the keys
+        # with a feature that does not, which was its only feature
+        changed = {}
+        unchanged = set()
+        count = 0
+        for key, rings, values in features:
+            if key is None:
+                continue
+            count += 1
+            fingerprint = featureFingerprint(rings, values, precision)
+            addFingerprint(current, key, fingerprint)
+            if same_fields and head.get(key) == fingerprint:
+                unchanged.add(key)
+            else:
+                changed.setdefault(key, []).append((rings, list(values)))
+        added, removed, modified = diffFingerprints(head, current)
+        stored = added + modified if same_fields else list(current)
+
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO snapshots (name, fields, field_types, created, summary, metadata) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (name, json.dumps(list(fields)), json.dumps(field_types or {}),
+                 time.strftime("%Y-%m-%dT%H:%M:%S"),
+                 json.dumps({"count": count, "added": len(added), "removed": len(removed),
+                             "modified": len(modified)}), json.dumps(metadata)))
+            snapshot = cursor.lastrowid
+            rows = []
+            for key in stored:
+                key_features = changed.get(key, [])
+                if key in unchanged:
+                    key_features = self._stored(key) + key_features
+                rows.append((key, snapshot, current[key], _packFeatures(key_features)))
+            self.connection.executemany("INSERT INTO parcels VALUES (?, ?, ?, ?)", rows)
+            self.connection.executemany("INSERT INTO parcels VALUES (?, ?, NULL, NULL)",
+                                        ((key, snapshot) for key in removed))
+            self.connection.executemany("DELETE FROM head WHERE key = ?", ((key,) for key in removed))
+            self.connection.executemany("INSERT OR REPLACE INTO head VALUES (?, ?)",
+                                        ((key, current[key]) for key in stored))
+        return added, removed, modified
+
+    def diff(self, first, second):
+        """
+        The changes between two snapshots, found from the parcels stored
+        after the older one up to the newer one
+
+        Args:
+            first (str): name of the snapshot compared from
+            second (str): name of the snapshot compared to, older or newer
+
+        Returns:
+            added (list): keys in second but not first
+            removed (list): keys in first but not second
+            modified (list): keys in both whose geometry or attributes differ
+        """
+        older, newer = self._id(first), self._id(second)
+        if older > newer:
+            removed, added, modified = self.diff(second, first)
+            return added, removed, modified
+        rows = self.connection.execute(
+            "SELECT changed.key, "
+            "(SELECT fingerprint FROM parcels p WHERE p.key = changed.key AND p.snapshot <= ? "
+            "ORDER BY p.snapshot DESC LIMIT 1), "
+            "(SELECT fingerprint FROM parcels p WHERE p.key = changed.key AND p.snapshot <= ? "
+            "ORDER BY p.snapshot DESC LIMIT 1) "
+            "FROM (SELECT DISTINCT key FROM parcels WHERE snapshot > ? AND snapshot <= ?) changed",
+            (older, newer, older, newer))
+        added, removed, modified = [], [], []
+        for key, before, after in rows:
+            if before is None and after is not None:
+                added.append(key)
+            elif before is not None and after is None:
+                removed.append(key)
+            elif before != after:
+                modified.append(key)
+        return added, removed, modified
+
+    def materialize(self, name, keys=None, batch_size=500):
+        """
+        Reads a snapshot back from the parcels stored up to it
+
+        Args:
+            name (str): the snapshot
+            keys (iterable): only read these keys, eg from diff
+            batch_size (int): keys looked up per query
+
+        Returns:
+            features (generator): (key, rings, values) of every parcel of the
+                snapshot, values in the order of its fields
+        """
+        snapshot = self._id(name)
+        sql = ("SELECT p.key, p.features FROM parcels p JOIN (SELECT key, MAX(snapshot) AS latest FROM parcels "
+               "WHERE snapshot <= ?{} GROUP BY key) l ON p.key = l.key AND p.snapshot = l.latest "
+               "WHERE p.fingerprint IS NOT NULL ORDER BY p.key")
+        if keys is None:
+            batches = [(sql.format(""), (snapshot,))]
+        else:
+            keys = list(keys)
+            batches = ((sql.format(" AND key IN ({})".format(", ".join("?" * len(batch)))), [snapshot] + batch)
+                       for batch in (keys[i:i + batch_size] for i in range(0, len(keys), batch_size)))
+        for query, parameters in batches:
+            for key, blob in self.connection.execute(query, parameters).fetchall():
+                for rings, values in _unpackFeatures(blob):
+                    yield key, rings, values
+
+    def close(self):
+        self.connection.close()
+
+
+def ingestTable(store, name, table, key_field, fields, precision=FINGERPRINT_PRECISION, backend=None):
+    # adds a table to a SnapshotStore as its latest snapshot, read in one pass
+    backend = backend or ArcpyBackend()
+    rows = backend.iterRows(table, [RINGS_FIELD, key_field] + list(fields))
+    return store.ingest(name, ((row[2], row[1], row[3:]) for row in rows), fields, precision=precision)
+
+
+# flags of a change in the order they decide its output, see classifyChanges
+CHANGE_FLAGS = ("ROADRESERVE", "SLIVER", "OVERLAP")
+
+
+def classifyChanges(changes, roads, master, area_threshold=3.0, road_lines=False):
+    """
+    Flags every change that intersects a road, is smaller than the area
+    threshold or intersects the master cadastre, reading roads and master once
+
+    The changes are indexed rather than the roads and master so memory stays
+    proportional to the number of changes however large the master is.
+
+    Args:
+        changes (list): (oid, rings, area) of every change, area is computed
+            from the rings when it is None
+        roads (iterable): rings, or paths when road_lines is true, of every road
+        master (iterable): rings of every master cadastre parcel
+        area_threshold (float): changes smaller than this are slivers
+        road_lines (bool): roads are polylines rather than polygons
+
+    Returns:
+        flags (dict): oid to the CHANGE_FLAGS that apply, in CHANGE_FLAGS order
+    """
+    prepared = [PreparedPolygon(rings) for oid, rings, area in changes]
+    index = STRtree([(p.extent, i) for i, p in enumerate(prepared) if p.extent is not None])
+    found = [set() for change in changes]
+    for i, (oid, rings, area) in enumerate(changes):
+        if (polygonArea(rings) if area is None else area) < area_threshold:
+            found[i].add("SLIVER")
+
+    def intersecting(features, flag, lines=False):
+        for rings in features:
+            extent = ringsExtent(rings)
+            if extent is None:
+                continue
+            candidates = [i for i in index.query(extent) if flag not in found[i]]
+            if not candidates:
+                continue
+            feature = None if lines else PreparedPolygon(rings)
+            for i in candidates:
+                if prepared[i].intersectsPaths(rings) if lines else prepared[i].intersects(feature):
+                    found[i].add(flag)
+
+    intersecting(roads, "ROADRESERVE", road_lines)
+    intersecting(master, "OVERLAP")
+    return dict((oid, [f for f in CHANGE_FLAGS if f in found[i]]) for i, (oid, rings, area) in enumerate(changes))
+
+
+def _classifyTile(task):
+    # classifyChanges for the changes of one tile
+    return classifyChanges(*task)
+
+
+def classifyChangesByTile(changes, roads, master, area_threshold=3.0, road_lines=False, pool=None,
+                          tiles_per_process=4):
+    """
+    classifyChanges with the changes split into tiles that are classified in
+    the processes of a pool
+
+    Every change belongs to the tile holding the centre of its extent, while
+    the roads and master parcels are sent to every tile whose changes they
+    may touch, so the flags are the same as classifying all of them at once.
+
+    Args:
+        changes (list): (oid, rings, area) of every change
+        roads (iterable): rings, or paths when road_lines is true, of the roads
+        master (iterable): rings of the master cadastre parcels
+        area_threshold (float): changes smaller than this are slivers
+        road_lines (bool): roads are polylines rather than polygons
+        pool (WorkerPool): processes to use, this one when None
+        tiles_per_process (int): tiles made for every process
+
+    Returns:
+        flags (dict): oid to the CHANGE_FLAGS that apply, see classifyChanges
+    """
+    if pool is None or pool.processes == 1:
+        return classifyChanges(changes, roads, master, area_threshold, road_lines)
+    extents = [ringsExtent(rings) for oid, rings, area in changes]
+    tiles = partitionByTile(extents, tileSize(extents, pool.processes * tiles_per_process))
+    bounds = []
+    for tile in tiles:
+        tile_extents = [extents[i] for i in tile if extents[i] is not None]
+        bounds.append((min(e[0] for e in tile_extents), min(e[1] for e in tile_extents),
+                       max(e[2] for e in tile_extents), max(e[3] for e in tile_extents))
+                      if tile_extents else None)
+    index = STRtree([(extent, t) for t, extent in enumerate(bounds) if extent is not None])
+
+    def byTile(features):
+        found = [[] for tile in tiles]
+        for rings in features:
+            extent = ringsExtent(rings)
+            if extent is not None:
+                for t in index.query(extent):
+                    found[t].append(rings)
+        return found
+
+    tile_roads = byTile(roads)
+    tile_master = byTile(master)
+    flags = {}
+    for result in pool.map(_classifyTile, [([changes[i] for i in tile], tile_roads[t], tile_master[t],
+                                            area_threshold, road_lines) for t, tile in enumerate(tiles)]):
+        flags.update(result)
+    return flags
+
+
+def changeCategory(flags):
+    # the output a change is written to, the first of its flags
+    return flags[0] if flags else "LEGITIMATE"
+
+
+def findDuplicates(records, stages):
+    """
+    Runs a chain of identical feature checks over records read once
+
+    Every stage groups the features still left by the earlier stages, the way
+    consecutive FindIdentical and DeleteIdentical calls would see them.
+
+    Args:
+        records (list): (oid, values) pairs where values maps each field
+            name, and SHAPE to the geometry fingerprint, to its value
+        stages (list): (name, fields, action) tuples where action is DELETE
+            to drop all but the first feature of a group, EXTRACT to drop the
+            whole group or REPORT to keep it
+
+    Returns:
+        results (list): a dict per stage with the name, the fields, the groups
+            of object ids with more than one member ordered by their first
+            object id, the number of features in them and the removed object ids
+    """
+    remaining = sorted(records, key=lambda record: record[0])
+    results = []
+    for name, fields, action in stages:
+        if action not in ("DELETE", "EXTRACT", "REPORT"):
+            raise ValueError("Unsupported duplicate action: {}".format(action))
+        groups = {}
+        for oid, values in remaining:
+            groups.setdefault(tuple(values[f] for f in fields), []).append(oid)
+        duplicates = sorted((group for group in groups.values() if len(group) > 1), key=lambda group: group[0])
+        removed = set()
+        for group in duplicates:
+            if action == "DELETE":
+                removed.update(group[1:])
+            elif action == "EXTRACT":
+                removed.update(group)
+        remaining = [record for record in remaining if record[0] not in removed]
+        results.append({"name": name, "fields": list(fields), "groups": duplicates,
+                        "count": sum(len(group) for group in duplicates), "removed": removed})
+    return results
+
+
+# legal statuses in the order a feature of a group of identical geometries is kept
+LEGAL_STATUSES = ("Registered", "Confirmed", "SG Approved")
+
+
+def _hasUniqueValue(values):
+    # some value appears once, so a FindIdentical of the values leaves features out
+    counts = {}
+    for value in values:
+        counts[value] = counts.get(value, 0) + 1
+    return any(count == 1 for count in counts.values())
+
+
+def resolveIdenticalGroup(features):
+    """
+    Picks the features to keep of a group of features with identical geometry
+
+    When the billings differ the features with a Total_BillCount of 0 are
+    dropped, and the one left is kept if there is only one. When the legal
+    statuses differ a sole Registered, then Confirmed and then SG Approved
+    feature is kept, or the choice narrows to the features of the first of
+    those statuses with more than one. Otherwise the features of the choice
+    with its highest LISKEY are kept.
+
+    Args:
+        features (list): (oid, liskey, bill_count, legal_status) of every
+            feature of the group
+
+    Returns:
+        kept (list): object ids of the features to keep, in group order
+    """
+    candidates = list(features)
+    if _hasUniqueValue([bill_count for oid, liskey, bill_count, legal_status in candidates]):
+        billed = [feature for feature in candidates if feature[2] != 0]
+        if len(billed) == 1:
+            return [billed[0][0]]
+        candidates = billed or candidates
+    if _hasUniqueValue([legal_status for oid, liskey, bill_count, legal_status in candidates]):
+        for status in LEGAL_STATUSES:
+            members = [feature for feature in candidates if feature[3] == status]
+            if len(members) == 1:
+                return [members[0][0]]
+            if members:
+                candidates = members
+                break
+    liskeys = [feature[1] for feature in candidates if feature[1] is not None]
+    if not liskeys:
+        return [feature[0] for feature in candidates]
+    highest = max(liskeys)
+    return [feature[0] for feature in candidates if feature[1] == highest]
+
+
+DISPOSITIONS = ("keep", "delete", "Road_Reserves", "Sliver_Polygons", "Zoning_Case_A", "Zoning_Case_B")
+
+RULE_OPERATORS = ("=", "<>", "<", "<=", ">", ">=", "IN", "LIKE", "IS NULL", "IS NOT NULL")
+
+
+def _nullMask(column):
+    # true where a column is null, NaN in numeric columns
+    if column.dtype.kind == "f":
+        return numpy.isnan(column)
+    return numpy.array([v is None for v in column.tolist()], dtype=bool)
+
+
+def likeMask(text, pattern):
+    """
+    Where a text column matches a LIKE pattern, case sensitive. Only leading
+    and trailing % wildcards are supported
+
+    Args:
+        text (numpy.ndarray): unicode column with nulls as empty strings
+        pattern (str): eg Transport%, %Transport% or % Transport %
+
+    Returns:
+        mask (numpy.ndarray): boolean column
+    """
+    value = pattern.strip("%")
+    if "%" in value or "_" in value:
+        raise ValueError("Unsupported LIKE pattern: {}".format(pattern))
+    if pattern.startswith("%") and pattern.endswith("%") and len(pattern) > 1:
+        return numpy.char.find(text, value) >= 0
+    if pattern.endswith("%"):
+        return numpy.char.startswith(text, value)
+    if pattern.startswith("%"):
+        return numpy.char.endswith(text, value)
+    return text == value
+
+
+def ruleMasks(columns, rules):
+    """
+    Where every rule of a rule table holds, each rule on its own, so parts of
+    a table can be checked separately and merged with mergeRuleMasks
+
+    Args:
+        columns (dict): field name to numpy column, numeric columns with NaN
+            for nulls and the others as objects, see chunkToArray
+        rules (list): (name, disposition, conditions) tuples. A row meets a
+            rule when it meets all of its conditions, (field, operator, value)
+            tuples with an operator of RULE_OPERATORS. The value of IS NULL
+            and IS NOT NULL is ignored and IN takes a list
+
+    Returns:
+        masks (list): boolean column of every rule
+    """
+    size = len(next(iter(columns.values()))) if columns else 0
+    nulls = {}
+    texts = {}
+    masks = []
+    for name, disposition, conditions in rules:
+        mask = numpy.ones(size, dtype=bool)
+        for field, operator, value in conditions:
+            if not mask.any():
+                break
+            if operator not in RULE_OPERATORS:
+                raise ValueError("Unsupported rule operator: {}".format(operator))
+            column = columns[field]
+            if field not in nulls:
+                nulls[field] = _nullMask(column)
+            if operator == "IS NULL":
+                mask &= nulls[field]
+            elif operator == "IS NOT NULL":
+                mask &= ~nulls[field]
+            elif operator == "LIKE":
+                if field not in texts:
+                    texts[field] = numpy.array([v if isinstance(v, string_types) else u"" for v in column.tolist()],
+                                               dtype="U")
+                mask &= likeMask(texts[field], value) & ~nulls[field]
+            elif operator == "IN":
+                found = numpy.zeros(size, dtype=bool)
+                for item in value:
+                    found |= column == item
+                mask &= found & ~nulls[field]
+            else:
+                # nulls never meet a comparison, nor are they compared
+                compare = {"=": numpy.equal, "<>": numpy.not_equal, "<": numpy.less, "<=": numpy.less_equal,
+                           ">": numpy.greater, ">=": numpy.greater_equal}[operator]
+                found = numpy.zeros(size, dtype=bool)
+                valid = ~nulls[field]
+                found[valid] = compare(column[valid], value)
+                mask &= found
+        masks.append(mask)
+    return masks
+
+
+def mergeRuleMasks(masks, size):
+    """
+    Finds the first rule every row meets from the masks of ruleMasks
+
+    Args:
+        masks (list): boolean column of every rule, in priority order
+        size (int): number of rows
+
+    Returns:
+        matched (numpy.ndarray): index of the rule of every row, -1 for rows
+            that meet none
+    """
+    matched = numpy.empty(size, dtype=numpy.int64)
+    matched.fill(-1)
+    for i, mask in enumerate(masks):
+        matched[(matched < 0) & mask] = i
+    return matched
+
+
+def evaluateRules(columns, rules):
+    """
+    Finds the first rule of a rule table every row meets, a column at a time
+    rather than a row at a time
+
+    Args:
+        columns (dict): field name to numpy column, see ruleMasks
+        rules (list): (name, disposition, conditions) tuples in priority
+            order, see ruleMasks
+
+    Returns:
+        matched (numpy.ndarray): index of the rule of every row, -1 for rows
+            that meet none
+    """
+    size = len(next(iter(columns.values()))) if columns else 0
+    return mergeRuleMasks(ruleMasks(columns, rules), size)
+
+
+def ruleDispositions(matched, rules):
+    # the disposition of every row of evaluateRules, keep for rows that met no rule
+    dispositions = numpy.array([disposition for name, disposition, conditions in rules] + ["keep"], dtype=object)
+    return dispositions[matched]
+
+
+def ruleCounts(matched, rules):
+    # number of rows decided by the rules of every name
+    counts = dict((name, 0) for name, disposition, conditions in rules)
+    for i, count in enumerate(numpy.bincount(matched[matched >= 0], minlength=len(rules)).tolist()):
+        counts[rules[i][0]] += count
+    return counts
+
+
+def geometryCachePath():
+    # one cache for every dataset, a geometry CheckGeometry found no problem
+    # with is valid in any dataset with the same tolerances
+    return os.path.join(CACHE_FOLDER, "valid_geometries.sqlite")
+
+
+class GeometryCache(object):
+    """
+    The geometries CheckGeometry found no problems with, by geometryHash and
+    the spatial reference settings they were checked with, kept between runs
+    in SQLite
+
+    Args:
+        path (str): the cache file, created if it doesn't exist
+    """
+
+    def __init__(self, path):
+        folder = os.path.dirname(path)
+        if folder and not os.path.isdir(folder):
+            try:
+                os.makedirs(folder)
+            except OSError:
+                if not os.path.isdir(folder):
+                    raise
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS valid (settings TEXT, hash TEXT, "
+                                    "PRIMARY KEY (settings, hash))")
+
+    def lookup(self, settings, hashes, batch_size=500):
+        # the hashes already found valid with these settings
+        hashes = list(set(hashes))
+        found = set()
+        for i in range(0, len(hashes), batch_size):
+            batch = hashes[i:i + batch_size]
+            rows = self.connection.execute("SELECT hash FROM valid WHERE settings = ? AND hash IN ({})".format(
+                ", ".join("?" * len(batch))), [settings] + batch)
+            found.update(key for key, in rows)
+        return found
+
+    def add(self, settings, hashes):
+        # remembers the hashes newly found valid with these settings
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO valid VALUES (?, ?)",
+                                        ((settings, key) for key in hashes))
+
+    def close(self):
+        self.connection.close()
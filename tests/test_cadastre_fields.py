@@ -0,0 +1,125 @@
+"""The derived cadastre fields against the update cursor they replaced"""
+
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rammcore
+
+ADDRESS_FIELDS = ['CITYSG26CO', 'STREETNO', 'STREETNAME', 'STREETSUFF', 'SUBURBNAME']
+
+
+def randomCodes(rng, n):
+    codes = []
+    for i in range(n):
+        length = rng.choice([21, 21, 21, 25, 30, 10, 0, 3, 24])
+        codes.append("".join(rng.choice("0000000123456789ABC") for k in range(length)))
+    return codes + ["C0160000000000000000000RE", "C01600000000001200001", u"\xe90160000abc"]
+
+
+def cursorFields(row, country, provcode, city_name):
+    # the update cursor of Get Cadastre Changes after STREETSUFF was made upper case
+    x = [None] * 16
+    x[6:11] = [row[f] for f in ADDRESS_FIELDS]
+    x[9] = x[9].upper()
+    x[0] = x[7] + ', ' + x[8] + ', ' + x[9] + ', ' + x[10]
+    [x[1], x[2], x[3], x[4], x[5]] = rammcore.decodeCitySG26Code(x[6])
+    x[13] = country
+    x[14] = provcode
+    x[15] = city_name
+    return dict(zip(['DESC_', 'TOWNSHIPCO', 'EXTENTCO', 'ERFNO', 'PORTIONNO', 'REMAINDER', 'CITYSG26CO',
+                     'STREETNO', 'STREETNAME', 'STREETSUFF', 'SUBURBNAME', 'CENT_X', 'CENT_Y',
+                     'COUNTRY', 'PROVINCECO', 'CITYNAME'], x))
+
+
+def rectangle(x0, y0, x1, y1):
+    return [[(x0, y0), (x0, y1), (x1, y1), (x1, y0), (x0, y0)]]
+
+
+class DecodeCitySG26CodesTest(unittest.TestCase):
+
+    def testMatchesRowFunction(self):
+        codes = randomCodes(random.Random(5), 3000)
+        columns, malformed = rammcore.decodeCitySG26Codes(codes)
+        for i, code in enumerate(codes):
+            self.assertEqual([column[i] for column in columns], rammcore.decodeCitySG26Code(code))
+            self.assertEqual(malformed[i], len(code) < 21 or not code[8:21].isdigit())
+
+    def testNull(self):
+        columns, malformed = rammcore.decodeCitySG26Codes(["C01600000000012300000", None])
+        self.assertEqual([column[1] for column in columns], [None] * 5)
+        self.assertEqual(malformed.tolist(), [False, True])
+
+    def testEmpty(self):
+        columns, malformed = rammcore.decodeCitySG26Codes([])
+        self.assertEqual(columns, [[], [], [], [], []])
+        self.assertEqual(len(malformed), 0)
+
+
+class CadastreFieldsTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(7)
+        self.rows = []
+        for i, code in enumerate(randomCodes(rng, 200)):
+            self.rows.append({'CITYSG26CO': code, 'STREETNO': str(rng.randint(1, 99)),
+                              'STREETNAME': rng.choice(["Main", "Long", "Church"]),
+                              'STREETSUFF': rng.choice(["rd", "St", "AVE"]), 'SUBURBNAME': rng.choice(["A", "B"]),
+                              'SHAPE': rectangle(i * 20.0, 0.0, i * 20.0 + 10.0 + i % 3, 5.0)})
+        self.backend = rammcore.MemoryBackend()
+        self.backend.addTable("cadastre", [(f, "String") for f in ADDRESS_FIELDS + rammcore.DERIVED_FIELDS] +
+                              [(f, "Double") for f in rammcore.MEASURE_FIELDS], self.rows)
+
+    def testDeriveCadastreFields(self):
+        malformed_num = rammcore.deriveCadastreFields("cadastre", "ZA", "WC", "Cape Town", chunk_size=64,
+                                                      backend=self.backend)
+        self.assertEqual(malformed_num, sum(1 for row in self.rows if len(row['CITYSG26CO']) < 21 or
+                                            not row['CITYSG26CO'][8:21].isdigit()))
+        for i, row in enumerate(self.rows):
+            written = self.backend.tables["cadastre"]["rows"][i + 1]
+            expected = cursorFields(row, "ZA", "WC", "Cape Town")
+            for field in ['STREETSUFF'] + rammcore.DERIVED_FIELDS:
+                self.assertEqual(written[field], expected[field])
+            width = 10.0 + i % 3
+            self.assertAlmostEqual(written['AREA'], width * 5.0)
+            self.assertAlmostEqual(written['PERIMETER'], 2 * (width + 5.0))
+            self.assertAlmostEqual(written['CENT_X'], i * 20.0 + width / 2)
+            self.assertAlmostEqual(written['CENT_Y'], 2.5)
+
+    def testPopulateCadastreFields(self):
+        # the suffix is used as it is
+        rammcore.populateCadastreFields("cadastre", "ZA", "WC", "Cape Town", chunk_size=64, backend=self.backend)
+        for i, row in enumerate(self.rows):
+            written = self.backend.tables["cadastre"]["rows"][i + 1]
+            expected = cursorFields(dict(row, STREETSUFF="@"), "ZA", "WC", "Cape Town")
+            self.assertEqual(written['DESC_'], expected['DESC_'].replace("@", row['STREETSUFF']))
+            self.assertEqual(written['STREETSUFF'], row['STREETSUFF'])
+            for field in rammcore.DERIVED_FIELDS[1:]:
+                self.assertEqual(written[field], expected[field])
+
+
+class PolygonMeasuresTest(unittest.TestCase):
+
+    def testCentroidOutsideTheShape(self):
+        # a U shape has its centroid in the gap, the label point is used instead
+        ring = [(0, 0), (0, 10), (2, 10), (2, 2), (8, 2), (8, 10), (10, 10), (10, 0), (0, 0)]
+        area, perimeter, x, y = rammcore.polygonMeasures([ring])
+        self.assertAlmostEqual(area, 10 * 10 - 6 * 8)
+        self.assertAlmostEqual(perimeter, 56)
+        self.assertTrue(rammcore.pointInRing(x, y, ring))
+
+    def testFarFromTheOrigin(self):
+        area, perimeter, x, y = rammcore.polygonMeasures(rectangle(-3.7e6, 5e6, -3.7e6 + 0.5, 5e6 + 0.25))
+        self.assertAlmostEqual(area, 0.125, places=6)
+        self.assertAlmostEqual(x, -3.7e6 + 0.25, places=6)
+        self.assertAlmostEqual(y, 5e6 + 0.125, places=6)
+
+    def testEmpty(self):
+        self.assertEqual(rammcore.polygonMeasures([]), (None, None, None, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
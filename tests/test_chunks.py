@@ -0,0 +1,123 @@
+"""Reading and writing tables a chunk at a time with the arcpy free backends"""
+
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy
+import rammcore
+
+METRES = ('PROJCS["Hartebeesthoek94 / Lo19",GEOGCS["Hartebeesthoek94"],PROJECTION["Transverse_Mercator"],'
+          'UNIT["metre",1]]')
+DEGREES = 'GEOGCS["Hartebeesthoek94",DATUM["Hartebeesthoek94"],UNIT["degree",0.0174532925199433]]'
+
+
+class CountingBackend(rammcore.MemoryBackend):
+    # records the object ids of every write
+
+    def __init__(self, tables=None):
+        rammcore.MemoryBackend.__init__(self, tables)
+        self.writes = []
+
+    def writeRows(self, table, fields, updates):
+        self.writes.append(sorted(updates))
+        rammcore.MemoryBackend.writeRows(self, table, fields, updates)
+
+
+class MemoryChunksTest(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = CountingBackend()
+        self.backend.addTable("table", [("A", "Integer"), ("B", "Double"), ("C", "String")],
+                              [{"A": i, "B": None if i % 3 else i * 0.5, "C": "c{}".format(i)} for i in range(30)])
+
+    def testReadChunks(self):
+        chunks = list(rammcore.readChunks("table", ["A", "B", "C"], 7, self.backend))
+        self.assertEqual([len(oids) for oids, chunk in chunks], [7, 7, 7, 7, 2])
+        oids, chunk = chunks[0]
+        self.assertEqual(oids.tolist(), list(range(1, 8)))
+        self.assertEqual(chunk["A"].dtype, numpy.float64)
+        self.assertTrue(numpy.isnan(chunk["B"][1]))
+        self.assertEqual(chunk["C"].tolist(), ["c{}".format(i) for i in range(7)])
+        where = list(rammcore.readChunks("table", ["A"], 7, self.backend, lambda row: row["A"] >= 25))
+        self.assertEqual(where[0][0].tolist(), [26, 27, 28, 29, 30])
+
+    def testEveryChunkIsWrittenBeforeTheNextIsRead(self):
+        read = []
+
+        def transform(chunk):
+            read.append(len(self.backend.writes))
+            return {"B": numpy.where(numpy.isnan(chunk["B"]), chunk["A"], chunk["B"])}
+
+        updated_num = rammcore.updateTableInChunks("table", ["A", "B"], ["B"], transform, 10, self.backend)
+        self.assertEqual(read, [0, 1, 2])
+        # the rows whose value is already right are not written
+        self.assertEqual(self.backend.writes, [[oid for oid in range(k, k + 10) if (oid - 1) % 3]
+                                               for k in (1, 11, 21)])
+        self.assertEqual(updated_num, 20)
+        rows = self.backend.tables["table"]["rows"]
+        self.assertEqual([rows[oid]["B"] for oid in range(1, 5)], [0.0, 1, 2, 1.5])
+        # integers are written back as integers and NaN as null
+        rammcore.updateTableInChunks("table", ["A"], ["A"], lambda chunk: {"A": numpy.where(
+            chunk["A"] > 27, numpy.nan, chunk["A"] * 2)}, 10, self.backend)
+        self.assertEqual([rows[oid]["A"] for oid in (2, 29, 30)], [2, None, None])
+        self.assertTrue(isinstance(rows[2]["A"], int))
+
+    def testNothingChanged(self):
+        self.assertEqual(rammcore.updateTableInChunks("table", ["C"], ["C"], lambda chunk: {"C": chunk["C"]},
+                                                      10, self.backend), 0)
+        self.assertEqual(self.backend.writes, [])
+
+
+class GeoPackageChunksTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "parcels.gpkg")
+        connection = sqlite3.connect(self.path)
+        connection.execute("CREATE TABLE gpkg_spatial_ref_sys (srs_id INTEGER PRIMARY KEY, definition TEXT)")
+        connection.execute("CREATE TABLE gpkg_geometry_columns (table_name TEXT, column_name TEXT, srs_id INTEGER)")
+        connection.executemany("INSERT INTO gpkg_spatial_ref_sys VALUES (?, ?)", [(1, METRES), (2, DEGREES)])
+        for table, srs_id in [("parcels", 1), ("places", 2)]:
+            connection.execute('CREATE TABLE "{}" (fid INTEGER PRIMARY KEY, geom BLOB, A INTEGER, B TEXT)'.format(
+                table))
+            connection.execute("INSERT INTO gpkg_geometry_columns VALUES (?, 'geom', ?)", (table, srs_id))
+            connection.executemany('INSERT INTO "{}" VALUES (?, ?, ?, NULL)'.format(table), [
+                (i * 2, sqlite3.Binary(rammcore.ringsToGeoPackage([[(i, 0), (i, 2), (i + 1, 2), (i + 1, 0), (i, 0)]],
+                                                                  srs_id)), i)
+                for i in range(1, 2501)])
+        connection.commit()
+        connection.close()
+        self.backend = rammcore.GeoPackageBackend(self.path)
+
+    def tearDown(self):
+        self.backend.connection.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def testPages(self):
+        rows = list(self.backend.iterRows("parcels", ["A"], batch_size=7))
+        self.assertEqual([row[0] for row in rows], [i * 2 for i in range(1, 2501)])
+        self.assertEqual(len(list(self.backend.iterRows("parcels", ["A"], "A > 2490 OR A < 3", batch_size=3))), 12)
+
+    def testGeometry(self):
+        fid, rings, measures = next(self.backend.iterRows("parcels", [rammcore.RINGS_FIELD,
+                                                                      rammcore.MEASURES_FIELD]))
+        self.assertEqual(rings, [[(1, 0), (1, 2), (2, 2), (2, 0), (1, 0)]])
+        self.assertEqual(measures, (2.0, 6.0, 1.5, 1.0))
+        # the measures of coordinates in degrees would be wrong
+        self.assertRaises(ValueError, list, self.backend.iterRows("places", [rammcore.MEASURES_FIELD]))
+
+    def testWriteWhileReading(self):
+        updated_num = rammcore.updateTableInChunks("parcels", ["A"], ["B"], lambda chunk: {"B": [
+            "b{:g}".format(a) for a in chunk["A"]]}, 1000, self.backend)
+        self.assertEqual(updated_num, 2500)
+        self.assertEqual([row[1] for row in self.backend.iterRows("parcels", ["B"])][:3], ["b1", "b2", "b3"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+"""Duplicate resolution and key joins against the selections of the original scripts"""
+
+import os
+import sys
+import random
+import collections
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rammcore
+
+
+def identicalsSetLoop(features):
+    """
+    The selections the original Service Layer Cleanup made on the identicals
+    set of a group of features with identical geometry. Its search cursor
+    honoured the selection of a legal status, so the highest LISKEY is
+    looked for among the features of that status
+    """
+    remaining = list(features)
+
+    def duplicates(field):
+        # what FindIdentical reports with ONLY_DUPLICATES
+        counts = collections.Counter(feature[field] for feature in remaining)
+        return [feature for feature in remaining if counts[feature[field]] > 1]
+
+    selection = None
+    if len(remaining) != len(duplicates(2)):
+        remaining = [feature for feature in remaining if feature[2] != 0]
+        if len(remaining) == 1:
+            return [remaining[0][0]]
+    if len(remaining) != len(duplicates(3)):
+        for status in ("Registered", "Confirmed", "SG Approved"):
+            selection = [feature for feature in remaining if feature[3] == status]
+            if len(selection) == 1:
+                return [selection[0][0]]
+            if selection:
+                break
+    view = selection or remaining
+    highest = max(feature[1] for feature in view)
+    return [feature[0] for feature in view if feature[1] == highest]
+
+
+class ResolveIdenticalGroupTest(unittest.TestCase):
+
+    def testMatchesSelections(self):
+        rng = random.Random(11)
+        for trial in range(20000):
+            group = [(oid, rng.choice([100, 200, 300, 400]), rng.choice([None, 0, 1, 2]),
+                      rng.choice(["Registered", "Confirmed", "SG Approved", "Pending", None]))
+                     for oid in range(rng.randint(2, 5))]
+            self.assertEqual(rammcore.resolveIdenticalGroup(group), identicalsSetLoop(group))
+
+    def testHighestLiskeyOfTheStatus(self):
+        # two Registered features, the Confirmed one with a higher LISKEY is not kept
+        self.assertEqual(rammcore.resolveIdenticalGroup(
+            [(1, 10, 1, "Registered"), (2, 20, 1, "Registered"), (3, 30, 1, "Confirmed")]), [2])
+        self.assertEqual(rammcore.resolveIdenticalGroup(
+            [(1, 10, 1, "Registered"), (2, 20, 1, "Registered"), (3, 20, 1, "Confirmed"), (4, 5, 1, "Pending")]), [2])
+
+    def testSoleFeatures(self):
+        self.assertEqual(rammcore.resolveIdenticalGroup([(1, 5, 0, "Registered")]), [1])
+        self.assertEqual(rammcore.resolveIdenticalGroup([(1, 5, 0, None), (2, 3, 4, None)]), [2])
+        self.assertEqual(rammcore.resolveIdenticalGroup([(1, 5, 1, "Pending"), (2, 3, 1, "Confirmed")]), [2])
+
+    def testWithoutLiskeys(self):
+        self.assertEqual(rammcore.resolveIdenticalGroup([(1, None, 1, "x"), (2, None, 1, "x")]), [1, 2])
+
+
+class FindDuplicatesTest(unittest.TestCase):
+
+    def testStagesSeeWhatEarlierStagesLeft(self):
+        records = [(oid, {"SHAPE": shape, "LISKEY": liskey}) for oid, shape, liskey in
+                   [(5, "a", 1), (1, "a", 1), (2, "b", 1), (3, "b", 2), (4, "c", 3), (6, "c", 3), (7, "d", 4)]]
+        results = rammcore.findDuplicates(records, [("geometry and liskey", ["SHAPE", "LISKEY"], "DELETE"),
+                                                    ("liskey", ["LISKEY"], "EXTRACT"),
+                                                    ("geometry", ["SHAPE"], "REPORT")])
+        # DeleteIdentical keeps the lowest object id of each group
+        self.assertEqual(results[0]["groups"], [[1, 5], [4, 6]])
+        self.assertEqual(results[0]["removed"], set([5, 6]))
+        self.assertEqual(results[1]["groups"], [[1, 2]])
+        self.assertEqual(results[1]["removed"], set([1, 2]))
+        self.assertEqual(results[2]["groups"], [])
+        self.assertEqual(results[2]["count"], 0)
+
+    def testUnsupportedAction(self):
+        self.assertRaises(ValueError, rammcore.findDuplicates, [], [("a", ["SHAPE"], "MOVE")])
+
+
+class KeysTest(unittest.TestCase):
+
+    def testBuildLookupKeepsTheFirstRow(self):
+        lookup, duplicates_num, null_num = rammcore.buildLookup(
+            [(" 12 ", "a"), (12.0, "b"), ("12", "c"), (None, "d"), ("", "e"), (12.5, "f"), ("X1", "g")])
+        self.assertEqual(lookup, {12: "a", 12.5: "f", "X1": "g"})
+        self.assertEqual((duplicates_num, null_num), (2, 2))
+
+    def testJoinKey(self):
+        self.assertEqual(rammcore.joinKey(7.0), rammcore.joinKey(" 7"))
+        self.assertEqual(rammcore.joinKey(7), 7)
+        self.assertEqual(rammcore.joinKey("  "), None)
+
+    def testNewKeysMatchesTheJoin(self):
+        # the original joined the existing SL_LAND_PR onto the update and
+        # selected the features where it came back null
+        rng = random.Random(2)
+        existing = [rng.randint(1, 5000) for i in range(3000)]
+        update = [rng.randint(1, 6000) for i in range(4000)]
+        expected = sorted(set(key for key in update if key not in set(existing)))
+        self.assertEqual(rammcore.newKeys(rammcore.keyArray(existing), rammcore.keyArray(update)).tolist(), expected)
+        # keys read as floats and text still match
+        self.assertEqual(rammcore.newKeys(rammcore.keyArray([float(key) for key in existing]),
+                                          rammcore.keyArray(update)).tolist(), expected)
+        self.assertEqual(rammcore.newKeys(rammcore.keyArray(["A1", "A2"]), rammcore.keyArray(["A2", "A3"])).tolist(),
+                         ["A3"])
+
+
+if __name__ == "__main__":
+    unittest.main()
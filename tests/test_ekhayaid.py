@@ -0,0 +1,81 @@
+"""The vectorised EkhayaID encoder against the row by row functions"""
+
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy
+import rammcore
+
+
+def encodeRows(cent_x, cent_y, recno, new_format):
+    # the row function of every row, None where it raises
+    encode = rammcore.populateNewEkhayaID if new_format else rammcore.populateEkhayaID
+    ekhaya_ids = []
+    for x, y, r in zip(cent_x, cent_y, recno):
+        try:
+            ekhaya_ids.append(encode(x, y, r))
+        except Exception:
+            ekhaya_ids.append(None)
+    return ekhaya_ids
+
+
+class EncodeEkhayaIDsTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(3)
+        self.cent_x = []
+        self.cent_y = []
+        self.recno = []
+        for i in range(5000):
+            # degrees, metres, zero and negative coordinates all go through
+            self.cent_x.append(rng.choice([rng.uniform(16, 33), rng.uniform(-40, 40), rng.uniform(3000, 4000),
+                                           0.0, 18.5]))
+            self.cent_y.append(rng.choice([rng.uniform(-35, -22), rng.uniform(0, 40), rng.uniform(3000, 5000)]))
+            self.recno.append(rng.choice(["abcd1234500000000012", "CPT12345678900000000001", "ab",
+                                          "xyz9" + "0" * 16, "abcdefghi1234567890a", "abcdefghi 1234567890",
+                                          u"\xe9bcdefghi12345678901", "abcdefghij12345678901"]))
+
+    def assertMatchesRows(self, cent_x, cent_y, recno, new_format):
+        expected = encodeRows(cent_x, cent_y, recno, new_format)
+        valid = [i for i, ekhaya_id in enumerate(expected) if ekhaya_id is not None]
+        self.assertTrue(valid)
+        self.assertEqual(rammcore.encodeEkhayaIDs([cent_x[i] for i in valid], [cent_y[i] for i in valid],
+                                                  [recno[i] for i in valid], new_format),
+                         [expected[i] for i in valid])
+
+    def testOldFormat(self):
+        self.assertMatchesRows(self.cent_x, self.cent_y, self.recno, False)
+
+    def testNewFormat(self):
+        self.assertMatchesRows(self.cent_x, self.cent_y, self.recno, True)
+
+    def testNumpyColumns(self):
+        # the columns of a chunk are float arrays and object arrays
+        cent_x = numpy.array(self.cent_x, dtype=numpy.float64)
+        cent_y = numpy.array(self.cent_y, dtype=numpy.float64)
+        recno = numpy.array(self.recno, dtype=object)
+        self.assertMatchesRows(cent_x, cent_y, recno, False)
+        self.assertMatchesRows(cent_x, cent_y, recno, True)
+
+    def testEmpty(self):
+        self.assertEqual(rammcore.encodeEkhayaIDs([], [], []), [])
+
+    def testPopulateEkhayaIDs(self):
+        backend = rammcore.MemoryBackend()
+        backend.addTable("addresses", [("CENT_X", "Double"), ("CENT_Y", "Double"), ("RECNO", "String"),
+                                       ("EKHAYAID", "String")],
+                         [{"CENT_X": 18.5 + i * 0.001, "CENT_Y": 33.9, "RECNO": "abcd{:016d}".format(i)}
+                          for i in range(25)])
+        self.assertEqual(rammcore.populateEkhayaIDs("addresses", chunk_size=7, backend=backend), 25)
+        # nothing changes the second time
+        self.assertEqual(rammcore.populateEkhayaIDs("addresses", chunk_size=7, backend=backend), 0)
+        for row in backend.tables["addresses"]["rows"].values():
+            self.assertEqual(row["EKHAYAID"], rammcore.populateEkhayaID(row["CENT_X"], row["CENT_Y"], row["RECNO"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+"""Compiled field map plans against what Append and arcpy.FieldMap did"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rammcore
+
+INPUT_SCHEMA = [["A", "String", 10], ["B", "String", 10], ["C", "Integer", 4], ["n", "String", 5]]
+OUTPUT_SCHEMA = [["X", "String", 3], ["Y", "String", 50], ["Z", "Double", 8], ["N", "Integer", 4]]
+
+
+class FieldMapPlanTest(unittest.TestCase):
+
+    def testTransform(self):
+        plan = rammcore.compileFieldMapPlan([("a", "X"), ("b", "X"), ("c", "Y"), ("n", "N"), ("q", "NOPE")],
+                                            INPUT_SCHEMA, OUTPUT_SCHEMA)
+        # fields are spelt as in the schemas and a destination the output lacks is left out
+        self.assertEqual(plan["unused"], ["NOPE"])
+        self.assertEqual(plan["missing"], [])
+        source_fields, destination_fields, transform = rammcore.fieldMapTransform(plan)
+        self.assertEqual(source_fields, ["n", "A", "B", "C"])
+        self.assertEqual(destination_fields, ["N", "X", "Y"])
+        # the first source with a value, converted to the output type and width
+        self.assertEqual(transform(["42", None, "hello", 12]), [42, "hel", "12"])
+        self.assertEqual(transform(["x", "abcdef", None, None]), [None, "abc", None])
+
+    def testMissingSourceField(self):
+        plan = rammcore.compileFieldMapPlan([("a", "X"), ("zz", "Z"), ("yy", "Z")], INPUT_SCHEMA, OUTPUT_SCHEMA)
+        self.assertEqual(plan["missing"], ["zz", "yy"])
+        self.assertRaises(ValueError, rammcore.checkFieldMapPlan, plan, "parcels")
+        rammcore.checkFieldMapPlan(rammcore.compileFieldMapPlan([("a", "X")], INPUT_SCHEMA, OUTPUT_SCHEMA),
+                                   "parcels")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+"""ramm and rammcore load without importing arcpy or numpy"""
+
+import os
+import sys
+import subprocess
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import rammcore
+
+
+def importedModules(module):
+    # a fresh interpreter, so the modules the other tests imported don't count
+    output = subprocess.check_output([sys.executable, "-c", "import sys, {}; print(' '.join(sorted(m for m in ("
+                                      "'arcpy', 'numpy') if m in sys.modules)))".format(module)], cwd=ROOT)
+    return output.decode("ascii").split()
+
+
+class LazyImportTest(unittest.TestCase):
+
+    def testRammcore(self):
+        self.assertEqual(importedModules("rammcore"), [])
+
+    def testRamm(self):
+        self.assertEqual(importedModules("ramm"), [])
+
+    def testLoadedOnFirstUse(self):
+        module = rammcore.LazyModule("json")
+        self.assertEqual(module.dumps([1]), "[1]")
+        self.assertRaises(ImportError, getattr, rammcore.LazyModule("not_a_module"), "x")
+
+
+if __name__ == "__main__":
+    unittest.main()
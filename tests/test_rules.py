@@ -0,0 +1,173 @@
+"""The disposition rule tables against the selections of the original Service Layer Cleanup"""
+
+import os
+import sys
+import math
+import random
+import sqlite3
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy
+import ramm
+import rammcore
+
+ZONINGS = [None, "", "Transport", "Transport Zone 2", "transport", "Mixed Transport Use", "Community Zone 1 Transport",
+           "Zone Transport Residential", "Transport Business", "A Transport B", "Business Transport",
+           "Single Residential", "General Business"]
+VESTED_DESCRIPTIONS = [None, "", "Roadway", "Unset", "Private", "Railway", "Substation", "Waterway", "Municipal"]
+
+# the where clauses of the original script, in the order it applied them.
+# ROADS stands for the selection by location on the roads
+CLEANUP_SELECTIONS = [
+    ("delete", "\"ROADS\" = 1 AND \"Total_BillCount\" IS NULL"),
+    ("delete", "\"AREA\" < 15 AND \"Total_BillCount\" IS NULL"),
+    ("delete", "\"VSTD_DESC\" = \'Substation\' OR \"VSTD_DESC\" = \'Waterway\' OR \"VSTD_DESC\" = \'Railway\' OR "
+               "\"VSTD_DESC\" = \'Unset\' OR (\"VSTD_DESC\" = \'Roadway\' AND \"ZONING\" LIKE \'%Transport%\') OR "
+               "(\"VSTD_DESC\" = \'Roadway\' AND \"ZONING\" = \'\')"),
+    ("delete", "\"ZONING\" LIKE \'% Transport %\'")]
+ZONING_CASE_B = " OR ".join(
+    "(\"ZONING\" LIKE \'%Transport%\' AND \"ZONING\" LIKE \'%{}%\' AND \"Total_BillCount\" IS NULL)".format(zoning)
+    for zoning in ["Community", "Mixed", "Residential", "Business"])
+ZONING_SELECTIONS = [
+    # Zoning_Case_A is copied out and its features that are not billed deleted
+    ("Zoning_Case_A", "\"ZONING\" LIKE \'Transport%\' AND \"Total_BillCount\" IS NOT NULL"),
+    ("delete", "\"ZONING\" LIKE \'Transport%\'"),
+    ("Zoning_Case_B", ZONING_CASE_B)]
+SERVICE_LAYER_SELECTIONS = [
+    ("Road_Reserves", "\"ROADS\" = 1"),
+    ("Sliver_Polygons", "\"AREA\" < 15")] + ZONING_SELECTIONS + [
+    ("delete", "\"ZONING\" LIKE \'%Transport%\'")]
+
+
+def randomFeatures(rng, n):
+    return [{"ZONING": rng.choice(ZONINGS), "VSTD_DESC": rng.choice(VESTED_DESCRIPTIONS),
+             "Total_BillCount": rng.choice([None, 0, 1, 2]), "AREA": rng.choice([None, 1.0, 14.9, 15.0, 200.0]),
+             "ROADS": rng.random() < 0.2} for i in range(n)]
+
+
+def ruleColumns(features):
+    # numeric columns with NaN for nulls and the others as objects, see chunkToArray
+    columns = {}
+    for field in ["ZONING", "VSTD_DESC"]:
+        columns[field] = numpy.empty(len(features), dtype=object)
+        columns[field][:] = [feature[field] for feature in features]
+    for field in ["Total_BillCount", "AREA"]:
+        columns[field] = numpy.array([numpy.nan if feature[field] is None else feature[field]
+                                      for feature in features], dtype=numpy.float64)
+    columns["ROADS"] = numpy.array([feature["ROADS"] for feature in features], dtype=bool)
+    return columns
+
+
+def selectionChain(features, selections):
+    # every selection is made on the features the earlier ones left, which
+    # take the disposition of the selection
+    connection = sqlite3.connect(":memory:")
+    # LIKE is case sensitive in a file geodatabase
+    connection.execute("PRAGMA case_sensitive_like = ON")
+    connection.execute("CREATE TABLE features (oid INTEGER PRIMARY KEY, ZONING TEXT, VSTD_DESC TEXT, "
+                       "Total_BillCount INTEGER, AREA REAL, ROADS INTEGER)")
+    connection.executemany("INSERT INTO features VALUES (?, ?, ?, ?, ?, ?)",
+                           [(i, f["ZONING"], f["VSTD_DESC"], f["Total_BillCount"], f["AREA"], int(f["ROADS"]))
+                            for i, f in enumerate(features)])
+    dispositions = ["keep"] * len(features)
+    for disposition, where_clause in selections:
+        selected = [row[0] for row in connection.execute("SELECT oid FROM features WHERE " + where_clause)]
+        for oid in selected:
+            dispositions[oid] = disposition
+        connection.executemany("DELETE FROM features WHERE oid = ?", [(oid,) for oid in selected])
+    connection.close()
+    return dispositions
+
+
+def rowMeets(feature, condition):
+    # a condition read a row at a time
+    field, operator, value = condition
+    x = feature.get(field)
+    null = x is None or (isinstance(x, float) and math.isnan(x))
+    if operator == "IS NULL":
+        return null
+    if operator == "IS NOT NULL":
+        return not null
+    if null:
+        return False
+    if operator == "LIKE":
+        text = value.strip("%")
+        if value.startswith("%") and value.endswith("%"):
+            return text in x
+        if value.endswith("%"):
+            return x.startswith(text)
+        if value.startswith("%"):
+            return x.endswith(text)
+        return x == text
+    if operator == "IN":
+        return x in value
+    return {"=": x == value, "<>": x != value, "<": x < value, "<=": x <= value, ">": x > value,
+            ">=": x >= value}[operator]
+
+
+class RuleTablesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.features = randomFeatures(random.Random(5), 4000)
+
+    def assertMatchesSelections(self, rules, selections):
+        matched = rammcore.evaluateRules(ruleColumns(self.features), rules)
+        self.assertEqual(rammcore.ruleDispositions(matched, rules).tolist(),
+                         selectionChain(self.features, selections))
+
+    def testCleanupRules(self):
+        self.assertMatchesSelections(ramm.CLEANUP_RULES, CLEANUP_SELECTIONS)
+
+    def testServiceLayerRules(self):
+        # the duplicates are looked for between the two, which doesn't move
+        # any feature from one disposition to another
+        self.assertMatchesSelections(ramm.CLEANUP_RULES + ramm.SERVICE_LAYER_RULES,
+                                     CLEANUP_SELECTIONS + SERVICE_LAYER_SELECTIONS)
+
+    def testZoningRules(self):
+        # applied on their own to the features copied out as duplicates
+        self.assertMatchesSelections(ramm.ZONING_RULES, ZONING_SELECTIONS)
+
+
+class EvaluateRulesTest(unittest.TestCase):
+
+    def testMatchesRowAtATime(self):
+        features = randomFeatures(random.Random(8), 3000)
+        rng = random.Random(2)
+        for feature in features:
+            feature["N"] = rng.choice([None, 1, 3, 5])
+        columns = ruleColumns(features)
+        columns["N"] = numpy.array([numpy.nan if f["N"] is None else f["N"] for f in features], dtype=numpy.float64)
+        rules = ramm.CLEANUP_RULES + ramm.SERVICE_LAYER_RULES + [
+            ("odd", "keep", [("N", "<>", 3), ("N", ">=", 1)]),
+            ("listed", "delete", [("N", "IN", [1, 5]), ("ZONING", "LIKE", "%Residential")]),
+            ("small", "delete", [("AREA", "<=", 15), ("N", ">", 1)])]
+        matched = rammcore.evaluateRules(columns, rules)
+        self.assertEqual(matched.tolist(),
+                         [next((i for i, (name, disposition, conditions) in enumerate(rules)
+                                if all(rowMeets(f, condition) for condition in conditions)), -1) for f in features])
+        counts = rammcore.ruleCounts(matched, rules)
+        self.assertEqual(sum(counts.values()), int((matched >= 0).sum()))
+
+    def testMasksMergeInParts(self):
+        features = randomFeatures(random.Random(3), 500)
+        columns = ruleColumns(features)
+        rules = ramm.CLEANUP_RULES + ramm.SERVICE_LAYER_RULES
+        masks = rammcore.ruleMasks(columns, rules)
+        self.assertEqual(rammcore.mergeRuleMasks(masks, len(features)).tolist(),
+                         rammcore.evaluateRules(columns, rules).tolist())
+
+    def testEmpty(self):
+        self.assertEqual(rammcore.evaluateRules({"A": numpy.array([], dtype=numpy.float64)},
+                                                [("a", "delete", [("A", "<", 1)])]).tolist(), [])
+
+    def testUnsupported(self):
+        columns = {"A": numpy.array([u"a"], dtype=object)}
+        self.assertRaises(ValueError, rammcore.evaluateRules, columns, [("a", "delete", [("A", "LIKE", "a%b")])])
+        self.assertRaises(ValueError, rammcore.evaluateRules, columns, [("a", "delete", [("A", "~", "a")])])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+"""The ID sequence allocator and the blocks it hands out"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rammcore
+
+
+class SequenceAllocatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.allocator = rammcore.SequenceAllocator(os.path.join(self.folder, "sequences.sqlite"))
+
+    def tearDown(self):
+        self.allocator.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def testBlocksDoNotOverlap(self):
+        self.assertEqual(self.allocator.allocate("CP", 10, 1000), (1000, 1009))
+        # the sequence is past the start asked for
+        self.assertEqual(self.allocator.allocate("CP", 5, 1), (1010, 1014))
+        self.assertEqual(self.allocator.allocate("PRC", 5, 1), (1, 5))
+        self.assertEqual(self.allocator.highWater("CP"), 1014)
+
+    def testRerunGetsItsBlockBack(self):
+        self.assertEqual(self.allocator.allocate("CP", 10, 1000, "parcels"), (1000, 1009))
+        self.allocator.allocate("CP", 10, 1, "other")
+        self.assertEqual(self.allocator.allocate("CP", 10, 1000, "parcels"), (1000, 1009))
+        self.assertEqual(self.allocator.allocate("CP", 10, 900, "parcels"), (1000, 1009))
+        # a different count is a new block
+        self.assertEqual(self.allocator.allocate("CP", 11, 1000, "parcels"), (1020, 1030))
+
+    def testRerunWithAHigherStart(self):
+        self.assertEqual(self.allocator.allocate("CP", 10, 1000, "parcels"), (1000, 1009))
+        self.assertEqual(self.allocator.allocate("CP", 10, 5000, "parcels"), (5000, 5009))
+        self.assertEqual(self.allocator.allocate("CP", 10, 5000, "parcels"), (5000, 5009))
+
+    def testReset(self):
+        self.allocator.allocate("CP", 10, 1000, "parcels")
+        self.allocator.reset("CP")
+        self.assertEqual(self.allocator.highWater("CP"), None)
+        self.assertEqual(self.allocator.allocate("CP", 10, 1, "parcels"), (1, 10))
+
+
+if __name__ == "__main__":
+    unittest.main()
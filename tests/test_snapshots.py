@@ -0,0 +1,201 @@
+"""Delivery fingerprints, dataset stamps and the snapshot store against comparing whole deliveries"""
+
+import os
+import sys
+import random
+import shutil
+import struct
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ramm
+import rammcore
+
+
+def square(x, y, size=1.0, start=0, clockwise=True):
+    ring = [(x, y), (x, y + size), (x + size, y + size), (x + size, y)]
+    if not clockwise:
+        ring.reverse()
+    ring = ring[start:] + ring[:start]
+    return [ring + [ring[0]]]
+
+
+def writeCatalog(gdb, names):
+    # a system catalog a00000001 with a row for each name, whose object id
+    # is the number of the table's files
+    rows = bytearray(40)
+    offsets = bytearray(struct.pack("<iiii", 3, 1, len(names), 5))
+    for name in names:
+        encoded = name.encode("utf-8")
+        row = bytearray([len(encoded)]) + bytearray(encoded) + bytearray(struct.pack("<i", 0))
+        offsets += bytearray(struct.pack("<q", len(rows))[:5])
+        rows += bytearray(struct.pack("<i", len(row))) + row
+    offsets += bytearray(5 * (1024 - len(names)))
+    for extension, data in [("gdbtable", rows), ("gdbtablx", offsets)]:
+        with open(os.path.join(gdb, "a00000001." + extension), "wb") as f:
+            f.write(bytes(data))
+
+
+def nextDelivery(rng, delivery, next_key):
+    # a copy of a delivery with some parcels removed, added, modified and
+    # some only redrawn, and the keys that changed
+    current = dict(delivery)
+    keys = sorted(current)
+    removed = set(rng.sample(keys, len(keys) // 10))
+    modified = set()
+    for key in removed:
+        del current[key]
+    for key in rng.sample(sorted(current), len(current) // 5):
+        rings, values = current[key]
+        change = rng.choice(["values", "geometry", "redrawn"])
+        if change == "values":
+            current[key] = (rings, [values[0], values[1] + 1])
+            modified.add(key)
+        elif change == "geometry":
+            x, y = rings[0][0]
+            current[key] = (square(x + 0.5, y), values)
+            modified.add(key)
+        else:
+            # the same shape from another vertex, finer than the precision
+            x, y = min(rings[0])
+            current[key] = (square(x + 0.00001, y, start=rng.randint(1, 3)), values)
+    added = set(range(next_key, next_key + len(keys) // 10))
+    for key in added:
+        current[key] = (square(key * 2.0, 0.0), ["new", key])
+    return current, added, removed, modified
+
+
+class FingerprintTest(unittest.TestCase):
+
+    def testSameShape(self):
+        fingerprint = rammcore.featureFingerprint(square(10, 20), ["a", 1])
+        self.assertEqual(rammcore.featureFingerprint(square(10, 20, start=2), ["a", 1]), fingerprint)
+        self.assertEqual(rammcore.featureFingerprint(square(10.0002, 20), ["a", 1.0]), fingerprint)
+        # an extra vertex along an edge
+        ring = square(10, 20)[0]
+        self.assertEqual(rammcore.featureFingerprint([ring[:1] + [(10, 20.5)] + ring[1:]], ["a", 1]), fingerprint)
+
+    def testDifferentFeature(self):
+        fingerprint = rammcore.featureFingerprint(square(10, 20), ["a", 1])
+        self.assertNotEqual(rammcore.featureFingerprint(square(10, 20), ["a", 2]), fingerprint)
+        self.assertNotEqual(rammcore.featureFingerprint(square(10, 20), ["a", None]), fingerprint)
+        self.assertNotEqual(rammcore.featureFingerprint(square(10.01, 20), ["a", 1]), fingerprint)
+
+    def testDiffFingerprints(self):
+        added, removed, modified = rammcore.diffFingerprints({1: "a", 2: "b", 3: "c"}, {2: "b", 3: "x", 4: "d"})
+        self.assertEqual((added, removed, modified), ([4], [1], [3]))
+
+
+class SnapshotStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.store = rammcore.SnapshotStore(os.path.join(self.folder, "store", "snapshots.sqlite"))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def ingest(self, name, delivery):
+        features = [(key, rings, values) for key, (rings, values) in sorted(delivery.items())]
+        return self.store.ingest(name, features, ["NAME", "N"])
+
+    def testDeliveries(self):
+        rng = random.Random(6)
+        delivery = dict((key, (square(key * 2.0, 0.0), ["parcel", key])) for key in range(1, 301))
+        deliveries = [delivery]
+        self.assertEqual([sorted(keys) for keys in self.ingest("delivery 0", delivery)],
+                         [sorted(delivery), [], []])
+        changes = []
+        for i in range(1, 5):
+            delivery, added, removed, modified = nextDelivery(rng, delivery, 1000 * i)
+            deliveries.append(delivery)
+            changes.append((added, removed, modified))
+            self.assertEqual([set(keys) for keys in self.ingest("delivery {}".format(i), delivery)],
+                             [added, removed, modified])
+
+        # every snapshot reads back as it was delivered
+        for i, delivery in enumerate(deliveries):
+            read = dict((key, (rings, values)) for key, rings, values in
+                        self.store.materialize("delivery {}".format(i)))
+            self.assertEqual(sorted(read), sorted(delivery))
+            for key, (rings, values) in delivery.items():
+                self.assertEqual(rammcore.featureFingerprint(read[key][0], read[key][1]),
+                                 rammcore.featureFingerprint(rings, values))
+
+        # the changes between any two snapshots are those of comparing them whole
+        for first in range(len(deliveries)):
+            for second in range(len(deliveries)):
+                before, after = deliveries[first], deliveries[second]
+                fingerprints = [dict((key, rammcore.featureFingerprint(rings, values))
+                                     for key, (rings, values) in delivery.items()) for delivery in (before, after)]
+                expected = rammcore.diffFingerprints(*fingerprints)
+                found = self.store.diff("delivery {}".format(first), "delivery {}".format(second))
+                self.assertEqual([sorted(keys) for keys in found], [sorted(keys) for keys in expected])
+
+        keys = sorted(changes[-1][0])[:3]
+        self.assertEqual(sorted(key for key, rings, values in self.store.materialize("delivery 4", keys)), keys)
+        self.assertEqual([snapshot["count"] for snapshot in self.store.snapshots()],
+                         [len(delivery) for delivery in deliveries])
+
+    def testSharedKeys(self):
+        # parcels sharing a key are one parcel, whatever order they come in
+        self.store.ingest("a", [(1, square(0, 0), ["x", 1]), (1, square(5, 0), ["y", 1])], ["NAME", "N"])
+        self.assertEqual(self.store.ingest("b", [(1, square(5, 0), ["y", 1]), (1, square(0, 0), ["x", 1])],
+                                           ["NAME", "N"]), ([], [], []))
+        self.assertEqual(len(list(self.store.materialize("b"))), 2)
+
+    def testRepeatedName(self):
+        self.store.ingest("a", [], ["NAME"])
+        self.assertRaises(ValueError, self.store.ingest, "a", [], ["NAME"])
+        self.assertRaises(ValueError, self.store.diff, "a", "b")
+
+
+class DatasetStampTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.gdb = os.path.join(self.folder, "cadastre.gdb")
+        os.makedirs(self.gdb)
+        for name in ["a00000002.gdbtable", "a00000002.gdbtablx", "a00000003.gdbtable", "a00000003.gdbtablx",
+                     "a00000003.FDO_OBJECTID.atx", "a00000004.gdbtable", "gdb"]:
+            self.touch(name, 1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def touch(self, name, mtime):
+        path = os.path.join(self.gdb, name)
+        open(path, "a").close()
+        os.utime(path, (mtime, mtime))
+
+    def assertStampsWith(self, dataset, changes):
+        stamp = ramm._datasetStamp(dataset)
+        lock = os.path.join(self.gdb, "_gdb.HOST.123.456.sr.lock")
+        self.touch(os.path.basename(lock), 5000)
+        self.assertEqual(ramm._datasetStamp(dataset), stamp)
+        os.remove(lock)
+        os.utime(self.gdb, (6000, 6000))
+        self.assertEqual(ramm._datasetStamp(dataset), stamp)
+        for name, changed in changes:
+            self.touch(name, 7000)
+            self.assertEqual(ramm._datasetStamp(dataset) != stamp, changed)
+
+    def testOwnTableFiles(self):
+        writeCatalog(self.gdb, ["GDB_SystemCatalog", "GDB_DBTune", "Parcels", "Roads"])
+        self.touch("a00000001.gdbtable", 1000)
+        self.touch("a00000003.sr.lock", 9000)
+        dataset = os.path.join(self.gdb, "Cadastre", "parcels")
+        self.assertEqual(ramm._datasetStamp(dataset), 1000)
+        self.assertStampsWith(dataset, [("a00000004.gdbtable", False), ("a00000002.gdbtablx", False),
+                                        ("a00000003.FDO_OBJECTID.atx", True)])
+
+    def testWithoutCatalog(self):
+        # every file of the geodatabase but its locks
+        self.assertStampsWith(os.path.join(self.gdb, "Parcels"), [("a00000004.gdbtable", True)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+"""The spatial indexes, spatial join and change classification against brute force"""
+
+import os
+import sys
+import random
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy
+import rammcore
+
+
+def rectangle(x0, y0, x1, y1):
+    return [[(x0, y0), (x0, y1), (x1, y1), (x1, y0), (x0, y0)]]
+
+
+def randomRectangles(rng, n, size=1000, largest=40):
+    # on a whole number grid so that many of them share edges and corners
+    extents = []
+    for i in range(n):
+        x, y = rng.randint(0, size), rng.randint(0, size)
+        extents.append((x, y, x + rng.randint(1, largest), y + rng.randint(1, largest)))
+    return extents
+
+
+def overlaps(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def within(a, b):
+    return b[0] <= a[0] and b[1] <= a[1] and a[2] <= b[2] and a[3] <= b[3]
+
+
+def centreIn(a, b):
+    x, y = (a[0] + a[2]) / 2.0, (a[1] + a[3]) / 2.0
+    return b[0] <= x <= b[2] and b[1] <= y <= b[3]
+
+
+class SpatialIndexTest(unittest.TestCase):
+
+    def testQueriesMatchBruteForce(self):
+        rng = random.Random(5)
+        for n in (0, 1, 2, 15, 16, 17, 300, 3000):
+            extents = randomRectangles(rng, n, largest=20)
+            values = [i * 3 + 1 for i in range(n)]
+            packed = rammcore.PackedRTree.build(extents, values)
+            tree = rammcore.STRtree(list(zip(extents, values)))
+            queries = randomRectangles(rng, 50, largest=60)
+            for query in queries:
+                expected = sorted(value for extent, value in zip(extents, values) if overlaps(extent, query))
+                self.assertEqual(sorted(packed.query(query)), expected)
+                self.assertEqual(sorted(tree.query(query)), expected)
+            positions, found = packed.queryMany(queries)
+            self.assertEqual(sorted(zip(positions.tolist(), found.tolist())),
+                             sorted((i, value) for i, query in enumerate(queries) for value in packed.query(query)))
+
+    def testHilbertValues(self):
+        # the order 1 curve visits (0, 0), (0, 1), (1, 1) and (1, 0)
+        self.assertEqual(rammcore.hilbertValues([0, 0, 1, 1], [0, 1, 1, 0], order=1).tolist(), [0, 1, 2, 3])
+        cells = numpy.arange(256)
+        values = rammcore.hilbertValues(cells // 16, cells % 16, order=4)
+        self.assertEqual(sorted(values.tolist()), list(range(256)))
+
+    def testSavedIndex(self):
+        folder = tempfile.mkdtemp()
+        try:
+            extents = randomRectangles(random.Random(1), 500)
+            tree = rammcore.PackedRTree.build(extents, range(500))
+            path = os.path.join(folder, "index.npy")
+            rammcore.saveSpatialIndex(path, tree, source="a", count=500, stamp=1.5)
+            # a changed source is not read
+            self.assertIsNone(rammcore.loadSpatialIndex(path, source="a", count=500, stamp=2))
+            loaded = rammcore.loadSpatialIndex(path, source="a", count=500, stamp=1.5)
+            self.assertEqual(sorted(loaded.query((0, 0, 500, 500))), sorted(tree.query((0, 0, 500, 500))))
+            del loaded
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+
+class SpatialJoinTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(9)
+        self.inputs = randomRectangles(rng, 400, size=300, largest=15)
+        self.joins = randomRectangles(rng, 60, size=300, largest=80)
+        self.backend = rammcore.MemoryBackend()
+        self.backend.addTable("parcels", [("NAME", "String"), ("CODE", "String")],
+                              [{"SHAPE": rectangle(*extent)} for extent in self.inputs] + [{"SHAPE": []}])
+        self.backend.addTable("zones", [("FULLNAME", "String"), ("ZONECODE", "Integer")],
+                              [{"SHAPE": rectangle(*extent), "FULLNAME": "zone {}".format(i), "ZONECODE": i}
+                               for i, extent in enumerate(self.joins)])
+
+    def selectionLoop(self, meets):
+        # the original applied every join feature in cursor order to the input
+        # features it selects, so the last one wins
+        values = [[None, None] for extent in self.inputs] + [[None, None]]
+        for i, join in enumerate(self.joins):
+            for k, extent in enumerate(self.inputs):
+                if meets(extent, join):
+                    values[k] = ["zone {}".format(i), str(i)]
+        return values
+
+    def assertMatchesSelectionLoop(self, spatialjoin_type, meets):
+        rammcore.populateFieldsUsingSpatialJoin("parcels", "zones", ["NAME", "CODE"], ["FULLNAME", "ZONECODE"],
+                                                spatialjoin_type, self.backend)
+        rows = self.backend.tables["parcels"]["rows"]
+        self.assertEqual([[rows[oid].get("NAME"), rows[oid].get("CODE")] for oid in sorted(rows)],
+                         self.selectionLoop(meets))
+
+    def testIntersect(self):
+        self.assertMatchesSelectionLoop("INTERSECT", overlaps)
+
+    def testWithin(self):
+        self.assertMatchesSelectionLoop("WITHIN", within)
+
+    def testHaveTheirCenterIn(self):
+        self.assertMatchesSelectionLoop("HAVE_THEIR_CENTER_IN", centreIn)
+
+    def testConcavePolygon(self):
+        # a square touching the inside of a U shape intersects it without being within it
+        u_shape = [[(0, 0), (0, 10), (2, 10), (2, 2), (8, 2), (8, 10), (10, 10), (10, 0), (0, 0)]]
+        joins = [rammcore.PreparedPolygon(u_shape)]
+        self.assertEqual(rammcore.resolveSpatialJoin(rectangle(3, 3, 7, 7), joins, "INTERSECT"), None)
+        self.assertEqual(rammcore.resolveSpatialJoin(rectangle(2, 3, 7, 7), joins, "INTERSECT"), 0)
+        self.assertEqual(rammcore.resolveSpatialJoin(rectangle(2, 3, 7, 7), joins, "WITHIN"), None)
+        self.assertEqual(rammcore.resolveSpatialJoin(rectangle(0, 0, 2, 10), joins, "WITHIN"), 0)
+
+    def testUnsupportedType(self):
+        self.assertRaises(ValueError, rammcore.resolveSpatialJoin, rectangle(0, 0, 1, 1), [], "CONTAINS")
+
+
+class ClassifyChangesTest(unittest.TestCase):
+
+    def testMatchesBruteForce(self):
+        rng = random.Random(4)
+        changes = randomRectangles(rng, 300, size=400, largest=6)
+        roads = randomRectangles(rng, 40, size=400, largest=30)
+        master = randomRectangles(rng, 200, size=400, largest=20)
+        flags = rammcore.classifyChanges([(i + 1, rectangle(*extent), None) for i, extent in enumerate(changes)],
+                                         [rectangle(*extent) for extent in roads],
+                                         [rectangle(*extent) for extent in master], area_threshold=3.0)
+        for i, change in enumerate(changes):
+            expected = []
+            if any(overlaps(change, road) for road in roads):
+                expected.append("ROADRESERVE")
+            if (change[2] - change[0]) * (change[3] - change[1]) < 3.0:
+                expected.append("SLIVER")
+            if any(overlaps(change, parcel) for parcel in master):
+                expected.append("OVERLAP")
+            self.assertEqual(flags[i + 1], expected)
+
+    def testRoadLines(self):
+        changes = [(1, rectangle(0, 0, 10, 10), 100.0), (2, rectangle(20, 0, 30, 10), 100.0),
+                   (3, rectangle(40, 0, 50, 10), 100.0)]
+        # crossing, touching the boundary and passing by
+        roads = [[[(5, -5), (5, 15)]], [[(20, 10), (25, 20)]], [[(35, -5), (35, 15)]]]
+        flags = rammcore.classifyChanges(changes, roads, [], road_lines=True)
+        self.assertEqual(flags, {1: ["ROADRESERVE"], 2: ["ROADRESERVE"], 3: []})
+
+
+if __name__ == "__main__":
+    unittest.main()
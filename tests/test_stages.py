@@ -0,0 +1,66 @@
+"""The stage graph of the cleanup pipelines"""
+
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rammcore
+
+
+class StageGraphTest(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = rammcore.StageGraph()
+        self.graph.add("total", lambda a, b: a + b, ["a", "b"], ["total"])
+        self.graph.add("a", lambda x: x + 1, ["x"], ["a"])
+        self.graph.add("b", lambda x: x + 2, ["x"], ["b"])
+        self.graph.add("pair", lambda total: (total, total * 2), ["total"], ["single", "double"])
+
+    def testWaves(self):
+        self.assertEqual(self.graph.waves(["x"]), [["a", "b"], ["total"], ["pair"]])
+
+    def testRun(self):
+        for threads in (1, 2):
+            values = self.graph.run({"x": 0}, threads=threads)
+            self.assertEqual((values["total"], values["single"], values["double"]), (3, 3, 6))
+
+    def testSideBySide(self):
+        # both stages of the first wave have to be running for either to finish
+        barrier = threading.Event()
+        started = []
+
+        def stage(name):
+            def run(x):
+                started.append(name)
+                if len(started) == 2:
+                    barrier.set()
+                return barrier.wait(5)
+            return run
+
+        graph = rammcore.StageGraph()
+        graph.add("a", stage("a"), ["x"], ["a"])
+        graph.add("b", stage("b"), ["x"], ["b"])
+        values = graph.run({"x": 0}, threads=2)
+        self.assertTrue(values["a"] and values["b"])
+
+    def testInvalidGraphs(self):
+        self.assertRaises(ValueError, self.graph.add, "a", None, [], [])
+        self.assertRaises(ValueError, self.graph.add, "other", None, [], ["a"])
+        cycle = rammcore.StageGraph()
+        cycle.add("p", None, ["q"], ["p"])
+        cycle.add("q", None, ["p"], ["q"])
+        self.assertRaises(ValueError, cycle.waves)
+        self.assertRaises(ValueError, self.graph.waves)
+
+    def testErrorsAreRaised(self):
+        graph = rammcore.StageGraph()
+        graph.add("fails", lambda: 1 / 0, [], ["x"])
+        graph.add("works", lambda: 1, [], ["y"])
+        self.assertRaises(ZeroDivisionError, graph.run)
+
+
+if __name__ == "__main__":
+    unittest.main()
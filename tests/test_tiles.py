@@ -0,0 +1,34 @@
+"""The tiles the work of the tile parallel mode is split into"""
+
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rammcore
+
+
+class TilesTest(unittest.TestCase):
+
+    def testEveryExtentInOneTile(self):
+        rng = random.Random(3)
+        extents = []
+        for i in range(2000):
+            x, y = rng.uniform(0, 5000), rng.uniform(0, 3000)
+            extents.append((x, y, x + rng.uniform(0, 50), y + rng.uniform(0, 50)))
+        extents[5] = None
+        tiles = rammcore.partitionByTile(extents, rammcore.tileSize(extents, 16))
+        positions = sorted(i for tile in tiles for i in tile)
+        self.assertEqual(positions, list(range(len(extents))))
+        self.assertTrue(len(tiles) > 1)
+
+    def testFingerprintsDoNotDependOnTheTiles(self):
+        features = [([[(i, 0), (i, 1), (i + 1, 1), (i + 1, 0), (i, 0)]], [i]) for i in range(50)]
+        self.assertEqual(rammcore.fingerprintFeatures(features),
+                         [rammcore.featureFingerprint(rings, values) for rings, values in features])
+
+
+if __name__ == "__main__":
+    unittest.main()